@@ -0,0 +1,40 @@
+""" Сравнение декодирования формы из 1000 полей: quopri (прежний путь) и decode_value
+
+Запуск из корня проекта: python -m benchmarks.bench_decode
+"""
+from quopri import decodestring
+from timeit import timeit
+from urllib.parse import quote_plus
+
+from fox_framework.request_framework import GetRequests
+
+
+def old_parse(data):
+    # разбор и декодирование в том виде, в каком они были до перехода на urllib
+    result = {}
+    for item in data.split('&'):
+        k, v = item.split('=')
+        result[k] = v
+    new_data = {}
+    for k, v in result.items():
+        val = bytes(v.replace('%', '=').replace("+", " "), 'UTF-8')
+        new_data[k] = decodestring(val).decode('UTF-8')
+    return new_data
+
+
+def make_form(fields, value):
+    return '&'.join(f'field{i}={quote_plus(value)}' for i in range(fields))
+
+
+def main():
+    number = 200
+    for title, value in (('ascii', 'course_name_42'), ('cyrillic', 'Курс флористики 42')):
+        form = make_form(1000, value)
+        assert old_parse(form) == GetRequests.parse_input_data(form)
+        old = timeit(lambda: old_parse(form), number=number) / number
+        new = timeit(lambda: GetRequests.parse_input_data(form), number=number) / number
+        print(f'{title:>9}: quopri {old * 1e3:7.3f} ms, decode_value {new * 1e3:7.3f} ms, x{old / new:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+""" Замер стоимости поиска маршрута в зависимости от числа маршрутов
+
+Запуск из корня проекта: python -m benchmarks.bench_router
+"""
+from timeit import timeit
+
+from fox_framework.router import Router
+
+
+def build_router(count):
+    router = Router()
+    for i in range(count):
+        router.add(f'/section-{i}/', object())
+        router.add(f'/section-{i}/<int:id>/items/', object())
+    router.add('/category/<int:id>/courses/', object())
+    router.add('/static/<path:file_path>', object())
+    return router
+
+
+def main():
+    paths = ['/category/15/courses/', '/section-7/42/items/', '/static/css/style.css']
+    print(f'{"routes":>8} ' + ' '.join(f'{p:>24}' for p in paths))
+    for count in (10, 100, 1000, 5000, 10000):
+        router = build_router(count)
+        number = 50000
+        timings = []
+        for path in paths:
+            seconds = timeit(lambda: router.resolve(path, 'GET'), number=number)
+            timings.append(f'{seconds / number * 1e9:>21.0f} ns')
+        print(f'{count * 2:>8} ' + ' '.join(timings))
+
+
+if __name__ == '__main__':
+    main()
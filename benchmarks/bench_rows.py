@@ -0,0 +1,66 @@
+""" Время и память на материализацию 100 000 строк курсов
+
+Сравниваются прежний путь (словарь на строку + __init__ с проверками 'x' in kwargs
+и списком observers), BaseMapper.all() с RowFactory и слотами и BaseMapper.values().
+
+Запуск из корня проекта: python -m benchmarks.bench_rows
+"""
+import tracemalloc
+from time import perf_counter
+
+from patterns.generative_patterns import ConnectionPool, OnlineCourseMapper
+
+ROWS = 100000
+
+
+class OldCourse:
+    """ Модель курса в прежнем виде """
+    def __init__(self, **kwargs):
+        self.observers = []
+        if 'id' in kwargs:
+            self.id = kwargs.get('id')
+        if 'name' in kwargs:
+            self.name = kwargs.get('name')
+        if 'category_id' in kwargs:
+            self.category_id = kwargs.get('category_id')
+
+
+def old_all(pool):
+    with pool.connection() as connection:
+        cursor = connection.execute('SELECT * from online_course')
+        column_names = [description_info[0] for description_info in cursor.description]
+        result = []
+        for values in cursor.fetchall():
+            result.append(OldCourse(**{column_names[i]: values[i] for i, _ in enumerate(values)}))
+        return result
+
+
+def measure(title, func):
+    # время - без tracemalloc, он сильно замедляет выделение памяти
+    time_start = perf_counter()
+    result = func()
+    elapsed = perf_counter() - time_start
+    assert len(result) == ROWS
+    del result
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{title:>12}: {elapsed * 1000:8.1f} ms, пик памяти {peak / 1024 / 1024:6.1f} MiB')
+
+
+def main():
+    pool = ConnectionPool(':memory:', size=1)
+    with pool.connection() as connection:
+        connection.execute('CREATE TABLE online_course (id INTEGER PRIMARY KEY, category_id INT, name VARCHAR(32))')
+        connection.executemany('INSERT INTO online_course (category_id, name) VALUES (?, ?)',
+                               [(i % 10, f'course {i}') for i in range(ROWS)])
+        connection.commit()
+    mapper = OnlineCourseMapper(pool)
+    measure('old', lambda: old_all(pool))
+    measure('all()', mapper.all)
+    measure('values()', mapper.values)
+
+
+if __name__ == '__main__':
+    main()
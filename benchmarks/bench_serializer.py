@@ -0,0 +1,34 @@
+""" Сериализация 100 000 курсов: jsonpickle (прежний /api/) и CourseSerializer
+
+Запуск из корня проекта: python -m benchmarks.bench_serializer
+"""
+from time import perf_counter
+
+from patterns.behavioral_patterns import BaseSerializer, orjson
+from patterns.generative_patterns import CourseSerializer, OnlineCourse, OfflineCourse
+
+COURSES = 100000
+
+
+def measure(title, func):
+    time_start = perf_counter()
+    size = func()
+    elapsed = perf_counter() - time_start
+    print(f'{title:>22}: {elapsed * 1000:8.1f} ms, {size / 1024 / 1024:6.1f} MiB')
+
+
+def main():
+    courses = [(OnlineCourse if i % 2 else OfflineCourse)(id=i, name=f'course {i}', category_id=i % 10)
+               for i in range(COURSES)]
+    for course in courses[::10]:
+        # у части курсов есть наблюдатели, как после CreateCourse
+        course.observers.append(object())
+    serializer = CourseSerializer()
+    measure('jsonpickle', lambda: len(BaseSerializer(courses).save()))
+    measure('CourseSerializer.dumps', lambda: len(serializer.dumps(courses)))
+    measure('CourseSerializer.stream', lambda: sum(map(len, serializer.stream(courses))))
+    print(f'orjson: {"установлен" if orjson is not None else "не установлен, используется json"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+""" Сборка статики: хеши в именах файлов, сжатые копии .gz и .br, манифест
+
+Запуск из корня проекта: python collectstatic.py
+"""
+import gzip
+import json
+import os
+import shutil
+from hashlib import md5
+
+from components import settings
+from components.content_types import CONTENT_TYPES_MAP
+from fox_framework.static import MANIFEST_NAME, is_compressible
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def hashed_name(name, content):
+    root, extension = os.path.splitext(name)
+    return f'{root}.{md5(content).hexdigest()[:12]}{extension}'
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def write_compressed(path, content):
+    """ Пишет .gz и .br рядом с файлом, если это уменьшает его размер """
+    compressed = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(compressed) < len(content):
+        write_file(f'{path}.gz', compressed)
+    if brotli is not None:
+        compressed = brotli.compress(content)
+        if len(compressed) < len(content):
+            write_file(f'{path}.br', compressed)
+
+
+def collect(source_dir, target_dir):
+    if os.path.isdir(target_dir):
+        shutil.rmtree(target_dir)
+    manifest = {}
+    for dir_path, _, file_names in os.walk(source_dir):
+        for file_name in sorted(file_names):
+            source = os.path.join(dir_path, file_name)
+            name = os.path.relpath(source, source_dir).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                content = f.read()
+            manifest[name] = hashed_name(name, content)
+            extension = os.path.splitext(file_name)[1].lower()
+            compressible = is_compressible(CONTENT_TYPES_MAP.get(extension, ''))
+            for target_name in (name, manifest[name]):
+                target = os.path.join(target_dir, target_name)
+                write_file(target, content)
+                if compressible:
+                    write_compressed(target, content)
+    with open(os.path.join(target_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+if __name__ == '__main__':
+    manifest = collect(settings.STATIC_FILES_DIR, settings.STATIC_ROOT)
+    print(f'Собрано файлов: {len(manifest)} -> {settings.STATIC_ROOT}')
+    if brotli is None:
+        print('Модуль brotli не установлен, файлы .br не созданы')
@@ -4,4 +4,90 @@ from pathlib import Path
 ROOT_DIR = Path(__file__).resolve().parent.parent
 STATIC_FILES_DIR = path.join(ROOT_DIR, 'staticfiles')
 STATIC_URL = '/static/'
-DATABASE = 'db_framework.sqlite'
\ No newline at end of file
+# Собранная статика (python collectstatic.py), отдаётся вместо STATIC_FILES_DIR
+STATIC_ROOT = path.join(ROOT_DIR, 'staticfiles_build')
+DATABASE = 'db_framework.sqlite'
+# Число соединений с базой в пуле на процесс
+DB_POOL_SIZE = 5
+# Сколько секунд ждать снятия блокировки базы
+DB_BUSY_TIMEOUT = 5.0
+# Сколько секунд ждать свободного соединения в пуле
+DB_POOL_TIMEOUT = 10.0
+# Курсы в одной таблице course с колонкой type (после python migrate_courses.py)
+COURSE_SINGLE_TABLE = False
+
+# Кэш шаблонов Jinja2
+TEMPLATE_CACHE_SIZE = 400
+# Папка для байткода шаблонов на диске (None - не сохранять)
+TEMPLATE_BYTECODE_CACHE_DIR = None
+# Боевой режим: шаблоны не перечитываются при изменении файлов
+PRODUCTION = False
+
+# Кэш метаданных статических файлов
+STATIC_CACHE_SIZE = 256
+# Как часто (в секундах) перепроверять файл статики через stat
+STATIC_STAT_TTL = 1.0
+# Сколько байт статики, сжатой gzip на лету, хранить в памяти процесса
+STATIC_GZIP_CACHE_BYTES = 8 * 1024 * 1024
+
+# Максимальный размер тела запроса в байтах
+MAX_BODY_SIZE = 10 * 1024 * 1024
+# Размер куска при чтении тела запроса
+BODY_CHUNK_SIZE = 64 * 1024
+# Загруженные файлы больше этого размера сохраняются во временные файлы на диске
+UPLOAD_SPOOL_SIZE = 1024 * 1024
+
+# Число страниц в кэше ответов
+RESPONSE_CACHE_SIZE = 256
+# Папка с версиями таблиц: запись в одном процессе сбрасывает кэш во всех
+# (None - кэш сбрасывается только в процессе, который записал)
+RESPONSE_CACHE_STAMP_DIR = path.join(ROOT_DIR, 'cache_stamps')
+# Класс UnitOfWork ('модуль:объект'): после commit из кэша ответов
+# удаляются страницы изменённых таблиц
+UNIT_OF_WORK = 'patterns.architectural_system_patterns:UnitOfWork'
+
+# Лог сайта
+LOG_FILE = 'site.log'
+# Писать лог фоновым потоком с открытым файлом
+LOG_BUFFERED = True
+# Строки лога в формате JSON с id запроса и временем от его начала
+LOG_JSON = True
+# Размер файла лога, после которого он ротируется (None - без ротации);
+# все рабочие процессы сервера пишут в один файл, ротирует первый заметивший
+LOG_MAX_BYTES = 10 * 1024 * 1024
+# Сколько старых файлов лога хранить
+LOG_BACKUP_COUNT = 3
+# Запись пачкой: по числу строк или раз в столько секунд
+LOG_FLUSH_SIZE = 100
+LOG_FLUSH_INTERVAL = 1.0
+
+# Сколько курсов /api/ без limit отдаёт одним телом и кэширует;
+# более длинный список отдаётся потоком без кэша
+API_CACHE_MAX_ROWS = 1000
+
+# Метрики по маршрутам и методам и адрес, по которому они отдаются
+METRICS_ENABLED = True
+METRICS_URL = '/metrics/'
+# Каталог снимков метрик рабочих процессов (None - только метрики процесса,
+# ответившего на запрос)
+METRICS_DIR = path.join(ROOT_DIR, 'metrics_data')
+# Как часто рабочий процесс сохраняет свой снимок, секунды
+METRICS_FLUSH_INTERVAL = 1.0
+
+# Сервер (fox_framework.server): адрес, число процессов (None - по числу ядер,
+# 0 - один процесс без fork), потоков в процессе
+SERVER_HOST = ''
+SERVER_PORT = 8000
+SERVER_WORKERS = None
+SERVER_THREADS = 8
+# Процесс перезапускается после стольких запросов (0 - не перезапускать)
+SERVER_MAX_REQUESTS = 10000
+# Сколько секунд держать открытым соединение keep-alive между запросами
+SERVER_KEEPALIVE_TIMEOUT = 5
+# Сколько секунд ждать завершения запросов при остановке
+SERVER_GRACEFUL_TIMEOUT = 30
+# Свой сокет у каждого процесса (SO_REUSEPORT) вместо общего
+SERVER_REUSE_PORT = False
+
+# Потоков для синхронных контроллеров в ASGI-режиме (python run.py --asgi)
+ASGI_THREADS = 16
@@ -3,6 +3,10 @@ from components.settings import DATABASE
 
 con = sqlite3.connect(DATABASE)
 cur = con.cursor()
+# после migrate_courses.py online_course и offline_course - представления,
+# DROP TABLE в create_db.sql их не удаляет
+for (name,) in cur.execute("SELECT name FROM sqlite_master WHERE type = 'view'").fetchall():
+    cur.execute(f'DROP VIEW "{name}"')
 with open('create_db.sql', 'r') as f:
     text = f.read()
 cur.executescript(text)
@@ -14,6 +14,7 @@ CREATE TABLE categories (
     name VARCHAR (32)
  );
 
+DROP TABLE IF EXISTS course;
 DROP TABLE IF EXISTS online_course;
 CREATE TABLE online_course
 (
@@ -46,5 +47,26 @@ CREATE TABLE student_offlinecourse
     course_id INT UNSIGNED NOT NULL
 );
 
+DROP TABLE IF EXISTS notification_outbox;
+CREATE TABLE notification_outbox
+(
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL UNIQUE,
+    notifier VARCHAR (32) NOT NULL,
+    text TEXT NOT NULL,
+    claimed_by VARCHAR (64),
+    claimed_at REAL
+);
+
+CREATE INDEX IF NOT EXISTS students_name ON students (name);
+CREATE INDEX IF NOT EXISTS categories_name ON categories (name);
+CREATE INDEX IF NOT EXISTS online_course_category_id ON online_course (category_id);
+CREATE INDEX IF NOT EXISTS online_course_name ON online_course (name);
+CREATE INDEX IF NOT EXISTS offline_course_category_id ON offline_course (category_id);
+CREATE INDEX IF NOT EXISTS offline_course_name ON offline_course (name);
+CREATE INDEX IF NOT EXISTS student_onlinecourse_student_id ON student_onlinecourse (student_id);
+CREATE INDEX IF NOT EXISTS student_onlinecourse_course_id ON student_onlinecourse (course_id);
+CREATE INDEX IF NOT EXISTS student_offlinecourse_student_id ON student_offlinecourse (student_id);
+CREATE INDEX IF NOT EXISTS student_offlinecourse_course_id ON student_offlinecourse (course_id);
+
 COMMIT TRANSACTION;
 PRAGMA foreign_keys = on;
@@ -0,0 +1,390 @@
+""" ASGI: адаптер Framework и простой сервер HTTP/1.1 на asyncio для локального запуска
+
+Адаптер использует те же маршруты и middleware, что и WSGI-вход.
+Контроллеры с async def __call__ выполняются в цикле событий,
+синхронные - в ограниченном пуле потоков, чтобы не блокировать цикл.
+
+Запуск встроенного сервера: python run.py --asgi
+"""
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from email.utils import formatdate
+from http import HTTPStatus
+from tempfile import SpooledTemporaryFile
+from urllib.parse import unquote
+
+from fox_framework.middleware import is_async_view
+from fox_framework.request_framework import Request
+from fox_framework.response import Response
+
+SERVER_SOFTWARE = 'fox_framework'
+NO_BODY_STATUSES = (204, 304)
+REASONS = {status.value: status.phrase for status in HTTPStatus}
+
+
+def make_environ(scope, body, content_length):
+    """ WSGI-окружение из ASGI scope: Request и StaticFiles работают с ним как обычно """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        # как в WSGI: байты пути в latin-1
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(content_length) if content_length else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'asgi.scope': scope,
+    }
+    for name, value in scope.get('headers', ()):
+        key = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if key == 'CONTENT_TYPE':
+            environ[key] = value
+        elif key != 'CONTENT_LENGTH':
+            key = f'HTTP_{key}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class AsgiApp:
+    """
+    ASGI-приложение поверх Framework: framework.as_asgi().
+    threads - размер пула для синхронных контроллеров и потоковых ответов.
+    """
+
+    def __init__(self, framework, threads=16):
+        self.framework = framework
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Unsupported ASGI scope type: {scope["type"]}')
+        framework = self.framework
+        body, content_length = await self.read_body(receive)
+        if body is None:
+            # клиент отключился или тело больше MAX_BODY_SIZE
+            if content_length:
+                status = '413 Payload Too Large'
+                await self.send_response(Response(status, status), 'GET', send)
+            return
+        environ = make_environ(scope, body, content_length)
+        method = environ['REQUEST_METHOD']
+        view, path_params, rule = framework.resolve(environ['PATH_INFO'], method)
+        loop = asyncio.get_running_loop()
+
+        if view is framework.static_files:
+            await self.send_static(environ, path_params['file_path'], send)
+            return
+
+        request = Request(environ, path_params, framework.post_parser)
+        if is_async_view(view):
+            response = await framework.get_async_endpoint(view, rule, method)(request)
+            context = copy_context()
+        else:
+            # единица работы и контекст лога, заданные middleware в потоке,
+            # должны быть видны и при чтении потокового ответа
+            context = copy_context()
+            endpoint = framework.get_endpoint(view, rule, method)
+            response = await loop.run_in_executor(self.executor, context.run, endpoint, request)
+        await self.send_response(response, method, send, context)
+
+    async def read_body(self, receive):
+        """ Тело запроса целиком (большое - во временном файле); (None, размер) при превышении или обрыве """
+        parser = self.framework.post_parser
+        body = SpooledTemporaryFile(max_size=parser.spool_max_size)
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None, 0
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > parser.max_body_size:
+                body.close()
+                return None, size
+            if chunk:
+                body.write(chunk)
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+        return body, size
+
+    async def send_response(self, response, method, send, context=None):
+        status = int(response.status.split(' ', 1)[0])
+        headers = [(name.lower().encode('latin-1'), str(value).encode('latin-1'))
+                   for name, value in response.get_headers()]
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        if method == 'HEAD' or not response.streaming:
+            body = response.iter_body(method)[0]
+            await send({'type': 'http.response.body', 'body': body})
+            return
+        await self.send_iterable(response.iter_body(method), send, context)
+
+    async def send_iterable(self, iterable, send, context=None):
+        """ Тело-итератор читается в одном потоке пула: генераторы с соединением из пула не переходят между потоками """
+        loop = asyncio.get_running_loop()
+        if hasattr(iterable, '__aiter__'):
+            async for chunk in iterable:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        else:
+            def pump():
+                try:
+                    for chunk in iterable:
+                        if chunk:
+                            asyncio.run_coroutine_threadsafe(
+                                send({'type': 'http.response.body', 'body': chunk, 'more_body': True}), loop
+                            ).result()
+                finally:
+                    close = getattr(iterable, 'close', None)
+                    if close is not None:
+                        close()
+            run = pump if context is None else lambda: context.run(pump)
+            await loop.run_in_executor(self.executor, run)
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    async def send_static(self, environ, file_path, send):
+        state = {}
+
+        def start_response(status, headers, exc_info=None):
+            state['status'], state['headers'] = status, headers
+
+        def call():
+            return self.framework.static_files(environ, start_response, file_path)
+
+        loop = asyncio.get_running_loop()
+        iterable = await loop.run_in_executor(self.executor, call)
+        headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in state['headers']]
+        await send({'type': 'http.response.start', 'status': int(state['status'].split(' ', 1)[0]),
+                    'headers': headers})
+        await self.send_iterable(iterable, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                self.framework.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+class AsgiServer:
+    """
+    Минимальный HTTP/1.1 сервер на asyncio для ASGI-приложения: keep-alive,
+    chunked для ответов без Content-Length. Тело запроса - только с Content-Length.
+    Простаивающее соединение стоит одной корутины, а не потока.
+    """
+    read_chunk = 64 * 1024
+
+    def __init__(self, app, host='127.0.0.1', port=8000, keepalive_timeout=5, limit=64 * 1024):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.keepalive_timeout = keepalive_timeout
+        self.limit = limit
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self):
+        # lifespan: приложение получает startup и работает до остановки сервера
+        started = asyncio.Event()
+        stopping = asyncio.Event()
+        messages = [{'type': 'lifespan.startup'}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await stopping.wait()
+            return {'type': 'lifespan.shutdown'}
+
+        async def send(message):
+            if message['type'] == 'lifespan.startup.complete':
+                started.set()
+
+        lifespan = asyncio.create_task(self.app({'type': 'lifespan', 'asgi': {'version': '3.0'}}, receive, send))
+        await started.wait()
+        server = await asyncio.start_server(self.handle, self.host, self.port, limit=self.limit)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            stopping.set()
+            await lifespan
+
+    async def handle(self, reader, writer):
+        server_address = writer.get_extra_info('sockname')[:2]
+        client = writer.get_extra_info('peername')
+        client = client[:2] if client else None
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.keepalive_timeout)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self.write_error(writer, '431 Request Header Fields Too Large')
+                    return
+                try:
+                    request_line, *header_lines = head[:-4].decode('latin-1').split('\r\n')
+                    method, target, version = request_line.split(' ', 2)
+                    headers = []
+                    for line in header_lines:
+                        name, _, value = line.partition(':')
+                        headers.append((name.strip().lower(), value.strip()))
+                    header_map = dict(headers)
+                    length = int(header_map.get('content-length') or 0)
+                except ValueError:
+                    await self.write_error(writer, '400 Bad Request')
+                    return
+                if 'chunked' in header_map.get('transfer-encoding', '').lower():
+                    await self.write_error(writer, '411 Length Required')
+                    return
+                connection = header_map.get('connection', '').lower()
+                keep_alive = (version == 'HTTP/1.1' and connection != 'close') or connection == 'keep-alive'
+                path, _, query = target.partition('?')
+                scope = {
+                    'type': 'http',
+                    'asgi': {'version': '3.0', 'spec_version': '2.3'},
+                    'http_version': version[5:] or '1.1',
+                    'method': method.upper(),
+                    'scheme': 'http',
+                    'path': unquote(path),
+                    'raw_path': path.encode('latin-1'),
+                    'query_string': query.encode('latin-1'),
+                    'root_path': '',
+                    'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+                    'client': client,
+                    'server': server_address,
+                }
+                exchange = Exchange(self, reader, writer, length, keep_alive, method.upper() == 'HEAD', version)
+                try:
+                    await self.app(scope, exchange.receive, exchange.send)
+                except Exception:
+                    sys.excepthook(*sys.exc_info())
+                    if not exchange.started:
+                        await self.write_error(writer, '500 Internal Server Error')
+                    return
+                finally:
+                    exchange.done.set()
+                if not exchange.finished or not exchange.keep_alive:
+                    return
+                # непрочитанное приложением тело пропускаем
+                if exchange.remaining:
+                    await reader.readexactly(exchange.remaining)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def write_error(writer, status):
+        body = status.encode('latin-1')
+        writer.write(f'HTTP/1.1 {status}\r\nContent-Type: text/plain\r\nContent-Length: {len(body)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode('latin-1') + body)
+        await writer.drain()
+
+
+class Exchange:
+    """ Один запрос-ответ в соединении: receive() и send() для приложения """
+
+    def __init__(self, server, reader, writer, length, keep_alive, head, version):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.remaining = length
+        self.keep_alive = keep_alive
+        self.head = head
+        self.version = version
+        self.started = False
+        self.finished = False
+        self.chunked = False
+        self.body_done = False
+        self.done = asyncio.Event()
+
+    async def receive(self):
+        if not self.body_done:
+            chunk = b''
+            if self.remaining:
+                chunk = await self.reader.read(min(self.remaining, self.server.read_chunk))
+                if not chunk:
+                    self.remaining = 0
+                    self.body_done = True
+                    return {'type': 'http.disconnect'}
+                self.remaining -= len(chunk)
+            self.body_done = not self.remaining
+            return {'type': 'http.request', 'body': chunk, 'more_body': not self.body_done}
+        # тело прочитано: следующее сообщение - только об окончании обмена
+        await self.done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+            self.headers = message.get('headers', [])
+            return
+        if message['type'] != 'http.response.body':
+            return
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if not self.started:
+            self.write_head(more_body, body)
+        if body and not self.head and self.status not in NO_BODY_STATUSES:
+            if self.chunked:
+                self.writer.write(b'%x\r\n%s\r\n' % (len(body), body))
+            else:
+                self.writer.write(body)
+        if not more_body:
+            if self.chunked:
+                self.writer.write(b'0\r\n\r\n')
+            self.finished = True
+        await self.writer.drain()
+
+    def write_head(self, more_body, body):
+        self.started = True
+        names = {name.lower() for name, _ in self.headers}
+        headers = list(self.headers)
+        has_body = not self.head and self.status not in NO_BODY_STATUSES and self.status >= 200
+        if has_body and b'content-length' not in names:
+            if not more_body:
+                headers.append((b'content-length', str(len(body)).encode('latin-1')))
+            elif self.version == 'HTTP/1.1':
+                self.chunked = True
+                headers.append((b'transfer-encoding', b'chunked'))
+            else:
+                self.keep_alive = False
+        if self.remaining > 64 * 1024:
+            # большое непрочитанное тело не дочитываем, а закрываем соединение
+            self.keep_alive = False
+        lines = [f'HTTP/1.1 {self.status} {REASONS.get(self.status, "")}'.rstrip().encode('latin-1')]
+        lines.extend(name + b': ' + value for name, value in headers)
+        if b'date' not in names:
+            lines.append(f'date: {formatdate(usegmt=True)}'.encode('latin-1'))
+        lines.append(f'server: {SERVER_SOFTWARE}'.encode('latin-1'))
+        if not self.keep_alive:
+            lines.append(b'connection: close')
+        self.writer.write(b'\r\n'.join(lines) + b'\r\n\r\n')
@@ -0,0 +1,189 @@
+""" Кэш готовых ответов с TTL, ограничением размера (LRU) и сбросом по таблицам """
+import os
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic, time_ns
+
+from fox_framework.middleware import Middleware
+from fox_framework.response import Response
+
+
+class CachedResponse:
+    __slots__ = ('status', 'headers', 'body', 'expires_at', 'tables', 'stamp')
+
+    def __init__(self, response, ttl, tables, stamp=None):
+        self.status = response.status
+        self.headers = response.get_headers()
+        self.body = response.body
+        self.expires_at = monotonic() + ttl
+        # таблицы, от которых зависит страница (None - от всех)
+        self.tables = tuple(sorted(tables)) if tables is not None else None
+        # версии этих таблиц до запуска контроллера (TableStamps)
+        self.stamp = stamp
+
+
+class TableStamps:
+    """
+    Версии таблиц, общие для всех процессов сервера: у каждой таблицы
+    файл в папке directory, версия - его mtime в наносекундах.
+    Файл ANY меняется при любом сбросе, по нему проверяются страницы,
+    зависящие от всех таблиц.
+    """
+    ANY = '__any__'
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, table):
+        return os.path.join(self.directory, table)
+
+    def read(self, tables):
+        stamp = []
+        for table in (self.ANY,) if tables is None else tables:
+            try:
+                stamp.append(os.stat(self.path(table)).st_mtime_ns)
+            except FileNotFoundError:
+                stamp.append(0)
+        return tuple(stamp)
+
+    def touch(self, tables):
+        now = time_ns()
+        for table in (*tables, self.ANY):
+            path = self.path(table)
+            with open(path, 'a'):
+                pass
+            os.utime(path, ns=(now, now))
+
+
+class ResponseCache:
+    """
+    Кэш страниц по ключу (метод, путь, строка запроса).
+    Время жизни задаётся для маршрута (AppRoute(url, cache_ttl=...)),
+    при записи в таблицы из cache_tables маршрута записи сбрасываются
+    через invalidate_tables(). Страницы хранятся в каждом процессе свои;
+    если задана stamp_dir, сброс в одном процессе через TableStamps
+    виден остальным: версии таблиц проверяются при чтении из кэша.
+    """
+
+    def __init__(self, max_entries=256, stamp_dir=None):
+        self.max_entries = max_entries
+        self.stamps = TableStamps(stamp_dir) if stamp_dir else None
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(environ):
+        method = environ['REQUEST_METHOD']
+        # HEAD отвечает заголовками того же GET
+        if method == 'HEAD':
+            method = 'GET'
+        return method, environ['PATH_INFO'], environ.get('QUERY_STRING', '')
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        if entry.stamp is not None and entry.stamp != self.stamps.read(entry.tables):
+            # таблицы изменил другой процесс
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return Response(entry.body, entry.status, entry.headers, content_type=None)
+
+    def stamp(self, tables=None):
+        """ Версии таблиц; берутся до запуска контроллера и передаются в set() """
+        if self.stamps is None:
+            return None
+        return self.stamps.read(tuple(sorted(tables)) if tables is not None else None)
+
+    @staticmethod
+    def is_cacheable(response):
+        return (not response.streaming and response.status.startswith('200')
+                and not response.has_header('Set-Cookie'))
+
+    def set(self, key, response, ttl, tables=None, stamp=None):
+        if ttl <= 0 or not self.is_cacheable(response):
+            return
+        entry = CachedResponse(response, ttl, tables, stamp)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_tables(self, tables):
+        """ Сбрасывает страницы, зависящие от изменённых таблиц """
+        tables = set(tables)
+        if self.stamps is not None:
+            self.stamps.touch(tables)
+        with self._lock:
+            stale = [key for key, entry in self._entries.items()
+                     if entry.tables is None or tables.intersection(entry.tables)]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class CacheMiddleware(Middleware):
+    """
+    Отдаёт GET и HEAD из кэша без запуска контроллера и следующих middleware.
+    Включается только для контроллеров с cache_ttl.
+    """
+    name = 'cache'
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def applies_to(self, view):
+        return bool(getattr(view, 'cache_ttl', None)) and super().applies_to(view)
+
+    def wrap(self, handler, view):
+        cache = self.cache
+        ttl = view.cache_ttl
+        tables = getattr(view, 'cache_tables', None)
+
+        def call(request):
+            if request.method not in ('GET', 'HEAD'):
+                return handler(request)
+            key = cache.make_key(request.environ)
+            response = cache.get(key)
+            if response is None:
+                stamp = cache.stamp(tables)
+                response = handler(request)
+                cache.set(key, response, ttl, tables, stamp)
+            return response
+        return call
+
+    def wrap_async(self, handler, view):
+        cache = self.cache
+        ttl = view.cache_ttl
+        tables = getattr(view, 'cache_tables', None)
+
+        async def call(request):
+            if request.method not in ('GET', 'HEAD'):
+                return await handler(request)
+            key = cache.make_key(request.environ)
+            response = cache.get(key)
+            if response is None:
+                stamp = cache.stamp(tables)
+                response = await handler(request)
+                cache.set(key, response, ttl, tables, stamp)
+            return response
+        return call
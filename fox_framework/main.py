@@ -1,8 +1,30 @@
+import asyncio
+from importlib import import_module
 from os import path
-from quopri import decodestring
 
 from components.content_types import CONTENT_TYPES_MAP
-from fox_framework.request_framework import GetRequests, PostRequests
+from fox_framework import templator
+from fox_framework.asgi import AsgiApp
+from fox_framework.cache import ResponseCache, CacheMiddleware
+from fox_framework.metrics import MetricsView, registry
+from fox_framework.middleware import as_middleware, build_pipeline, is_async_view
+from fox_framework.request_framework import PostRequests, Request, RequestEntityTooLarge, BadRequest
+from fox_framework.response import Response
+from fox_framework.router import Router, NotFound, MethodNotAllowed
+from fox_framework.static import StaticFiles, load_manifest
+
+# методы, которые попадают в метки метрик как есть, остальные - OTHER
+METRIC_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+# метка маршрута для адресов, не найденных в дереве маршрутов
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+def load_object(value):
+    """ Объект или строка 'модуль:объект' """
+    if not isinstance(value, str):
+        return value
+    module_name, _, attr = value.partition(':')
+    return getattr(import_module(module_name), attr)
 
 
 class PageNotFound404:
@@ -10,87 +32,194 @@ class PageNotFound404:
         return '404 WHAT', '404 PAGE Not Found'
 
 
+class MethodNotAllowed405:
+    def __call__(self, request):
+        return '405 Method Not Allowed', '405 Method Not Allowed'
+
+
 class Framework:
 
     """Класс Framework - основа фреймворка"""
 
-    def __init__(self, routes_obj, fronts_obj, settings):
+    def __init__(self, routes_obj, middlewares, settings):
         self.routes_lst = routes_obj
         self.settings = settings
-        self.fronts_lst = fronts_obj
+        self.post_parser = PostRequests(
+            max_body_size=getattr(settings, 'MAX_BODY_SIZE', 10 * 1024 * 1024),
+            chunk_size=getattr(settings, 'BODY_CHUNK_SIZE', 64 * 1024),
+            spool_max_size=getattr(settings, 'UPLOAD_SPOOL_SIZE', 1024 * 1024),
+        )
+        # с RESPONSE_CACHE_STAMP_DIR сброс кэша виден всем процессам сервера
+        self.response_cache = ResponseCache(getattr(settings, 'RESPONSE_CACHE_SIZE', 256),
+                                            getattr(settings, 'RESPONSE_CACHE_STAMP_DIR', None))
+        # запись в базу сбрасывает закэшированные страницы; UNIT_OF_WORK -
+        # класс с add_commit_listener/remove_commit_listener
+        self.unit_of_work = load_object(getattr(settings, 'UNIT_OF_WORK', None))
+        if self.unit_of_work is not None:
+            self.unit_of_work.add_commit_listener(self.response_cache.invalidate_tables)
+        # маршруты компилируются в дерево один раз при запуске
+        self.router = Router.from_routes(routes_obj)
+        # если статика собрана collectstatic.py - отдаём сжатые файлы с хешами
+        static_root = getattr(settings, 'STATIC_ROOT', None)
+        if not static_root or not load_manifest(static_root):
+            static_root = settings.STATIC_FILES_DIR
+        self.static_files = StaticFiles(
+            static_root,
+            cache_size=getattr(settings, 'STATIC_CACHE_SIZE', 256),
+            stat_ttl=None if getattr(settings, 'PRODUCTION', False) else getattr(settings, 'STATIC_STAT_TTL', 1.0),
+            gzip_cache_bytes=getattr(settings, 'STATIC_GZIP_CACHE_BYTES', 8 * 1024 * 1024),
+        )
+        self.router.add(f'{settings.STATIC_URL}<path:file_path>', self.static_files)
+        # метрики по маршрутам и методам пишутся в get_endpoint;
+        # с METRICS_DIR /metrics/ отдаёт сумму по всем процессам сервера
+        registry.configure(
+            enabled=getattr(settings, 'METRICS_ENABLED', True),
+            directory=getattr(settings, 'METRICS_DIR', None),
+            flush_interval=getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0),
+        )
+        if registry.enabled:
+            self.router.add(getattr(settings, 'METRICS_URL', '/metrics/'), MetricsView(registry))
+        # окружения шаблонов создаются один раз на процесс
+        templator.configure(
+            cache_size=getattr(settings, 'TEMPLATE_CACHE_SIZE', None),
+            bytecode_cache_dir=getattr(settings, 'TEMPLATE_BYTECODE_CACHE_DIR', None),
+            auto_reload=not getattr(settings, 'PRODUCTION', False),
+            static_manifest=load_manifest(static_root),
+        )
+        # кэш ответов идёт первым, чтобы попадание не запускало остальные middleware;
+        # функции front controller превращаются в middleware с хуком before
+        self.middlewares = [CacheMiddleware(self.response_cache)] + [as_middleware(item) for item in middlewares]
+        self.not_found_view = PageNotFound404()
+        self.method_not_allowed_view = MethodNotAllowed405()
+        # цепочка для каждого контроллера собирается один раз,
+        # обёртка с метриками - один раз на (контроллер, маршрут, метод)
+        self.pipelines = {}
+        self.async_pipelines = {}
+        self.endpoints = {}
+        self.async_endpoints = {}
+        for view in (*self.iter_views(routes_obj), self.not_found_view, self.method_not_allowed_view):
+            self.get_pipeline(view)
 
     def __call__(self, environ, start_response):
-        request = {}
-        # наполняем словарь request элементами
-        # этот словарь получат все контроллеры
-        # отработка паттерна front controller
-        for front in self.fronts_lst:
-            front(request)
-
         # получаем адрес, по которому выполнен переход
         path = environ['PATH_INFO']
 
         # Получаем метод запроса
         method = environ['REQUEST_METHOD']
-        request['method'] = method
-
-        # Получаем все данные запроса
-        if method == 'POST':
-            data = PostRequests().get_request_params(environ)
-            request['data'] = Framework.decode_value(data)
-            print(f"Post-запрос: {request['data'] }")
-        if method == 'GET':
-            # 127.0.0.1:8080?id=1&category=10
-            request_params = GetRequests().get_request_params(environ)
-            request['request_params'] = Framework.decode_value(request_params)
-            print(f"GET-запрос с параметрами: {request['request_params'] }")
-
-        # добавление закрывающего слеша
-        if not path.endswith('/'):
-            path = f'{path}/'
 
         # находим нужный контроллер
         # отработка паттерна page controller
-        if path in self.routes_lst:
-            view = self.routes_lst[path]
-            content_type = self.get_content_type(path)
-            code, body = view(request)
-            body = body.encode('utf-8')
-
-        elif path.startswith(self.settings.STATIC_URL):
-            file_path = path[len(self.settings.STATIC_URL):len(path)-1]
-            content_type = self.get_content_type(file_path)
-            code, body = self.get_static(self.settings.STATIC_FILES_DIR, file_path)
-
-        else:
-            view = PageNotFound404()
-            content_type = self.get_content_type(path)
-            code, body = view(request)
-            body = body.encode('utf-8')
-
-        # запуск контроллера с передачей объекта request
-        start_response(code, [('Content-Type', content_type)])
-        return [body]
+        view, path_params, rule = self.resolve(path, method)
+
+        # статика отдаётся сразу, без middleware и разбора параметров
+        if view is self.static_files:
+            return self.static_files(environ, start_response, path_params['file_path'])
+
+        # объект request получат все контроллеры,
+        # параметры и тело запроса разбираются при первом обращении
+        request = Request(environ, path_params, self.post_parser)
+        endpoint = self.endpoints.get((view, rule, method))
+        if endpoint is None:
+            endpoint = self.get_endpoint(view, rule, method)
+        response = endpoint(request)
+        return response(environ, start_response)
+
+    def resolve(self, path, method):
+        """ (контроллер, параметры пути, правило маршрута); правило None - маршрут не найден """
+        try:
+            return self.router.resolve(path, method)
+        except NotFound:
+            return self.not_found_view, {}, None
+        except MethodNotAllowed:
+            return self.method_not_allowed_view, {}, None
+
+    def close(self):
+        """ Отписывает приложение от commit, после этого оно не используется """
+        if self.unit_of_work is not None:
+            self.unit_of_work.remove_commit_listener(self.response_cache.invalidate_tables)
+            self.unit_of_work = None
+
+    def as_asgi(self, threads=None):
+        """ ASGI-приложение с тем же деревом маршрутов и middleware """
+        return AsgiApp(self, threads or getattr(self.settings, 'ASGI_THREADS', 16))
 
     @staticmethod
-    def get_content_type(file_path, content_types_map=CONTENT_TYPES_MAP):
-        file_name = path.basename(file_path).lower()  # styles.css
-        extension = path.splitext(file_name)[1]  # .css
-        return content_types_map.get(extension, "text/html")
+    def iter_views(routes):
+        for view in routes.values():
+            if isinstance(view, dict):
+                yield from view.values()
+            else:
+                yield view
+
+    def get_pipeline(self, view):
+        pipeline = self.pipelines.get(view)
+        if pipeline is None:
+            pipeline = build_pipeline(self.middlewares, view, self.make_handler(view))
+            self.pipelines[view] = pipeline
+        return pipeline
+
+    def get_async_pipeline(self, view):
+        """ Цепочка-корутина для async-контроллера (используется в AsgiApp) """
+        pipeline = self.async_pipelines.get(view)
+        if pipeline is None:
+            pipeline = build_pipeline(self.middlewares, view, self.make_async_handler(view), is_async=True)
+            self.async_pipelines[view] = pipeline
+        return pipeline
 
     @staticmethod
-    def get_static(static_dir, file_path):
-        path_to_file = path.join(static_dir, file_path)
-        with open(path_to_file, 'rb') as f:
-            file_content = f.read()
-        status_code = '200 OK'
-        return status_code, file_content
+    def metric_name(rule, method):
+        if method not in METRIC_METHODS:
+            method = 'OTHER'
+        return method, f'{method} {rule or UNMATCHED_ROUTE}'
+
+    def get_endpoint(self, view, rule, method):
+        """ Цепочка контроллера с записью метрик в ряд 'МЕТОД правило' """
+        method, name = self.metric_name(rule, method)
+        endpoint = self.endpoints.get((view, rule, method))
+        if endpoint is None:
+            endpoint = registry.wrap(name, self.get_pipeline(view))
+            self.endpoints[(view, rule, method)] = endpoint
+        return endpoint
+
+    def get_async_endpoint(self, view, rule, method):
+        method, name = self.metric_name(rule, method)
+        endpoint = self.async_endpoints.get((view, rule, method))
+        if endpoint is None:
+            endpoint = registry.wrap_async(name, self.get_async_pipeline(view))
+            self.async_endpoints[(view, rule, method)] = endpoint
+        return endpoint
+
+    def make_handler(self, view):
+        """ Вызов контроллера с приведением результата к Response """
+        get_content_type = self.get_content_type
+        # async-контроллер под WSGI-сервером выполняется в своём цикле событий
+        run = asyncio.run if is_async_view(view) else None
+
+        def handler(request):
+            try:
+                result = view(request) if run is None else run(view(request))
+            except RequestEntityTooLarge:
+                result = '413 Payload Too Large', '413 Payload Too Large'
+            except BadRequest:
+                result = '400 Bad Request', '400 Bad Request'
+            return Response.from_result(result, get_content_type(request.path))
+        return handler
+
+    def make_async_handler(self, view):
+        get_content_type = self.get_content_type
+
+        async def handler(request):
+            try:
+                result = await view(request)
+            except RequestEntityTooLarge:
+                result = '413 Payload Too Large', '413 Payload Too Large'
+            except BadRequest:
+                result = '400 Bad Request', '400 Bad Request'
+            return Response.from_result(result, get_content_type(request.path))
+        return handler
 
     @staticmethod
-    def decode_value(data):
-        new_data = {}
-        for k, v in data.items():
-            val = bytes(v.replace('%', '=').replace("+", " "), 'UTF-8')
-            val_decode_str = decodestring(val).decode('UTF-8')
-            new_data[k] = val_decode_str
-        return new_data
+    def get_content_type(file_path, content_types_map=CONTENT_TYPES_MAP):
+        file_name = path.basename(file_path).lower()  # styles.css
+        extension = path.splitext(file_name)[1]  # .css
+        return content_types_map.get(extension, "text/html")
@@ -0,0 +1,362 @@
+""" Метрики процесса: число запросов, ошибки, байты ответа и гистограмма времени по маршрутам """
+import atexit
+import json
+import os
+from bisect import bisect_left
+from threading import Event, Lock, Thread
+from time import perf_counter_ns
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from fox_framework.response import Response
+
+# границы корзин гистограммы в секундах
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами. Значения хранятся в наносекундах,
+    квантили оцениваются линейной интерполяцией внутри корзины,
+    как histogram_quantile в Prometheus.
+    """
+    __slots__ = ('bounds', 'bounds_ns', 'counts', 'count', 'sum_ns')
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.bounds_ns = [int(bound * 1e9) for bound in self.bounds]
+        # последняя корзина - всё, что больше последней границы (+Inf)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum_ns = 0
+
+    def observe(self, value_ns):
+        self.counts[bisect_left(self.bounds_ns, value_ns)] += 1
+        self.count += 1
+        self.sum_ns += value_ns
+
+    def quantile(self, q):
+        """ Оценка квантиля в секундах, None если наблюдений нет """
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if cumulative + count >= rank and count:
+                if index == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[index - 1] if index else 0.0
+                upper = self.bounds[index]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.bounds[-1]
+
+
+class ViewMetrics:
+    __slots__ = ('requests', 'errors', 'bytes_out', 'duration', 'lock')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.requests = 0
+        self.errors = 0
+        self.bytes_out = 0
+        self.duration = Histogram(buckets)
+        self.lock = Lock()
+
+    def dump(self):
+        with self.lock:
+            return {'requests': self.requests, 'errors': self.errors, 'bytes_out': self.bytes_out,
+                    'counts': list(self.duration.counts), 'sum_ns': self.duration.sum_ns}
+
+    def merge(self, data):
+        """ Прибавить снимок другого процесса (словарь из dump) """
+        self.requests += data['requests']
+        self.errors += data['errors']
+        self.bytes_out += data['bytes_out']
+        duration = self.duration
+        for index, count in enumerate(data['counts']):
+            duration.counts[index] += count
+        duration.count += sum(data['counts'])
+        duration.sum_ns += data['sum_ns']
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик процесса. Пишется фреймворком (wrap/wrap_async вокруг
+    цепочки каждого маршрута), отдаётся через MetricsView в текстовом
+    формате Prometheus. Имя ряда - 'МЕТОД правило', например
+    'GET /category/<int:id>/courses/'. При enabled=False запись не выполняется.
+    С directory метрики собираются со всех процессов pre-fork сервера:
+    каждый процесс раз в flush_interval секунд (и при выходе) сохраняет
+    снимок своего реестра в <directory>/<pid>.json, а процесс, который
+    ответил на /metrics/, складывает снимки. Снимки завершённых процессов
+    переносятся в retired.json, чтобы счётчики не уменьшались.
+    """
+    retired_name = 'retired.json'
+
+    def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS, directory=None, flush_interval=1.0):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.views = {}
+        self._lock = Lock()
+        self._dump_lock = Lock()
+        self._writer = None
+        self._stopped = Event()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.dump)
+
+    def _after_fork(self):
+        # записи родителя остаются в его снимке, поток записи в ребёнке не работает
+        self.views = {}
+        self._lock = Lock()
+        self._dump_lock = Lock()
+        self._writer = None
+        self._stopped = Event()
+
+    def configure(self, enabled=True, directory=None, flush_interval=1.0):
+        """
+        Вызывается при запуске приложения до fork: снимки прошлого запуска удаляются.
+        """
+        self.enabled = enabled
+        self.directory = directory
+        self.flush_interval = flush_interval
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            for file_name in os.listdir(directory):
+                if file_name.endswith(('.json', '.tmp')):
+                    os.remove(os.path.join(directory, file_name))
+
+    def get(self, name):
+        metrics = self.views.get(name)
+        if metrics is None:
+            with self._lock:
+                metrics = self.views.setdefault(name, ViewMetrics(self.buckets))
+                if self.directory and self._writer is None:
+                    self.start_writer()
+        return metrics
+
+    def observe(self, name, duration_ns, error=False, bytes_out=0):
+        metrics = self.get(name)
+        with metrics.lock:
+            metrics.requests += 1
+            if error:
+                metrics.errors += 1
+            metrics.bytes_out += bytes_out
+            metrics.duration.observe(duration_ns)
+
+    def wrap(self, name, handler):
+        """ handler(request) -> Response с записью времени, ошибок и байт ответа в ряд name """
+        observe = self.observe
+
+        def timed(request):
+            if not self.enabled:
+                return handler(request)
+            time_start = perf_counter_ns()
+            try:
+                response = handler(request)
+            except Exception:
+                observe(name, perf_counter_ns() - time_start, error=True)
+                raise
+            observe(name, perf_counter_ns() - time_start, response.status.startswith('5'), response_size(response))
+            return response
+        return timed
+
+    def wrap_async(self, name, handler):
+        observe = self.observe
+
+        async def timed(request):
+            if not self.enabled:
+                return await handler(request)
+            time_start = perf_counter_ns()
+            try:
+                response = await handler(request)
+            except Exception:
+                observe(name, perf_counter_ns() - time_start, error=True)
+                raise
+            observe(name, perf_counter_ns() - time_start, response.status.startswith('5'), response_size(response))
+            return response
+        return timed
+
+    def quantiles(self, name):
+        """ {квантиль: секунды} для контроллера """
+        metrics = self.get(name)
+        with metrics.lock:
+            return {q: metrics.duration.quantile(q) for q in QUANTILES}
+
+    def clear(self):
+        with self._lock:
+            self.views.clear()
+
+    def start_writer(self):
+        self._writer = Thread(target=self._run_writer, name='metrics-writer', daemon=True)
+        self._writer.start()
+
+    def _run_writer(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.dump()
+
+    def snapshot_path(self, pid):
+        return os.path.join(self.directory, f'{pid}.json')
+
+    def dump(self):
+        """ Сохранить снимок реестра процесса """
+        if not self.directory or not self.views:
+            return
+        with self._lock:
+            views = list(self.views.items())
+        data = {name: metrics.dump() for name, metrics in views}
+        path = self.snapshot_path(os.getpid())
+        temp_path = f'{path}.tmp'
+        with self._dump_lock:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            # замена атомарна: читатель не увидит наполовину записанный файл
+            os.replace(temp_path, path)
+
+    @staticmethod
+    def is_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    @staticmethod
+    def read_snapshot(path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def merge_into(self, views, data):
+        for name, values in data.items():
+            if name not in views:
+                views[name] = ViewMetrics(self.buckets)
+            views[name].merge(values)
+
+    def collect(self):
+        """ Метрики всех процессов: {контроллер: ViewMetrics} """
+        if not self.directory:
+            with self._lock:
+                return dict(self.views)
+        self.dump()
+        own = os.getpid()
+        retired_path = os.path.join(self.directory, self.retired_name)
+        views = {}
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            retired = {}
+            self.merge_into(retired, self.read_snapshot(retired_path))
+            retired_changed = False
+            for file_name in os.listdir(self.directory):
+                stem, extension = os.path.splitext(file_name)
+                if extension != '.json' or not stem.isdigit():
+                    continue
+                path = os.path.join(self.directory, file_name)
+                data = self.read_snapshot(path)
+                pid = int(stem)
+                if pid != own and not self.is_alive(pid):
+                    # процесс завершился - его счётчики переходят в общий итог
+                    self.merge_into(retired, data)
+                    retired_changed = True
+                    os.remove(path)
+                else:
+                    self.merge_into(views, data)
+            if retired_changed:
+                temp_path = f'{retired_path}.tmp'
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump({name: metrics.dump() for name, metrics in retired.items()}, f)
+                os.replace(temp_path, retired_path)
+        for name, metrics in retired.items():
+            if name in views:
+                views[name].merge(metrics.dump())
+            else:
+                views[name] = metrics
+        return views
+
+    def render_prometheus(self, prefix='fox'):
+        """
+        Метрики в формате Prometheus. С directory - сумма по всем процессам,
+        снимки других процессов отстают не больше чем на flush_interval.
+        """
+        lines = []
+
+        def header(name, kind, text):
+            lines.append(f'# HELP {prefix}_{name} {text}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+
+        snapshot = []
+        for name, metrics in sorted(self.collect().items()):
+            with metrics.lock:
+                duration = metrics.duration
+                method, _, route = name.partition(' ')
+                labels = 'route="{}",method="{}"'.format(escape_label(route), escape_label(method))
+                snapshot.append((
+                    labels,
+                    metrics.requests, metrics.errors, metrics.bytes_out,
+                    list(duration.counts), duration.sum_ns, duration.count,
+                    [(q, duration.quantile(q)) for q in QUANTILES],
+                ))
+
+        header('requests_total', 'counter', 'Number of handled requests.')
+        for labels, requests, *_ in snapshot:
+            lines.append(f'{prefix}_requests_total{{{labels}}} {requests}')
+        header('request_errors_total', 'counter', 'Requests that raised an exception or returned 5xx.')
+        for labels, _, errors, *_ in snapshot:
+            lines.append(f'{prefix}_request_errors_total{{{labels}}} {errors}')
+        header('response_bytes_total', 'counter', 'Bytes of response bodies.')
+        for labels, _, _, bytes_out, *_ in snapshot:
+            lines.append(f'{prefix}_response_bytes_total{{{labels}}} {bytes_out}')
+        header('request_duration_seconds', 'histogram', 'Request handling time.')
+        for labels, _, _, _, counts, sum_ns, count, _ in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{prefix}_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_request_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{prefix}_request_duration_seconds_sum{{{labels}}} {sum_ns / 1e9:.9f}')
+            lines.append(f'{prefix}_request_duration_seconds_count{{{labels}}} {count}')
+        header('request_duration_quantile_seconds', 'gauge', 'Estimated p50/p95/p99 of request handling time.')
+        for labels, *_, quantiles in snapshot:
+            for q, value in quantiles:
+                if value is not None:
+                    lines.append(f'{prefix}_request_duration_quantile_seconds'
+                                 f'{{{labels},quantile="{q}"}} {value:.9f}')
+        lines.append('')
+        return '\n'.join(lines)
+
+
+def response_size(response):
+    """ Размер тела ответа; у потокового ответа он заранее неизвестен """
+    return 0 if response.streaming else len(response.body)
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+# реестр процесса; общий итог по процессам собирается через directory
+registry = MetricsRegistry()
+
+
+class MetricsView:
+    """ Контроллер /metrics/ в формате Prometheus """
+
+    def __init__(self, metrics_registry=registry):
+        self.registry = metrics_registry
+
+    def __call__(self, request):
+        response = Response(self.registry.render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+        response.set_cache(0)
+        return response
@@ -0,0 +1,141 @@
+""" Цепочка middleware: хуки до и после контроллера, собираемые в один вызов для каждого маршрута """
+from inspect import iscoroutinefunction, isfunction
+
+from fox_framework.response import Response
+
+
+class Middleware:
+    """
+    Промежуточный обработчик запроса.
+    before(request) выполняется до контроллера; если он вернул ответ
+    (Response или кортеж (код, тело)), контроллер и следующие middleware
+    не запускаются, но after() предыдущих отрабатывают.
+    after(request, response) получает Response и возвращает Response.
+    on_exception(request, exception) вызывается, если контроллер или
+    следующие middleware выбросили исключение (after() тогда не выполняется):
+    здесь сбрасывается состояние, заведённое в before(). Исключение
+    после этого передаётся дальше.
+
+    Маршрут отключает middleware атрибутом контроллера
+    middleware_exclude = ('имя', ...), а middleware с optional = True
+    работает только у маршрутов, где оно указано в middleware_include.
+    """
+    # имя для middleware_exclude / middleware_include, по умолчанию имя класса
+    name = None
+    optional = False
+
+    def get_name(self):
+        return self.name or type(self).__name__
+
+    def applies_to(self, view):
+        name = self.get_name()
+        if name in getattr(view, 'middleware_exclude', ()):
+            return False
+        if self.optional:
+            return name in getattr(view, 'middleware_include', ())
+        return True
+
+    def before(self, request):
+        return None
+
+    def after(self, request, response):
+        return response
+
+    def on_exception(self, request, exception):
+        pass
+
+    def wrap(self, handler, view):
+        """ Оборачивает обработчик контроллера view; хуки, которые не переопределены, в цепочку не попадают """
+        call = self.wrap_hooks(handler)
+        if type(self).on_exception is Middleware.on_exception:
+            return call
+        on_exception = self.on_exception
+
+        def guarded(request):
+            try:
+                return call(request)
+            except BaseException as exception:
+                on_exception(request, exception)
+                raise
+        return guarded
+
+    def wrap_hooks(self, handler):
+        has_before = type(self).before is not Middleware.before
+        has_after = type(self).after is not Middleware.after
+        before, after = self.before, self.after
+
+        if has_before and has_after:
+            def call(request):
+                result = before(request)
+                if result is not None:
+                    return after(request, Response.from_result(result))
+                return after(request, handler(request))
+        elif has_before:
+            def call(request):
+                result = before(request)
+                if result is not None:
+                    return Response.from_result(result)
+                return handler(request)
+        elif has_after:
+            def call(request):
+                return after(request, handler(request))
+        else:
+            return handler
+        return call
+
+    def wrap_async(self, handler, view):
+        """ То же для асинхронного контроллера: хуки синхронные, обработчик - корутина """
+        has_before = type(self).before is not Middleware.before
+        has_after = type(self).after is not Middleware.after
+        has_on_exception = type(self).on_exception is not Middleware.on_exception
+        before, after, on_exception = self.before, self.after, self.on_exception
+        if not has_before and not has_after and not has_on_exception:
+            return handler
+
+        async def call(request):
+            try:
+                if has_before:
+                    result = before(request)
+                    if result is not None:
+                        response = Response.from_result(result)
+                        return after(request, response) if has_after else response
+                response = await handler(request)
+                return after(request, response) if has_after else response
+            except BaseException as exception:
+                if has_on_exception:
+                    on_exception(request, exception)
+                raise
+        return call
+
+
+class FrontMiddleware(Middleware):
+    """ Старый front controller - функция func(request) - в виде middleware """
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+
+    def before(self, request):
+        return self.func(request)
+
+
+def as_middleware(item):
+    return item if isinstance(item, Middleware) else FrontMiddleware(item)
+
+
+def is_async_view(view):
+    """ Контроллер с async def __call__ (или сама async-функция) """
+    return iscoroutinefunction(view if isfunction(view) else getattr(view, '__call__', None))
+
+
+def build_pipeline(middlewares, view, handler, is_async=False):
+    """
+    Собирает цепочку для одного контроллера: из списка выбираются
+    middleware, которые к нему применимы, и вкладываются друг в друга.
+    Первый в списке выполняется первым. Для is_async=True handler и
+    результат - корутины.
+    """
+    for middleware in reversed(middlewares):
+        if middleware.applies_to(view):
+            handler = middleware.wrap_async(handler, view) if is_async else middleware.wrap(handler, view)
+    return handler
@@ -1,56 +1,462 @@
 """ Классы обработчики get и post запросов. Возвращают словари с данными"""
+import json
+from binascii import a2b_qp
+from collections.abc import Mapping
+from tempfile import SpooledTemporaryFile
+from urllib.parse import unquote_plus
+
+
+class RequestEntityTooLarge(Exception):
+    def __init__(self, max_size):
+        super().__init__(f'Request body is larger than {max_size} bytes')
+
+
+class BadRequest(Exception):
+    def __init__(self, message):
+        super().__init__(f'Bad request: {message}')
+
+
+def _unquote_ascii(value):
+    """
+    Декодирование корректно закодированной ASCII-строки на C через a2b_qp:
+    '=' экранируется, %XX превращается в =XX. None - строку нужно
+    декодировать через unquote_plus
+    """
+    # перевод строки после '=' a2b_qp считает мягким переносом
+    if not value.isascii() or '\n' in value or '\r' in value:
+        return None
+    quoted = value.replace('=', '=3D').replace('%', '=').replace('+', ' ')
+    raw = a2b_qp(quoted.encode('ascii'))
+    # каждая верная последовательность =XX даёт один байт
+    if len(raw) != len(quoted) - 2 * quoted.count('='):
+        return None
+    return raw.decode('utf-8', errors='replace')
+
+
+def decode_value(value: str) -> str:
+    """
+    Декодирование %XX и '+' из строки запроса или формы (UTF-8),
+    результат совпадает с urllib.parse.unquote_plus
+    """
+    # быстрый путь: в большинстве значений нечего декодировать
+    if '%' not in value and '+' not in value:
+        return value
+    decoded = _unquote_ascii(value)
+    if decoded is None:
+        return unquote_plus(value, encoding='utf-8', errors='replace')
+    return decoded
+
+
+class MultiDict(dict):
+    """
+    Словарь параметров запроса. По ключу хранится последнее значение,
+    как раньше, а все значения повторяющегося ключа доступны через getlist()
+    """
+    __slots__ = ('_lists',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # списки значений только для повторяющихся ключей
+        self._lists = {}
+
+    def add(self, key, value):
+        if key in self:
+            self._lists.setdefault(key, [self[key]]).append(value)
+        self[key] = value
+
+    def getlist(self, key):
+        values = self._lists.get(key)
+        if values is not None:
+            return list(values)
+        return [self[key]] if key in self else []
+
 
 class GetRequests:
 
     @staticmethod
     def parse_input_data(data: str):
-        result = {}
-        if data:
-            params = data.split('&')
-            for item in params:
-                k, v = item.split('=')
-                result[k] = v
+        result = MultiDict()
+        if not data:
+            return result
+        params = data.split('&')
+        if '' in params:
+            params = [item for item in params if item]
+        # вся строка декодируется одним вызовом, если в каждой паре ровно
+        # один '=' и в значениях нет закодированного '&' (%26): тогда '&'
+        # в декодированной строке остаются только разделителями
+        if '%26' not in data and data.count('=') == len(params) and all('=' in item for item in params):
+            decoded = _unquote_ascii('&'.join(params).replace('=', '&'))
+            if decoded is not None:
+                tokens = decoded.split('&')
+                for k, v in zip(tokens[::2], tokens[1::2]):
+                    result.add(k, v)
+                return result
+        for item in params:
+            k, _, v = item.partition('=')
+            result.add(decode_value(k), decode_value(v))
         return result
 
     @staticmethod
     def get_request_params(environ):
-        query_string = environ['QUERY_STRING']
+        query_string = environ.get('QUERY_STRING', '')
         request_params = GetRequests.parse_input_data(query_string)
         return request_params
 
 
+class UploadedFile:
+    """ Загруженный файл из multipart/form-data """
+
+    def __init__(self, filename, content_type, file, size):
+        self.filename = filename
+        self.content_type = content_type
+        self.file = file
+        self.size = size
+
+    def read(self, *args):
+        return self.file.read(*args)
+
+    def close(self):
+        self.file.close()
+
+
+class BodyReader:
+    """ Чтение wsgi.input кусками не дальше CONTENT_LENGTH """
+
+    def __init__(self, stream, content_length, chunk_size):
+        self.stream = stream
+        self.remaining = content_length
+        self.chunk_size = chunk_size
+
+    def read_chunk(self):
+        if self.remaining <= 0:
+            return b''
+        chunk = self.stream.read(min(self.chunk_size, self.remaining))
+        if not chunk:
+            raise BadRequest('unexpected end of request body')
+        self.remaining -= len(chunk)
+        return chunk
+
+    def read_all(self):
+        chunks = []
+        chunk = self.read_chunk()
+        while chunk:
+            chunks.append(chunk)
+            chunk = self.read_chunk()
+        return b''.join(chunks)
+
+
+class MultipartParser:
+    """
+    Потоковый разбор multipart/form-data.
+    Обычные поля собираются в строки, файлы пишутся в SpooledTemporaryFile
+    и уходят на диск, когда превышают spool_max_size байт.
+    Поля и файлы возвращаются в MultiDict: все значения повторяющегося
+    имени доступны через getlist().
+    """
+    max_header_size = 16 * 1024
+
+    def __init__(self, reader, boundary, spool_max_size):
+        self.reader = reader
+        self.delimiter = b'\r\n--' + boundary
+        self.spool_max_size = spool_max_size
+        self.buffer = b''
+
+    def fill(self):
+        chunk = self.reader.read_chunk()
+        if not chunk:
+            raise BadRequest('malformed multipart body')
+        self.buffer += chunk
+
+    @staticmethod
+    def parse_part_headers(raw):
+        name = filename = None
+        content_type = 'application/octet-stream'
+        for line in raw.decode('utf-8', 'replace').split('\r\n'):
+            header, _, value = line.partition(':')
+            header = header.strip().lower()
+            if header == 'content-disposition':
+                for param in value.split(';')[1:]:
+                    key, _, param_value = param.strip().partition('=')
+                    param_value = param_value.strip('"')
+                    if key == 'name':
+                        name = param_value
+                    elif key == 'filename':
+                        filename = param_value
+            elif header == 'content-type':
+                content_type = value.strip()
+        return name, filename, content_type
+
+    def read_part_body(self, write):
+        """ Передаёт тело части в write() до следующего разделителя """
+        delimiter = self.delimiter
+        while True:
+            index = self.buffer.find(delimiter)
+            if index >= 0:
+                write(self.buffer[:index])
+                self.buffer = self.buffer[index + len(delimiter):]
+                return
+            # хвост буфера может оказаться началом разделителя
+            keep = len(delimiter) - 1
+            if len(self.buffer) > keep:
+                write(self.buffer[:-keep])
+                self.buffer = self.buffer[-keep:]
+            self.fill()
+
+    def parse(self):
+        fields, files = MultiDict(), MultiDict()
+        # перед первой частью разделитель идёт без \r\n
+        self.buffer = b'\r\n'
+        self.read_part_body(lambda data: None)
+        while True:
+            while len(self.buffer) < 2:
+                self.fill()
+            if self.buffer.startswith(b'--'):
+                break
+            # пропускаем \r\n после разделителя и читаем заголовки части
+            while True:
+                index = self.buffer.find(b'\r\n\r\n')
+                if index >= 0:
+                    break
+                if len(self.buffer) > self.max_header_size:
+                    raise BadRequest('multipart headers are too large')
+                self.fill()
+            name, filename, content_type = self.parse_part_headers(self.buffer[2:index])
+            self.buffer = self.buffer[index + 4:]
+            if filename is None:
+                chunks = []
+                self.read_part_body(chunks.append)
+                if name is not None:
+                    fields.add(name, b''.join(chunks).decode('utf-8', 'replace'))
+            else:
+                file = SpooledTemporaryFile(max_size=self.spool_max_size)
+                self.read_part_body(file.write)
+                size = file.tell()
+                file.seek(0)
+                if name is not None:
+                    files.add(name, UploadedFile(filename, content_type, file, size))
+        # дочитываем эпилог, чтобы не оставить данные в сокете
+        while self.reader.read_chunk():
+            pass
+        return fields, files
+
+
 class PostRequests:
+    """
+    Разбор тела запроса. Тело читается из wsgi.input кусками по chunk_size,
+    размер ограничен max_body_size (RequestEntityTooLarge при превышении).
+    Поддерживаются application/x-www-form-urlencoded,
+    multipart/form-data и application/json.
+    """
+
+    def __init__(self, max_body_size=10 * 1024 * 1024, chunk_size=64 * 1024, spool_max_size=1024 * 1024):
+        self.max_body_size = max_body_size
+        self.chunk_size = chunk_size
+        self.spool_max_size = spool_max_size
 
     @staticmethod
     def parse_input_data(data: str):
-        result = {}
-        if data:
-            params = data.split('&')
-            for item in params:
-                k, v = item.split('=')
-                result[k] = v
-        return result
+        return GetRequests.parse_input_data(data)
 
-    @staticmethod
-    def get_wsgi_input_data(env) -> bytes:
+    def get_reader(self, env):
         # получаем длину тела
         content_length_data = env.get('CONTENT_LENGTH')
         # приводим к int
-        content_length = int(content_length_data) if content_length_data else 0
-        # считываем данные, если они есть
+        try:
+            content_length = int(content_length_data) if content_length_data else 0
+        except ValueError:
+            raise BadRequest('invalid Content-Length')
+        if content_length > self.max_body_size:
+            raise RequestEntityTooLarge(self.max_body_size)
         # env['wsgi.input'] -> <class '_io.BufferedReader'>
-        # запускаем режим чтения
-        data = env['wsgi.input'].read(content_length) if content_length > 0 else b''
-        return data
+        return BodyReader(env['wsgi.input'], content_length, self.chunk_size)
+
+    def get_wsgi_input_data(self, env) -> bytes:
+        return self.get_reader(env).read_all()
 
     def parse_wsgi_input_data(self, data: bytes) -> dict:
-        result = {}
+        result = MultiDict()
         if data:
-            data_str = data.decode(encoding='utf-8')
+            data_str = data.decode(encoding='utf-8', errors='replace')
             result = self.parse_input_data(data_str)
         return result
 
     def get_request_params(self, environ):
+        """ Возвращает (поля, файлы) """
+        content_type, _, params = environ.get('CONTENT_TYPE', '').partition(';')
+        content_type = content_type.strip().lower()
+        if content_type == 'multipart/form-data':
+            boundary = None
+            for param in params.split(';'):
+                key, _, value = param.strip().partition('=')
+                if key == 'boundary':
+                    boundary = value.strip('"')
+            if not boundary:
+                raise BadRequest('multipart boundary is missing')
+            parser = MultipartParser(self.get_reader(environ), boundary.encode('latin-1'), self.spool_max_size)
+            return parser.parse()
         data = self.get_wsgi_input_data(environ)
-        data = self.parse_wsgi_input_data(data)
-        return data
+        if content_type == 'application/json':
+            try:
+                result = json.loads(data) if data else {}
+            except ValueError as e:
+                raise BadRequest(f'invalid JSON: {e}')
+            # контроллеры обращаются к данным по ключам
+            if not isinstance(result, dict):
+                raise BadRequest('JSON body must be an object')
+            return result, {}
+        return self.parse_wsgi_input_data(data), {}
+
+
+class RequestData(Mapping):
+    """
+    Данные тела запроса (request['data']).
+    Тело читается и разбирается только при первом обращении к данным.
+    """
+
+    def __init__(self, environ, parser):
+        self._environ = environ
+        self._parser = parser
+        self._data = None
+        self._files = None
+
+    def _load(self):
+        if self._data is None:
+            self._data, self._files = self._parser.get_request_params(self._environ)
+        return self._data
+
+    @property
+    def files(self):
+        self._load()
+        return self._files
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def getlist(self, key):
+        """ Все значения повторяющегося поля формы """
+        data = self._load()
+        if isinstance(data, MultiDict):
+            return data.getlist(key)
+        return [data[key]] if key in data else []
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __repr__(self):
+        if self._data is None:
+            return '<RequestData: not parsed>'
+        return repr(self._data)
+
+
+_MISSING = object()
+
+
+class Request:
+    """
+    Объект запроса, который получают все контроллеры.
+    Заголовки, параметры строки запроса, тело и cookies разбираются
+    только при первом обращении и запоминаются, поэтому запросы,
+    которым они не нужны, за разбор не платят.
+    Поддерживается и старый доступ как к словарю: request['data'],
+    request['request_params'], request['method'], а также произвольные
+    ключи, которые добавляют front controller (request['date']).
+    """
+    __slots__ = ('environ', 'path_params', 'post_parser', '_extra',
+                 '_headers', '_request_params', '_data', '_cookies')
+
+    # ключи словаря, которые отображаются на свойства объекта
+    attributes = frozenset(('method', 'path', 'path_params', 'request_params', 'data', 'files', 'headers', 'cookies'))
+    # ключи, значения которых можно подменить: ключ -> атрибут
+    writable = {
+        'path_params': 'path_params',
+        'request_params': '_request_params',
+        'data': '_data',
+        'headers': '_headers',
+        'cookies': '_cookies',
+    }
+
+    def __init__(self, environ, path_params=None, post_parser=None):
+        self.environ = environ
+        self.path_params = path_params if path_params is not None else {}
+        self.post_parser = post_parser if post_parser is not None else PostRequests()
+        self._extra = {}
+        self._headers = _MISSING
+        self._request_params = _MISSING
+        self._data = _MISSING
+        self._cookies = _MISSING
+
+    @property
+    def method(self):
+        return self.environ['REQUEST_METHOD']
+
+    @property
+    def path(self):
+        return self.environ['PATH_INFO']
+
+    @property
+    def headers(self):
+        if self._headers is _MISSING:
+            headers = {}
+            for key, value in self.environ.items():
+                if key.startswith('HTTP_'):
+                    headers[key[5:].replace('_', '-').title()] = value
+                elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH') and value:
+                    headers[key.replace('_', '-').title()] = value
+            self._headers = headers
+        return self._headers
+
+    @property
+    def request_params(self):
+        """ Параметры строки запроса: 127.0.0.1:8080?id=1&category=10 """
+        if self._request_params is _MISSING:
+            self._request_params = GetRequests.get_request_params(self.environ)
+        return self._request_params
+
+    @property
+    def data(self):
+        if self._data is _MISSING:
+            self._data = RequestData(self.environ, self.post_parser)
+        return self._data
+
+    @property
+    def files(self):
+        return self.data.files
+
+    @property
+    def cookies(self):
+        if self._cookies is _MISSING:
+            cookies = {}
+            for item in self.environ.get('HTTP_COOKIE', '').split(';'):
+                name, sep, value = item.strip().partition('=')
+                if sep and name:
+                    cookies[name] = value.strip('"')
+            self._cookies = cookies
+        return self._cookies
+
+    def __getitem__(self, key):
+        if key in self.attributes:
+            return getattr(self, key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self.writable:
+            setattr(self, self.writable[key], value)
+        elif key in self.attributes:
+            raise KeyError(f'{key} is read-only')
+        else:
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        return key in self.attributes or key in self._extra
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return f'<Request {self.method} {self.path}>'
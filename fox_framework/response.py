@@ -0,0 +1,117 @@
+""" Ответы контроллеров: Response с готовым телом и StreamingResponse с генератором """
+from email.utils import formatdate
+
+
+class Response:
+    """
+    Ответ с телом целиком в памяти. Content-Length выставляется сам.
+    Контроллеры по-прежнему могут возвращать кортеж (код, тело),
+    он превращается в Response в Framework.
+    """
+    streaming = False
+
+    def __init__(self, body='', status='200 OK', headers=None, content_type='text/html'):
+        self.status = status
+        self.headers = list(headers or [])
+        if content_type and not self.has_header('Content-Type'):
+            self.headers.append(('Content-Type', content_type))
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+
+    @classmethod
+    def from_result(cls, result, content_type='text/html'):
+        """ Приводит результат контроллера к Response """
+        if isinstance(result, Response):
+            return result
+        status, body = result
+        return cls(body, status, content_type=content_type)
+
+    def has_header(self, name):
+        name = name.lower()
+        return any(key.lower() == name for key, _ in self.headers)
+
+    def set_header(self, name, value):
+        lower = name.lower()
+        self.headers = [(key, val) for key, val in self.headers if key.lower() != lower]
+        self.headers.append((name, value))
+
+    def set_cache(self, max_age, public=True):
+        """ Cache-Control: max_age=0 - запрет кэширования """
+        if max_age <= 0:
+            self.set_header('Cache-Control', 'no-store')
+        else:
+            self.set_header('Cache-Control', f'{"public" if public else "private"}, max-age={max_age}')
+
+    def set_cookie(self, name, value, max_age=None, path='/', http_only=True, secure=False, same_site='Lax'):
+        parts = [f'{name}={value}', f'Path={path}']
+        if max_age is not None:
+            parts.append(f'Max-Age={max_age}')
+        if http_only:
+            parts.append('HttpOnly')
+        if secure:
+            parts.append('Secure')
+        if same_site:
+            parts.append(f'SameSite={same_site}')
+        self.headers.append(('Set-Cookie', '; '.join(parts)))
+
+    def delete_cookie(self, name, path='/'):
+        self.headers.append(('Set-Cookie', f'{name}=; Path={path}; Max-Age=0; '
+                                           f'Expires={formatdate(0, usegmt=True)}'))
+
+    def get_headers(self):
+        headers = list(self.headers)
+        if not self.has_header('Content-Length'):
+            headers.append(('Content-Length', str(len(self.body))))
+        return headers
+
+    def iter_body(self, method):
+        return [b''] if method == 'HEAD' else [self.body]
+
+    def __call__(self, environ, start_response):
+        """ Ответ как WSGI-приложение """
+        start_response(self.status, self.get_headers())
+        return self.iter_body(environ['REQUEST_METHOD'])
+
+
+class StreamingResponse(Response):
+    """
+    Ответ, тело которого - итератор строк или байтов (например,
+    Template.generate()). Отправка начинается до того, как сформирована
+    вся страница. Для HEAD итератор не запускается.
+    """
+    streaming = True
+
+    def __init__(self, body, status='200 OK', headers=None, content_type='text/html', content_length=None):
+        super().__init__(b'', status, headers, content_type)
+        self.body = body
+        if content_length is not None:
+            self.set_header('Content-Length', str(content_length))
+
+    def get_headers(self):
+        return list(self.headers)
+
+    def iter_body(self, method):
+        if method == 'HEAD':
+            close = getattr(self.body, 'close', None)
+            if close is not None:
+                close()
+            return [b'']
+        return StreamingBody(self.body)
+
+
+class StreamingBody:
+    """ Итератор тела с кодированием в UTF-8 и передачей close() серверу """
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+
+    def __iter__(self):
+        for chunk in self.iterable:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield chunk
+
+    def close(self):
+        close = getattr(self.iterable, 'close', None)
+        if close is not None:
+            close()
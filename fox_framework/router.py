@@ -0,0 +1,137 @@
+""" Таблица маршрутов: префиксное дерево по сегментам пути с параметрами """
+
+
+class NotFound(Exception):
+    def __init__(self, path):
+        super().__init__(f'Route not found: {path}')
+
+
+class MethodNotAllowed(Exception):
+    def __init__(self, path, method, allowed):
+        self.allowed = allowed
+        super().__init__(f'Method {method} not allowed for {path}')
+
+
+def _convert_int(value):
+    if value.isdigit():
+        return int(value)
+    raise ValueError(value)
+
+
+def _convert_str(value):
+    if value:
+        return value
+    raise ValueError(value)
+
+
+class _Node:
+    __slots__ = ('static', 'params', 'catch_all', 'handlers', 'rule')
+
+    def __init__(self):
+        # сегмент -> узел
+        self.static = {}
+        # [(имя, конвертер, узел)] для <int:id>, <str:name>
+        self.params = []
+        # (имя, узел) для <path:name> - забирает остаток пути
+        self.catch_all = None
+        # метод -> контроллер, '*' - любой метод
+        self.handlers = {}
+        # правило, по которому создан узел с контроллерами (для метрик)
+        self.rule = None
+
+
+class Router:
+    """
+    Маршрутизатор. Правила вида '/category/<int:id>/courses/'
+    компилируются в дерево, поиск идёт по сегментам пути,
+    поэтому его стоимость зависит от длины пути, а не от числа маршрутов.
+    """
+    converters = {
+        'int': _convert_int,
+        'str': _convert_str,
+    }
+
+    def __init__(self):
+        self.root = _Node()
+
+    @staticmethod
+    def split(path):
+        return [segment for segment in path.split('/') if segment]
+
+    @classmethod
+    def from_routes(cls, routes):
+        """ routes: {url: контроллер} или {url: {метод: контроллер}} """
+        router = cls()
+        for rule, view in routes.items():
+            if isinstance(view, dict):
+                for method, method_view in view.items():
+                    router.add(rule, method_view, (method,))
+            else:
+                router.add(rule, view)
+        return router
+
+    def add(self, rule, view, methods=None):
+        node = self.root
+        for segment in self.split(rule):
+            if segment.startswith('<') and segment.endswith('>'):
+                converter_name, _, name = segment[1:-1].rpartition(':')
+                converter_name = converter_name or 'str'
+                if converter_name == 'path':
+                    if node.catch_all is None:
+                        node.catch_all = (name, _Node())
+                    node = node.catch_all[1]
+                    continue
+                converter = self.converters[converter_name]
+                for param_name, param_converter, child in node.params:
+                    if param_name == name and param_converter is converter:
+                        node = child
+                        break
+                else:
+                    child = _Node()
+                    node.params.append((name, converter, child))
+                    node = child
+            else:
+                node = node.static.setdefault(segment, _Node())
+        for method in methods or ('*',):
+            node.handlers[method.upper()] = view
+        if node.rule is None:
+            node.rule = rule
+
+    def resolve(self, path, method):
+        """ Возвращает (контроллер, параметры пути, правило маршрута) """
+        params = {}
+        node = self._match(self.root, self.split(path), 0, params)
+        if node is None:
+            raise NotFound(path)
+        handlers = node.handlers
+        view = handlers.get(method) or handlers.get('*')
+        if view is None:
+            if method == 'HEAD' and 'GET' in handlers:
+                return handlers['GET'], params, node.rule
+            raise MethodNotAllowed(path, method, sorted(handlers))
+        return view, params, node.rule
+
+    def _match(self, node, segments, index, params):
+        if index == len(segments):
+            return node if node.handlers else None
+        segment = segments[index]
+        child = node.static.get(segment)
+        if child is not None:
+            found = self._match(child, segments, index + 1, params)
+            if found is not None:
+                return found
+        for name, converter, child in node.params:
+            try:
+                value = converter(segment)
+            except ValueError:
+                continue
+            found = self._match(child, segments, index + 1, params)
+            if found is not None:
+                params[name] = value
+                return found
+        if node.catch_all is not None:
+            name, child = node.catch_all
+            if child.handlers:
+                params[name] = '/'.join(segments[index:])
+                return child
+        return None
@@ -0,0 +1,518 @@
+""" Боевой WSGI-сервер: pre-fork мастер, пул потоков в каждом процессе, HTTP/1.1 keep-alive
+
+Мастер открывает сокет и запускает рабочие процессы (fork). Каждый процесс
+принимает соединения из общего сокета (или своего, с SO_REUSEPORT) и
+обрабатывает их в пуле потоков. Сигналы мастеру:
+    SIGTERM, SIGINT - плавная остановка: процессы дообрабатывают запросы
+    SIGHUP - плавный перезапуск процессов (если приложение задано строкой
+             'модуль:объект', процессы импортируют его заново)
+Процесс, обработавший max_requests запросов, завершается, мастер запускает новый.
+Framework остаётся обычным WSGI-приложением.
+"""
+import os
+import selectors
+import signal
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler
+from importlib import import_module
+from time import monotonic, sleep
+from urllib.parse import unquote_to_bytes
+
+SERVER_SOFTWARE = 'fox_framework'
+# ответы без тела
+NO_BODY_STATUSES = ('1', '204', '304')
+
+
+def load_app(app):
+    """ Приложение или строка 'модуль:объект' """
+    if not isinstance(app, str):
+        return app
+    module_name, _, attr = app.partition(':')
+    return getattr(import_module(module_name), attr or 'application')
+
+
+def close_app(app):
+    """ Приложения с методом close() освобождают свои ресурсы при остановке процесса """
+    close = getattr(app, 'close', None)
+    if close is not None:
+        close()
+
+
+def create_listener(host, port, backlog=1024, reuse_port=False):
+    listener = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    listener.bind((host, port))
+    listener.listen(backlog)
+    listener.setblocking(False)
+    return listener
+
+
+class InputStream:
+    """ wsgi.input: чтение тела не дальше Content-Length, остаток дочитывается после ответа """
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.read(size)
+        self.remaining -= len(data)
+        if not data:
+            self.remaining = 0
+        return data
+
+    def readline(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.readline(size)
+        self.remaining -= len(data)
+        if not data:
+            self.remaining = 0
+        return data
+
+    def readlines(self, hint=-1):
+        return list(iter(self.readline, b''))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def drain(self, limit):
+        """ Дочитывает непрочитанное тело; False, если оно больше limit """
+        if self.remaining > limit:
+            return False
+        while self.remaining > 0:
+            if not self.read(min(self.remaining, 64 * 1024)):
+                return False
+        return True
+
+
+class FileWrapper:
+    """ wsgi.file_wrapper: файл уходит в сокет через sendfile """
+
+    def __init__(self, filelike, block_size=64 * 1024):
+        self.filelike = filelike
+        self.block_size = block_size
+
+    def __iter__(self):
+        return iter(lambda: self.filelike.read(self.block_size), b'')
+
+    def close(self):
+        close = getattr(self.filelike, 'close', None)
+        if close is not None:
+            close()
+
+
+class WSGIRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP/1.1 с keep-alive. Ответ без Content-Length отдаётся
+    с Transfer-Encoding: chunked, чтобы соединение не закрывалось.
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = SERVER_SOFTWARE
+    # сколько секунд ждать следующий запрос в открытом соединении
+    timeout = 5
+    # непрочитанное приложением тело больше этого размера - соединение закрывается
+    max_drain = 64 * 1024
+
+    def __init__(self, request, client_address, worker):
+        self.worker = worker
+        self.timeout = worker.keepalive_timeout
+        super().__init__(request, client_address, worker)
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+            if len(self.raw_requestline) > 65536:
+                self.requestline = ''
+                self.request_version = ''
+                self.command = ''
+                self.send_error(414)
+                return
+            if not self.raw_requestline:
+                self.close_connection = True
+                return
+            if not self.parse_request():
+                return
+            self.run_wsgi()
+            self.wfile.flush()
+        except (socket.timeout, ConnectionError):
+            self.close_connection = True
+
+    def make_environ(self, body):
+        path, _, query = self.path.partition('?')
+        server_name, server_port = self.server.server_address[:2]
+        environ = {
+            'REQUEST_METHOD': self.command,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote_to_bytes(path).decode('latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': str(server_name),
+            'SERVER_PORT': str(server_port),
+            'SERVER_PROTOCOL': self.request_version,
+            'SERVER_SOFTWARE': SERVER_SOFTWARE,
+            'REMOTE_ADDR': self.client_address[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': self.worker.multiprocess,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': FileWrapper,
+        }
+        for name, value in self.headers.items():
+            key = name.upper().replace('-', '_')
+            if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[key] = value
+            else:
+                key = f'HTTP_{key}'
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def run_wsgi(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            # тело chunked приложение прочитать не сможет
+            self.close_connection = True
+            self.send_error(411)
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self.close_connection = True
+            self.send_error(400)
+            return
+        if not self.worker.count_request():
+            # процесс завершается: клиент узнает об этом из Connection: close
+            self.close_connection = True
+        body = InputStream(self.rfile, length)
+        environ = self.make_environ(body)
+        state = {'status': None, 'headers': None, 'sent': False, 'chunked': False}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info:
+                try:
+                    if state['sent']:
+                        raise exc_info[1].with_traceback(exc_info[2])
+                finally:
+                    exc_info = None
+            elif state['status'] is not None:
+                raise AssertionError('start_response вызван повторно')
+            state['status'] = status
+            state['headers'] = headers
+            return write
+
+        def send_headers():
+            status, headers = state['status'], state['headers']
+            names = {name.lower() for name, _ in headers}
+            has_body = self.command != 'HEAD' and not status.startswith(NO_BODY_STATUSES)
+            if has_body and 'content-length' not in names:
+                if self.request_version == 'HTTP/1.1':
+                    state['chunked'] = True
+                    headers = headers + [('Transfer-Encoding', 'chunked')]
+                else:
+                    self.close_connection = True
+            if not body.drain(0 if self.close_connection else self.max_drain):
+                self.close_connection = True
+            out = [f'{self.protocol_version} {status}\r\n']
+            out.extend(f'{name}: {value}\r\n' for name, value in headers)
+            if 'date' not in names:
+                out.append(f'Date: {formatdate(usegmt=True)}\r\n')
+            out.append(f'Server: {SERVER_SOFTWARE}\r\n')
+            if self.close_connection:
+                out.append('Connection: close\r\n')
+            out.append('\r\n')
+            self.wfile.write(''.join(out).encode('latin-1'))
+            state['sent'] = True
+
+        def write(data):
+            if not state['sent']:
+                send_headers()
+            if not data or self.command == 'HEAD':
+                return
+            if state['chunked']:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            else:
+                self.wfile.write(data)
+
+        result = None
+        try:
+            result = self.worker.app(environ, start_response)
+            if isinstance(result, FileWrapper) and hasattr(result.filelike, 'fileno') and self.command != 'HEAD':
+                send_headers()
+                if state['chunked']:
+                    for data in result:
+                        write(data)
+                else:
+                    self.wfile.flush()
+                    self.connection.sendfile(result.filelike)
+            else:
+                for data in result:
+                    write(data)
+            if not state['sent']:
+                send_headers()
+            if state['chunked']:
+                self.wfile.write(b'0\r\n\r\n')
+        except (socket.timeout, ConnectionError):
+            self.close_connection = True
+        except Exception:
+            self.close_connection = True
+            self.log_error('Ошибка приложения при запросе %r', self.requestline)
+            sys.excepthook(*sys.exc_info())
+            if not state['sent']:
+                state['status'] = '500 Internal Server Error'
+                state['headers'] = [('Content-Type', 'text/plain'), ('Content-Length', '21')]
+                write(b'Internal Server Error')
+        finally:
+            close = getattr(result, 'close', None)
+            if close is not None:
+                close()
+
+    def log_message(self, format, *args):
+        # журнал запросов ведёт приложение, ошибки пишутся в stderr
+        pass
+
+    def log_error(self, format, *args):
+        sys.stderr.write(f'[{os.getpid()}] {format % args}\n')
+
+
+class Worker:
+    """
+    Рабочий процесс: принимает соединения, пока есть свободный поток,
+    и обрабатывает их в пуле потоков. Остановка по SIGTERM - после
+    завершения начатых запросов.
+    """
+
+    def __init__(self, app, listener, threads=8, max_requests=0, keepalive_timeout=5, multiprocess=True,
+                 server_address=None):
+        self.app = app
+        self.listener = listener
+        self.server_address = server_address or listener.getsockname()
+        self.threads = threads
+        self.max_requests = max_requests
+        self.keepalive_timeout = keepalive_timeout
+        self.multiprocess = multiprocess
+        self.requests = 0
+        self.running = True
+        self._slots = threading.BoundedSemaphore(threads)
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        """ False, если после этого запроса соединение нужно закрыть """
+        with self._lock:
+            self.requests += 1
+            if self.max_requests and self.requests >= self.max_requests:
+                # процесс отработал своё: дообслуживает текущие запросы и завершается
+                self.running = False
+            return self.running
+
+    def stop(self, *args):
+        self.running = False
+
+    def handle_connection(self, connection, address):
+        try:
+            WSGIRequestHandler(connection, address, self)
+        except Exception:
+            sys.excepthook(*sys.exc_info())
+        finally:
+            try:
+                connection.close()
+            finally:
+                self._slots.release()
+
+    def serve(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self.listener, selectors.EVENT_READ)
+        executor = ThreadPoolExecutor(self.threads, thread_name_prefix='worker')
+        try:
+            while self.running:
+                # соединение принимается только при свободном потоке,
+                # остальные достаются другим процессам
+                if not self._slots.acquire(timeout=0.5):
+                    continue
+                accepted = False
+                try:
+                    if selector.select(timeout=0.5):
+                        connection, address = self.listener.accept()
+                        connection.setblocking(True)
+                        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                        executor.submit(self.handle_connection, connection, address)
+                        accepted = True
+                except (BlockingIOError, InterruptedError):
+                    pass
+                finally:
+                    if not accepted:
+                        self._slots.release()
+        finally:
+            selector.close()
+            executor.shutdown(wait=True)
+
+
+class Server:
+    """
+    Pre-fork мастер.
+    workers - число процессов (по умолчанию по числу ядер, 0 - без fork,
+    в текущем процессе), threads - потоков в процессе, max_requests - после
+    скольких запросов процесс перезапускается (0 - никогда).
+    worker_init() вызывается в каждом рабочем процессе после fork, до приёма
+    соединений: там открываются ресурсы, которые нельзя наследовать
+    (соединения с базой, фоновые потоки).
+    """
+
+    def __init__(self, app, host='', port=8000, workers=None, threads=8, max_requests=0, keepalive_timeout=5,
+                 graceful_timeout=30, reuse_port=False, backlog=1024, worker_init=None):
+        self.app = app
+        self.worker_init = worker_init
+        self.host = host
+        self.port = port
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.threads = threads
+        self.max_requests = max_requests
+        self.keepalive_timeout = keepalive_timeout
+        self.graceful_timeout = graceful_timeout
+        self.reuse_port = reuse_port and hasattr(socket, 'SO_REUSEPORT')
+        self.backlog = backlog
+        self.listener = None
+        self.children = {}
+        self.retiring = set()
+        self.running = True
+        self.reload_requested = False
+        # True в рабочем процессе после fork
+        self.is_worker = False
+
+    def run(self):
+        if not self.workers or not hasattr(os, 'fork'):
+            return self.run_single()
+        if not self.reuse_port:
+            self.listener = create_listener(self.host, self.port, self.backlog)
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+        for _ in range(self.workers):
+            self.spawn()
+        try:
+            while self.running:
+                sleep(0.5)
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.reload()
+                self.reap()
+        finally:
+            # SystemExit рабочего процесса доходит сюда через spawn(),
+            # останавливать остальные процессы должен только мастер
+            if not self.is_worker:
+                self.shutdown()
+
+    def run_single(self):
+        """ Без fork (Windows или workers=0): один процесс с пулом потоков """
+        listener = create_listener(self.host, self.port, self.backlog)
+        app = load_app(self.app)
+        worker = Worker(app, listener, self.threads, 0, self.keepalive_timeout, multiprocess=False)
+        signal.signal(signal.SIGTERM, worker.stop)
+        if self.worker_init is not None:
+            self.worker_init()
+        try:
+            worker.serve()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listener.close()
+            close_app(app)
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = monotonic()
+            return pid
+        # рабочий процесс
+        self.is_worker = True
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            listener = self.listener or create_listener(self.host, self.port, self.backlog, reuse_port=True)
+            app = load_app(self.app)
+            worker = Worker(app, listener, self.threads, self.max_requests, self.keepalive_timeout)
+            signal.signal(signal.SIGTERM, worker.stop)
+            if self.worker_init is not None:
+                self.worker_init()
+            worker.serve()
+            close_app(app)
+        except Exception:
+            sys.excepthook(*sys.exc_info())
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        # atexit нужен, чтобы фоновые очереди (лог, уведомления) дописались
+        sys.exit(exit_code)
+
+    def reap(self):
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            started = self.children.pop(pid, None)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+            if started is not None and self.running:
+                # процесс упал или отработал max_requests - запускаем замену;
+                # если он упал сразу после старта, не запускаем новые слишком часто
+                if monotonic() - started < 1:
+                    sleep(1)
+                self.spawn()
+
+    def reload(self):
+        """ Новые процессы запускаются до остановки старых, запросы не теряются """
+        old = [pid for pid in self.children if pid not in self.retiring]
+        for _ in old:
+            self.spawn()
+        for pid in old:
+            self.retiring.add(pid)
+            self.kill(pid, signal.SIGTERM)
+
+    def shutdown(self):
+        for pid in list(self.children):
+            self.kill(pid, signal.SIGTERM)
+        deadline = monotonic() + self.graceful_timeout
+        while self.children and monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self.children.pop(pid, None)
+            else:
+                sleep(0.1)
+        for pid in list(self.children):
+            self.kill(pid, signal.SIGKILL)
+        if self.listener is not None:
+            self.listener.close()
+
+    @staticmethod
+    def kill(pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def handle_stop(self, signum, frame):
+        self.running = False
+
+    def handle_reload(self, signum, frame):
+        self.reload_requested = True
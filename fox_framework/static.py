@@ -0,0 +1,326 @@
+""" Отдача статических файлов: file_wrapper, ETag, условные запросы и Range """
+import gzip
+import json
+import os
+import stat as stat_module
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from threading import Lock
+from time import monotonic
+
+from components.content_types import CONTENT_TYPES_MAP
+
+# Имя файла манифеста: логическое имя -> имя с хешем содержимого
+MANIFEST_NAME = 'manifest.json'
+# Расширения сжатых вариантов файлов в порядке предпочтения
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+COMPRESSIBLE_TYPES = (
+    'application/javascript', 'application/json', 'application/xml', 'application/xhtml+xml',
+    'application/atom+xml', 'application/rss+xml', 'image/svg+xml', 'image/x-icon',
+)
+
+
+def is_compressible(content_type):
+    return content_type.startswith('text/') or content_type in COMPRESSIBLE_TYPES
+
+
+def load_manifest(directory):
+    """ Манифест, записанный collectstatic.py, или пустой словарь """
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def accepted_encodings(header):
+    """ Кодировки из Accept-Encoding с ненулевым q """
+    result = set()
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        result.add(name)
+    return result
+
+
+class FileMeta:
+    """ Закэшированные сведения о файле: всё, что нужно для заголовков """
+    __slots__ = ('path', 'size', 'mtime', 'etag', 'last_modified', 'content_type', 'checked_at',
+                 'variants')
+
+    def __init__(self, path, stat, content_type):
+        self.path = path
+        # кодировка -> FileMeta заранее сжатого файла-соседа (.br, .gz)
+        self.variants = {}
+        self.size = stat.st_size
+        self.mtime = int(stat.st_mtime)
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.content_type = content_type
+        self.checked_at = monotonic()
+
+
+class StaticFiles:
+    """
+    WSGI-обработчик статики.
+    Метаданные файлов (размер, mtime, ETag) хранятся в LRU-кэше и
+    перепроверяются через stat не чаще раза в stat_ttl секунд
+    (stat_ttl=None - никогда, для боевого режима).
+    Тело отдаётся через environ['wsgi.file_wrapper'] (sendfile),
+    а если его нет или запрошен диапазон - генератором по кускам.
+    По Accept-Encoding выбирается заранее сжатый вариант (.br, .gz),
+    текстовые файлы без него сжимаются gzip на лету (до gzip_max_size байт).
+    Сжатые на лету тела хранятся в LRU-кэше общим размером не больше
+    gzip_cache_bytes; для боевого режима лучше собрать .gz заранее
+    (collectstatic.py), тогда на лету ничего не сжимается.
+    Файлы с хешем в имени (из манифеста) отдаются с Cache-Control: immutable,
+    сам манифест не отдаётся.
+    """
+
+    def __init__(self, directory, cache_size=256, stat_ttl=1.0, chunk_size=64 * 1024,
+                 content_types_map=CONTENT_TYPES_MAP, gzip_max_size=1024 * 1024, gzip_min_size=256,
+                 gzip_cache_bytes=8 * 1024 * 1024):
+        self.directory = os.path.realpath(directory)
+        self.manifest_path = os.path.join(self.directory, MANIFEST_NAME)
+        self.gzip_max_size = gzip_max_size
+        self.gzip_min_size = gzip_min_size
+        self.gzip_cache_bytes = gzip_cache_bytes
+        # (путь, ETag) -> тело, сжатое gzip на лету
+        self._gzip_cache = OrderedDict()
+        self._gzip_bytes = 0
+        # имена файлов с хешем содержимого
+        self.hashed_names = set(load_manifest(self.directory).values())
+        self.cache_size = cache_size
+        self.stat_ttl = stat_ttl
+        self.chunk_size = chunk_size
+        self.content_types_map = content_types_map
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    def get_content_type(self, file_path):
+        extension = os.path.splitext(file_path.lower())[1]
+        return self.content_types_map.get(extension, 'application/octet-stream')
+
+    def resolve_path(self, file_path):
+        full_path = os.path.normpath(os.path.join(self.directory, file_path))
+        # не выпускаем запрос за пределы папки со статикой
+        if not full_path.startswith(self.directory + os.sep):
+            return None
+        # манифест - служебный файл collectstatic, наружу не отдаётся
+        if full_path == self.manifest_path:
+            return None
+        return full_path
+
+    def get_meta(self, file_path):
+        with self._lock:
+            meta = self._cache.get(file_path)
+            if meta is not None:
+                self._cache.move_to_end(file_path)
+        if meta is not None and (self.stat_ttl is None or monotonic() - meta.checked_at < self.stat_ttl):
+            return meta
+
+        full_path = self.resolve_path(file_path)
+        if full_path is None:
+            return None
+        stat = self.stat_file(full_path)
+        if stat is None:
+            with self._lock:
+                self._cache.pop(file_path, None)
+            return None
+
+        content_type = self.get_content_type(file_path)
+        meta = FileMeta(full_path, stat, content_type)
+        if is_compressible(content_type):
+            for encoding, extension in ENCODINGS:
+                variant_stat = self.stat_file(full_path + extension)
+                if variant_stat is not None:
+                    meta.variants[encoding] = FileMeta(full_path + extension, variant_stat, content_type)
+        with self._lock:
+            self._cache[file_path] = meta
+            self._cache.move_to_end(file_path)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return meta
+
+    @staticmethod
+    def stat_file(full_path):
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            return None
+        return stat if stat_module.S_ISREG(stat.st_mode) else None
+
+    def choose_encoding(self, environ, meta):
+        """ Возвращает (кодировка, FileMeta варианта или None для сжатия на лету) """
+        if not is_compressible(meta.content_type):
+            return None, None
+        accepted = accepted_encodings(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if not accepted:
+            return None, None
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in meta.variants:
+                return encoding, meta.variants[encoding]
+        if 'gzip' in accepted and self.gzip_min_size <= meta.size <= self.gzip_max_size:
+            return 'gzip', None
+        return None, None
+
+    def get_gzip_body(self, meta):
+        key = (meta.path, meta.etag)
+        with self._lock:
+            body = self._gzip_cache.get(key)
+            if body is not None:
+                self._gzip_cache.move_to_end(key)
+                return body
+        with open(meta.path, 'rb') as f:
+            body = gzip.compress(f.read(), mtime=meta.mtime)
+        if len(body) > self.gzip_cache_bytes:
+            return body
+        with self._lock:
+            if key not in self._gzip_cache:
+                self._gzip_cache[key] = body
+                self._gzip_bytes += len(body)
+            while self._gzip_bytes > self.gzip_cache_bytes:
+                _, evicted = self._gzip_cache.popitem(last=False)
+                self._gzip_bytes -= len(evicted)
+        return body
+
+    @staticmethod
+    def is_not_modified(environ, meta, etag):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            if if_none_match.strip() == '*':
+                return True
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return any(tag.replace('W/', '', 1) == etag for tag in tags)
+        if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return meta.mtime <= since
+        return False
+
+    @staticmethod
+    def parse_range(header, size):
+        """
+        Разбор заголовка Range. Возвращает (начало, конец) включительно,
+        None - если заголовок нужно проигнорировать,
+        False - если диапазон невыполним (416).
+        Поддерживается только один диапазон.
+        """
+        unit, _, ranges = header.partition('=')
+        if unit.strip() != 'bytes' or ',' in ranges:
+            return None
+        start, sep, end = ranges.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if not start:
+                # bytes=-500 - последние 500 байт
+                length = int(end)
+                if length <= 0:
+                    return False
+                return max(size - length, 0), size - 1
+            start = int(start)
+            end = int(end) if end else size - 1
+        except ValueError:
+            return None
+        if start >= size or start > end:
+            return False
+        return start, min(end, size - 1)
+
+    def iter_file(self, file, length):
+        try:
+            remaining = length
+            while remaining > 0:
+                chunk = file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            file.close()
+
+    def __call__(self, environ, start_response, file_path):
+        method = environ['REQUEST_METHOD']
+        if method not in ('GET', 'HEAD'):
+            start_response('405 Method Not Allowed', [('Allow', 'GET, HEAD')])
+            return [b'']
+
+        meta = self.get_meta(file_path)
+        if meta is None:
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'404 File Not Found']
+
+        encoding, variant = self.choose_encoding(environ, meta)
+        etag = meta.etag if encoding is None else f'{meta.etag[:-1]}-{encoding}"'
+        headers = [
+            ('Content-Type', meta.content_type),
+            ('Last-Modified', meta.last_modified),
+            ('ETag', etag),
+        ]
+        if is_compressible(meta.content_type):
+            headers.append(('Vary', 'Accept-Encoding'))
+        if file_path in self.hashed_names:
+            headers.append(('Cache-Control', IMMUTABLE_CACHE_CONTROL))
+        if self.is_not_modified(environ, meta, etag):
+            start_response('304 Not Modified', headers[1:])
+            return [b'']
+
+        if encoding is not None:
+            # сжатые варианты отдаются целиком, без поддержки Range
+            headers.append(('Content-Encoding', encoding))
+            if variant is None:
+                body = self.get_gzip_body(meta)
+                headers.append(('Content-Length', str(len(body))))
+                start_response('200 OK', headers)
+                return [b''] if method == 'HEAD' else [body]
+            meta = variant
+
+        if encoding is None:
+            headers.append(('Accept-Ranges', 'bytes'))
+        status = '200 OK'
+        start, end = 0, meta.size - 1
+        range_header = environ.get('HTTP_RANGE')
+        if_range = environ.get('HTTP_IF_RANGE')
+        if range_header and encoding is None and (not if_range or if_range.strip() in (meta.etag, meta.last_modified)):
+            byte_range = self.parse_range(range_header, meta.size)
+            if byte_range is False:
+                start_response('416 Range Not Satisfiable', [('Content-Range', f'bytes */{meta.size}')])
+                return [b'']
+            if byte_range is not None:
+                start, end = byte_range
+                status = '206 Partial Content'
+                headers.append(('Content-Range', f'bytes {start}-{end}/{meta.size}'))
+
+        length = end - start + 1
+        headers.append(('Content-Length', str(length)))
+        if method == 'HEAD':
+            start_response(status, headers)
+            return [b'']
+
+        try:
+            file = open(meta.path, 'rb')
+        except OSError:
+            # файл удалён после того, как попал в кэш
+            with self._lock:
+                self._cache.pop(file_path, None)
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'404 File Not Found']
+        start_response(status, headers)
+        if status == '200 OK':
+            file_wrapper = environ.get('wsgi.file_wrapper')
+            if file_wrapper is not None:
+                return file_wrapper(file, self.chunk_size)
+            return self.iter_file(file, length)
+        file.seek(start)
+        return self.iter_file(file, length)
@@ -1,10 +1,86 @@
-from jinja2 import Environment, FileSystemLoader
+import os
+from threading import Lock
 
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+# Параметры кэша шаблонов, задаются фреймворком через configure()
+TEMPLATE_CACHE_SIZE = 400
+TEMPLATE_BYTECODE_CACHE_DIR = None
+TEMPLATE_AUTO_RELOAD = True
+# Манифест собранной статики: логическое имя -> имя с хешем
+STATIC_MANIFEST = {}
+
+# Реестр окружений Jinja2: (папка, static_url) -> Environment
+_environments = {}
+_environments_lock = Lock()
+
+
+class StaticUrl(str):
+    """
+    Глобальная переменная static в шаблонах.
+    {{ static }} выводит префикс, как и раньше,
+    {{ static('css/style.css') }} - адрес файла с хешем из манифеста.
+    """
+
+    def __new__(cls, prefix, manifest):
+        obj = super().__new__(cls, prefix)
+        obj.manifest = manifest
+        return obj
+
+    def __call__(self, name):
+        return f'{self}{self.manifest.get(name, name)}'
 
-def render(template_name, folder='templates', static_url='/static/', **kwargs):
 
-    env = Environment()
-    env.loader = FileSystemLoader(folder)
-    env.globals['static'] = static_url
-    template = env.get_template(template_name)
+def configure(cache_size=None, bytecode_cache_dir=None, auto_reload=None, static_manifest=None):
+    """ Настройка кэша шаблонов. Сбрасывает уже созданные окружения """
+    global TEMPLATE_CACHE_SIZE, TEMPLATE_BYTECODE_CACHE_DIR, TEMPLATE_AUTO_RELOAD, STATIC_MANIFEST
+    if cache_size is not None:
+        TEMPLATE_CACHE_SIZE = cache_size
+    if bytecode_cache_dir is not None:
+        TEMPLATE_BYTECODE_CACHE_DIR = bytecode_cache_dir
+    if auto_reload is not None:
+        TEMPLATE_AUTO_RELOAD = auto_reload
+    if static_manifest is not None:
+        STATIC_MANIFEST = static_manifest
+    with _environments_lock:
+        _environments.clear()
+
+
+def get_environment(folder='templates', static_url='/static/'):
+    """
+    Возвращает окружение Jinja2 для пары (папка, static_url).
+    Окружение создаётся один раз на процесс, скомпилированные шаблоны
+    хранятся в его LRU-кэше (cache_size), а при заданной папке
+    TEMPLATE_BYTECODE_CACHE_DIR байткод сохраняется и на диск.
+    При auto_reload=False (боевой режим) mtime файлов не проверяется.
+    """
+    key = (folder, static_url)
+    env = _environments.get(key)
+    if env is None:
+        with _environments_lock:
+            env = _environments.get(key)
+            if env is None:
+                bytecode_cache = None
+                if TEMPLATE_BYTECODE_CACHE_DIR:
+                    os.makedirs(TEMPLATE_BYTECODE_CACHE_DIR, exist_ok=True)
+                    bytecode_cache = FileSystemBytecodeCache(TEMPLATE_BYTECODE_CACHE_DIR)
+                env = Environment(
+                    loader=FileSystemLoader(folder),
+                    cache_size=TEMPLATE_CACHE_SIZE,
+                    auto_reload=TEMPLATE_AUTO_RELOAD,
+                    bytecode_cache=bytecode_cache,
+                )
+                env.globals['static'] = StaticUrl(static_url, STATIC_MANIFEST)
+                _environments[key] = env
+    return env
+
+
+def render(template_name, folder='templates', static_url='/static/', **kwargs):
+    template = get_environment(folder, static_url).get_template(template_name)
     return template.render(**kwargs)
+
+
+def render_stream(template_name, folder='templates', static_url='/static/', **kwargs):
+    """ Генератор частей страницы для StreamingResponse """
+    template = get_environment(folder, static_url).get_template(template_name)
+    return template.generate(**kwargs)
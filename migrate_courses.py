@@ -0,0 +1,11 @@
+""" Перенос курсов в таблицу course (см. migrate_courses.sql), после него COURSE_SINGLE_TABLE = True """
+import sqlite3
+from components.settings import DATABASE
+
+con = sqlite3.connect(DATABASE)
+cur = con.cursor()
+with open('migrate_courses.sql', 'r') as f:
+    text = f.read()
+cur.executescript(text)
+cur.close()
+con.close()
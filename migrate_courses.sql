@@ -0,0 +1,63 @@
+-- Перенос курсов в одну таблицу course с колонкой type.
+-- online_course и offline_course становятся представлениями над course
+-- с триггерами INSTEAD OF, поэтому мапперы типов и таблицы записей
+-- студентов продолжают работать. id оффлайн курсов сдвигаются
+-- за максимальный id онлайн курсов, ссылки в student_offlinecourse
+-- обновляются вместе с ними.
+PRAGMA foreign_keys = off;
+BEGIN TRANSACTION;
+
+CREATE TABLE course
+(
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL UNIQUE,
+    type VARCHAR (16) NOT NULL,
+    category_id INT UNSIGNED NOT NULL,
+    name VARCHAR (32)
+);
+
+CREATE TEMP TABLE course_id_shift AS SELECT IFNULL(MAX(id), 0) AS value FROM online_course;
+
+INSERT INTO course (id, type, category_id, name)
+    SELECT id, 'online', category_id, name FROM online_course;
+INSERT INTO course (id, type, category_id, name)
+    SELECT id + (SELECT value FROM course_id_shift), 'offline', category_id, name FROM offline_course;
+UPDATE student_offlinecourse SET course_id = course_id + (SELECT value FROM course_id_shift);
+
+DROP TABLE course_id_shift;
+DROP TABLE online_course;
+DROP TABLE offline_course;
+
+CREATE INDEX course_category_id_type ON course (category_id, type);
+CREATE INDEX course_type_name ON course (type, name);
+
+CREATE VIEW online_course AS SELECT id, category_id, name FROM course WHERE type = 'online';
+CREATE VIEW offline_course AS SELECT id, category_id, name FROM course WHERE type = 'offline';
+
+CREATE TRIGGER online_course_insert INSTEAD OF INSERT ON online_course
+BEGIN
+    INSERT INTO course (id, type, category_id, name) VALUES (NEW.id, 'online', NEW.category_id, NEW.name);
+END;
+CREATE TRIGGER online_course_update INSTEAD OF UPDATE ON online_course
+BEGIN
+    UPDATE course SET category_id = NEW.category_id, name = NEW.name WHERE id = OLD.id;
+END;
+CREATE TRIGGER online_course_delete INSTEAD OF DELETE ON online_course
+BEGIN
+    DELETE FROM course WHERE id = OLD.id;
+END;
+
+CREATE TRIGGER offline_course_insert INSTEAD OF INSERT ON offline_course
+BEGIN
+    INSERT INTO course (id, type, category_id, name) VALUES (NEW.id, 'offline', NEW.category_id, NEW.name);
+END;
+CREATE TRIGGER offline_course_update INSTEAD OF UPDATE ON offline_course
+BEGIN
+    UPDATE course SET category_id = NEW.category_id, name = NEW.name WHERE id = OLD.id;
+END;
+CREATE TRIGGER offline_course_delete INSTEAD OF DELETE ON offline_course
+BEGIN
+    DELETE FROM course WHERE id = OLD.id;
+END;
+
+COMMIT TRANSACTION;
+PRAGMA foreign_keys = on;
@@ -1,17 +1,92 @@
+import keyword
+import re
 import threading
 from abc import ABCMeta, abstractmethod
+from collections import namedtuple
+from contextvars import ContextVar
+from time import perf_counter
+from types import MemberDescriptorType
+
+
+class CommitStats:
+    """ Статистика последнего commit: строки, SQL-запросы, время в секундах """
+    __slots__ = ('rows', 'statements', 'elapsed')
+
+    def __init__(self):
+        self.rows = 0
+        self.statements = 0
+        self.elapsed = 0.0
+
+    def __repr__(self):
+        return f'<CommitStats rows={self.rows} statements={self.statements} elapsed={self.elapsed * 1000:.3f} ms>'
+
+
+class IdentityMap:
+    """
+    Паттерн IDENTITY MAP
+    Один объект на строку (таблица, id) в пределах единицы работы:
+    повторная загрузка той же строки возвращает уже созданный объект,
+    а get_by_id по известному id не обращается к базе.
+    hits - сколько раз объект взят из карты, misses - сколько объектов
+    собрано из строк базы; промах поиска перед запросом не считается,
+    его посчитает add после загрузки строки.
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, tablename, id):
+        object = self.objects.get((tablename, id))
+        if object is not None:
+            self.hits += 1
+        return object
+
+    def add(self, tablename, id, object):
+        self.misses += 1
+        self.objects[(tablename, id)] = object
+
+    def remove(self, tablename, id):
+        self.objects.pop((tablename, id), None)
+
+    def clear(self):
+        self.objects.clear()
+
+    def __len__(self):
+        return len(self.objects)
 
 
 class UnitOfWork:
     """
     Паттерн UNIT OF WORK
+    Создаётся на каждый запрос, вместе с ней начинается
+    и новая карта присутствия (identity_map)
     """
-    current = threading.local()
+    # своя для потока и для задачи asyncio
+    current = ContextVar('unit_of_work', default=None)
+    # функции, которые получают множество изменённых таблиц после commit
+    commit_listeners = []
 
     def __init__(self):
         self.new_objects = []
         self.dirty_objects = []
         self.removed_objects = []
+        self.changed_tables = set()
+        self.last_commit_stats = None
+        self.identity_map = IdentityMap()
+        # функции f(connection), выполняемые внутри транзакции commit, и функции после фиксации
+        self.transaction_hooks = []
+        self.after_commit_hooks = []
+
+    @classmethod
+    def add_commit_listener(cls, listener):
+        cls.commit_listeners.append(listener)
+
+    @classmethod
+    def remove_commit_listener(cls, listener):
+        if listener in cls.commit_listeners:
+            cls.commit_listeners.remove(listener)
 
     def set_mapper_registry(self, MapperRegistry):
         self.MapperRegistry = MapperRegistry
@@ -25,30 +100,98 @@ class UnitOfWork:
     def register_removed(self, object):
         self.removed_objects.append(object)
 
-    def commit(self):
-        self.insert_new()
-        self.update_dirty()
-        self.delete_removed()
+    def has_changes(self):
+        return bool(self.new_objects or self.dirty_objects or self.removed_objects)
 
-    def insert_new(self):
-        for object in self.new_objects:
-            self.MapperRegistry.get_mapper(object['object']).insert(
-                **object['schema'])
+    def on_commit(self, in_transaction, after_commit=None):
+        """
+        in_transaction(connection) выполнится в транзакции ближайшего commit
+        вместе с изменениями объектов, after_commit() - после её фиксации
+        """
+        self.transaction_hooks.append(in_transaction)
+        if after_commit is not None:
+            self.after_commit_hooks.append(after_commit)
 
+    def commit(self):
+        """
+        Записывает все изменения одной транзакцией: объекты группируются
+        по мапперу и набору полей, каждая группа - один executemany.
+        При ошибке транзакция откатывается, списки объектов сохраняются.
+        """
+        if not (self.has_changes() or self.transaction_hooks):
+            return
+        stats = CommitStats()
+        time_start = perf_counter()
+        with self.MapperRegistry.connection_pool.connection() as connection:
+            try:
+                connection.execute('BEGIN')
+                self.insert_new(connection, stats)
+                self.update_dirty(connection, stats)
+                self.delete_removed(connection, stats)
+                for hook in self.transaction_hooks:
+                    hook(connection)
+                connection.commit()
+            except Exception as e:
+                connection.rollback()
+                self.changed_tables.clear()
+                raise DbCommitException(e.args)
+        stats.elapsed = perf_counter() - time_start
+        self.last_commit_stats = stats
         self.new_objects.clear()
-
-    def update_dirty(self):
-        for object in self.dirty_objects:
-            self.MapperRegistry.get_mapper(object['object']).insert(
-                object['object'], **object['schema'])
-
         self.dirty_objects.clear()
-
-    def delete_removed(self):
-        for object in self.removed_objects:
-            self.MapperRegistry.get_mapper(object).delete(object)
-
         self.removed_objects.clear()
+        self.transaction_hooks.clear()
+        after_commit_hooks, self.after_commit_hooks = self.after_commit_hooks, []
+
+        changed_tables, self.changed_tables = self.changed_tables, set()
+        for listener in self.commit_listeners:
+            listener(changed_tables)
+        for hook in after_commit_hooks:
+            hook()
+
+    async def acommit(self):
+        """ commit() для async-контроллеров: транзакция выполняется в потоке базы, цикл событий не ждёт """
+        await self.MapperRegistry.db_executor.run(self.commit)
+
+    def group_by_mapper(self, objects, get_object, get_fields):
+        """ {(маппер, поля): [элементы]} с сохранением порядка регистрации """
+        groups = {}
+        for item in objects:
+            mapper = self.MapperRegistry.get_mapper(get_object(item))
+            groups.setdefault((mapper, get_fields(item)), []).append(item)
+        return groups
+
+    def insert_new(self, connection, stats):
+        groups = self.group_by_mapper(self.new_objects, lambda item: item['object'],
+                                      lambda item: tuple(item['schema']))
+        for (mapper, fields), items in groups.items():
+            self.changed_tables.add(mapper.tablename)
+            mapper.insert_many(connection, fields, [tuple(item['schema'].values()) for item in items])
+            stats.rows += len(items)
+            stats.statements += 1
+
+    def update_dirty(self, connection, stats):
+        groups = self.group_by_mapper(self.dirty_objects, lambda item: item['object'],
+                                      lambda item: tuple(item['schema']))
+        for (mapper, fields), items in groups.items():
+            self.changed_tables.add(mapper.tablename)
+            mapper.update_many(connection, fields,
+                               [(*item['schema'].values(), item['object'].id) for item in items])
+            # при следующем чтении строки загрузятся из базы заново
+            for item in items:
+                self.identity_map.remove(mapper.tablename, item['object'].id)
+            stats.rows += len(items)
+            stats.statements += 1
+
+    def delete_removed(self, connection, stats):
+        groups = self.group_by_mapper(self.removed_objects, lambda item: item, lambda item: None)
+        for (mapper, _), items in groups.items():
+            self.changed_tables.add(mapper.tablename)
+            mapper.delete_many(connection, [item.id for item in items])
+            for item in items:
+                self.identity_map.remove(mapper.tablename, item.id)
+            stats.rows += len(items)
+            stats.statements += 1
 
     @staticmethod
     def new_current():
@@ -56,14 +199,21 @@ class UnitOfWork:
 
     @classmethod
     def set_current(cls, unit_of_work):
-        cls.current.unit_of_work = unit_of_work
+        cls.current.set(unit_of_work)
 
     @classmethod
     def get_current(cls):
-        return cls.current.unit_of_work
+        return cls.current.get()
+
+    @classmethod
+    def get_identity_map(cls):
+        """ Карта присутствия текущей единицы работы или None """
+        unit_of_work = cls.current.get()
+        return unit_of_work.identity_map if unit_of_work is not None else None
 
 
 class DomainObject:
+    __slots__ = ()
 
     def mark_new(self, schema):
         UnitOfWork.get_current().register_new(self, schema)
@@ -75,12 +225,78 @@ class DomainObject:
         UnitOfWork.get_current().register_removed(self)
 
 
+class RowFactory:
+    """
+    Сборка объектов модели прямо из кортежей строк.
+    Для каждого набора колонок один раз генерируется функция вида
+        def build(row):
+            object = new(model)
+            object.id, object.name = row
+            return object
+    минуя __init__ и промежуточный словарь на каждую строку.
+    """
+    builders = {}
+    value_types = {}
+    lock = threading.Lock()
+
+    @staticmethod
+    def can_assign(model, columns):
+        return all(name.isidentifier() and not keyword.iskeyword(name) and
+                   isinstance(getattr(model, name, None), MemberDescriptorType)
+                   for name in columns)
+
+    @classmethod
+    def get_builder(cls, model, columns):
+        key = (model, columns)
+        builder = cls.builders.get(key)
+        if builder is None:
+            builder = cls.make_builder(model, columns)
+            with cls.lock:
+                cls.builders[key] = builder
+        return builder
+
+    @classmethod
+    def make_builder(cls, model, columns):
+        if not cls.can_assign(model, columns):
+            # колонки без слотов в модели - через обычный конструктор
+            return lambda row: model(**dict(zip(columns, row)))
+        targets = ', '.join(f'object.{name}' for name in columns)
+        source = (
+            'def build(row):\n'
+            '    object = new(model)\n'
+            f'    {targets}, = row\n'
+            '    return object\n'
+        )
+        namespace = {'new': object.__new__, 'model': model}
+        exec(source, namespace)
+        return namespace['build']
+
+    @classmethod
+    def get_value_type(cls, tablename, columns):
+        """ namedtuple для строк таблицы в режиме values() """
+        key = (tablename, columns)
+        value_type = cls.value_types.get(key)
+        if value_type is None:
+            value_type = namedtuple(f'{tablename}_row', columns, rename=True)
+            with cls.lock:
+                cls.value_types[key] = value_type
+        return value_type
+
+
 class BaseMapper(metaclass=ABCMeta):
     """Преобразователь данных (Data Mapper)"""
 
-    def __init__(self, connection) -> None:
-        self.connection = connection
-        self.cursor = connection.cursor()
+    # связи записи с объектами других мапперов: {'имя': Relation(...)}
+    relations = {}
+    # значений в одном IN (...): SQLite ограничивает число параметров запроса
+    in_batch_size = 900
+    # колонки, однозначно определяющие строку (выборка порциями в iter_all)
+    key_columns = ('id',)
+
+    def __init__(self, pool) -> None:
+        # соединение берётся из пула на время операции
+        self.pool = pool
+        self._columns = None
 
     @property
     @abstractmethod
@@ -92,51 +308,417 @@ class BaseMapper(metaclass=ABCMeta):
     def model(self):
         pass
 
+    @property
+    def source(self):
+        """ Откуда читаются строки в SELECT: таблица или подзапрос """
+        return self.tablename
+
+    def get_builder(self, column_names):
+        """ Функция row -> объект модели для набора колонок """
+        return RowFactory.get_builder(self.model, column_names)
+
+    def get_columns(self, connection):
+        """ Колонки источника, читаются из базы один раз """
+        if self._columns is None:
+            cursor = connection.execute(f'SELECT * FROM {self.source} LIMIT 0')
+            self._columns = tuple(description_info[0] for description_info in cursor.description)
+        return self._columns
+
     def all(self):
-        statement = f'SELECT * from {self.tablename}'
-        self.cursor.execute(statement)
-        column_names = [description_info[0] for description_info in self.cursor.description]
+        statement = f'SELECT * from {self.source}'
+        with self.pool.connection() as connection:
+            return self.materialize(connection.execute(statement))
+
+    def materialize(self, cursor):
+        """ Объекты модели из строк курсора, уже загруженные берутся из карты присутствия """
+        column_names = tuple(description_info[0] for description_info in cursor.description)
+        return self.build_objects(column_names, cursor.fetchall())
+
+    def build_objects(self, column_names, rows):
+        build = self.get_builder(column_names)
+        identity_map = UnitOfWork.get_identity_map()
+        if identity_map is None or 'id' not in column_names:
+            return list(map(build, rows))
+
+        id_index = column_names.index('id')
+        tablename = self.tablename
         result = []
-
-        for values in self.cursor.fetchall():
-            object = self.model(**{column_names[i]: values[i] for i, _ in enumerate(values)})
+        for values in rows:
+            object = identity_map.get(tablename, values[id_index])
+            if object is None:
+                object = build(values)
+                identity_map.add(tablename, values[id_index], object)
             result.append(object)
         return result
 
+    def iter_all(self, batch_size=500, order_by=None, **criteria):
+        """
+        Генератор объектов, строки читаются порциями по batch_size по ключу:
+        каждая порция - запрос строк после последней прочитанной в порядке
+        order_by (к нему добавляются key_columns), без OFFSET.
+        Соединение берётся из пула только на время запроса порции, поэтому
+        медленный клиент потокового ответа не держит соединение.
+        Память не зависит от размера таблицы: объекты не попадают
+        в карту присутствия и не копятся в списке.
+        Колонки order_by не должны содержать NULL.
+        """
+        order = [order_by] if isinstance(order_by, str) else list(order_by or ())
+        ordered = {column.lstrip('-') for column in order}
+        order += [column for column in self.key_columns if column not in ordered]
+        columns = [(self.check_column(column.lstrip('-')), column.startswith('-')) for column in order]
+        where, params = self.where(criteria)
+        order_sql = self.order(order)
+        last = None
+        while True:
+            batch_where, batch_params = where, list(params)
+            if last is not None:
+                condition, values = self.after(columns, last)
+                batch_where = f'{where} AND ({condition})' if where else f' WHERE {condition}'
+                batch_params.extend(values)
+            statement = f'SELECT * FROM {self.source}{batch_where}{order_sql} LIMIT ?'
+            with self.pool.connection() as connection:
+                cursor = connection.execute(statement, (*batch_params, batch_size))
+                column_names = tuple(description_info[0] for description_info in cursor.description)
+                rows = cursor.fetchall()
+            yield from map(self.get_builder(column_names), rows)
+            if len(rows) < batch_size:
+                return
+            last = [rows[-1][column_names.index(name)] for name, _ in columns]
+
+    @staticmethod
+    def after(columns, values):
+        """
+        Условие "строка после values" для сортировки по columns [(колонка, по убыванию)]:
+        a > ? OR (a = ? AND b > ?) ...
+        """
+        conditions, params = [], []
+        for index, (name, descending) in enumerate(columns):
+            parts = [f'{previous} = ?' for previous, _ in columns[:index]]
+            parts.append(f"{name} {'<' if descending else '>'} ?")
+            conditions.append(' AND '.join(parts))
+            params.extend(values[:index + 1])
+        return ' OR '.join(f'({condition})' for condition in conditions), params
+
+    def values(self, order_by=None, **criteria):
+        """
+        Строки как namedtuple, без объектов модели и карты присутствия -
+        для списков только на чтение
+        """
+        where, params = self.where(criteria)
+        statement = f'SELECT * FROM {self.source}{where}{self.order(order_by)}'
+        with self.pool.connection() as connection:
+            cursor = connection.execute(statement, params)
+            value_type = RowFactory.get_value_type(
+                self.tablename, tuple(description_info[0] for description_info in cursor.description))
+            return list(map(value_type._make, cursor.fetchall()))
+
+    # операторы для условий filter(): name__in=[...], id__gt=10
+    operators = {
+        'eq': '=',
+        'ne': '!=',
+        'gt': '>',
+        'gte': '>=',
+        'lt': '<',
+        'lte': '<=',
+    }
+    column_name = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+    def check_column(self, name):
+        if not self.column_name.match(name):
+            raise ValueError(f'Invalid column name: {name}')
+        return name
+
+    def where(self, criteria, alias=None):
+        """ Условие WHERE и параметры для запроса по criteria; alias - имя таблицы в запросе с JOIN """
+        conditions, params = [], []
+        for key, value in criteria.items():
+            column, _, operator = key.partition('__')
+            column = self.check_column(column)
+            if alias:
+                column = f'{alias}.{column}'
+            if operator == 'in':
+                values = list(value)
+                if not values:
+                    conditions.append('0')
+                    continue
+                conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+            elif value is None and operator in ('', 'eq'):
+                conditions.append(f'{column} IS NULL')
+            else:
+                conditions.append(f'{column} {self.operators[operator or "eq"]} ?')
+                params.append(value)
+        if not conditions:
+            return '', params
+        return ' WHERE ' + ' AND '.join(conditions), params
+
+    def order(self, order_by, alias=None):
+        """ 'name' - по возрастанию, '-name' - по убыванию """
+        if not order_by:
+            return ''
+        prefix = f'{alias}.' if alias else ''
+        columns = []
+        for column in ([order_by] if isinstance(order_by, str) else order_by):
+            direction = ' DESC' if column.startswith('-') else ''
+            columns.append(prefix + self.check_column(column.lstrip('-')) + direction)
+        return ' ORDER BY ' + ', '.join(columns)
+
+    def filter(self, order_by=None, limit=None, offset=0, **criteria):
+        """ Объекты, подходящие под условия, отбор и страница (limit, offset) - на стороне базы """
+        where, params = self.where(criteria)
+        statement = f'SELECT * FROM {self.source}{where}{self.order(order_by)}'
+        if limit is not None:
+            statement += ' LIMIT ? OFFSET ?'
+            params.extend((limit, offset))
+        with self.pool.connection() as connection:
+            return self.materialize(connection.execute(statement, params))
+
+    def get_by(self, **criteria):
+        """ Первый объект, подходящий под условия """
+        where, params = self.where(criteria)
+        statement = f'SELECT * FROM {self.source}{where} LIMIT 1'
+        with self.pool.connection() as connection:
+            result = self.materialize(connection.execute(statement, params))
+        if not result:
+            raise RecordNotFoundException(f'Record with {criteria} not found')
+        return result[0]
+
+    def count(self, **criteria):
+        where, params = self.where(criteria)
+        statement = f'SELECT COUNT(*) FROM {self.source}{where}'
+        with self.pool.connection() as connection:
+            return connection.execute(statement, params).fetchone()[0]
+
+    def exists(self, **criteria):
+        where, params = self.where(criteria)
+        statement = f'SELECT EXISTS(SELECT 1 FROM {self.source}{where})'
+        with self.pool.connection() as connection:
+            return bool(connection.execute(statement, params).fetchone()[0])
+
+    def paginate(self, limit, offset=0, after_id=None, **criteria):
+        """
+        Страница объектов в порядке id.
+        after_id - постраничный вывод по ключу: объекты с id больше
+        последнего показанного, без затрат OFFSET на пропуск строк
+        """
+        if after_id is not None:
+            criteria['id__gt'] = after_id
+            offset = 0
+        where, params = self.where(criteria)
+        statement = f'SELECT * FROM {self.source}{where} ORDER BY id LIMIT ? OFFSET ?'
+        with self.pool.connection() as connection:
+            return self.materialize(connection.execute(statement, (*params, limit, offset)))
+
+    def select_related(self, *names, order_by=None, **criteria):
+        """
+        Записи вместе со связанными объектами одним запросом с LEFT JOIN:
+        links = mapper.select_related('student', 'course', course_id=1)
+        links[0].student, links[0].course - объекты своих моделей (None, если строки нет)
+        """
+        joined = []
+        with self.pool.connection() as connection:
+            columns = self.get_columns(connection)
+            selects = [f't.{column}' for column in columns]
+            joins = []
+            for index, name in enumerate(names):
+                relation = self.relations[name]
+                mapper = relation.get_mapper(self.pool)
+                related_columns = mapper.get_columns(connection)
+                alias = f'r{index}'
+                selects.extend(f'{alias}.{column}' for column in related_columns)
+                joins.append(f' LEFT JOIN {mapper.source} AS {alias} ON {alias}.id = t.{relation.foreign_key}')
+                joined.append((name, mapper, related_columns))
+            where, params = self.where(criteria, alias='t')
+            statement = (f"SELECT {', '.join(selects)} FROM {self.source} AS t"
+                         f"{''.join(joins)}{where}{self.order(order_by, alias='t')}")
+            rows = connection.execute(statement, params).fetchall()
+
+        start = len(columns)
+        objects = self.build_objects(columns, [row[:start] for row in rows])
+        for name, mapper, related_columns in joined:
+            end = start + len(related_columns)
+            id_index = start + related_columns.index('id')
+            related = iter(mapper.build_objects(
+                related_columns, [row[start:end] for row in rows if row[id_index] is not None]))
+            for object, row in zip(objects, rows):
+                setattr(object, name, next(related) if row[id_index] is not None else None)
+            start = end
+        return objects
+
+    def prefetch_related(self, objects, *names):
+        """
+        Связанные объекты для уже загруженных записей: один запрос
+        WHERE id IN (...) на связь (по in_batch_size значений в запросе)
+        """
+        for name in names:
+            relation = self.relations[name]
+            mapper = relation.get_mapper(self.pool)
+            ids = list({getattr(object, relation.foreign_key) for object in objects} - {None})
+            related = {}
+            for start in range(0, len(ids), self.in_batch_size):
+                for item in mapper.filter(id__in=ids[start:start + self.in_batch_size]):
+                    related[item.id] = item
+            for object in objects:
+                setattr(object, name, related.get(getattr(object, relation.foreign_key)))
+        return objects
+
+    def related(self, name, order_by=None, **criteria):
+        """
+        Связанные объекты записей, подходящих под условия, одним запросом:
+        студенты курса - related('student', course_id=1),
+        курсы студента - related('course', student_id=1)
+        """
+        relation = self.relations[name]
+        mapper = relation.get_mapper(self.pool)
+        where, params = self.where(criteria, alias='t')
+        statement = (f'SELECT r.* FROM {mapper.source} AS r WHERE r.id IN '
+                     f'(SELECT t.{relation.foreign_key} FROM {self.source} AS t{where})'
+                     f"{mapper.order(order_by, alias='r')}")
+        with self.pool.connection() as connection:
+            return mapper.materialize(connection.execute(statement, params))
+
     def insert(self, **schema):
         statement = f"INSERT INTO {self.tablename} ({','.join(schema.keys())}) VALUES ({str('?, ' * len(schema.keys()))[:-2]})"
-        self.cursor.execute(statement, tuple(schema.values()))
-        try:
-            self.connection.commit()
-        except Exception as e:
-            raise DbCommitException(e.args)
+        with self.pool.connection() as connection:
+            connection.execute(statement, tuple(schema.values()))
+            try:
+                connection.commit()
+            except Exception as e:
+                raise DbCommitException(e.args)
 
     def update(self, object, **schema):
-        schema = {str(key) + '=?': value for key, value in schema.items()}
-        statement = f"UPDATE {self.tablename} SET {','.join(schema.keys())} WHERE id=?"
-        self.cursor.execute(statement, (','.join(schema.values()), object.id))
-        try:
-            self.connection.commit()
-        except Exception as e:
-            raise DbUpdateException(e.args)
+        statement = f"UPDATE {self.tablename} SET {','.join(f'{key}=?' for key in schema)} WHERE id=?"
+        with self.pool.connection() as connection:
+            connection.execute(statement, (*schema.values(), object.id))
+            try:
+                connection.commit()
+            except Exception as e:
+                raise DbUpdateException(e.args)
 
     def delete(self, object):
         statement = f"DELETE FROM {self.tablename} WHERE id=?"
-        self.cursor.execute(statement, (object.id,))
-        try:
-            self.connection.commit()
-        except Exception as e:
-            raise DbDeleteException(e.args)
+        with self.pool.connection() as connection:
+            connection.execute(statement, (object.id,))
+            try:
+                connection.commit()
+            except Exception as e:
+                raise DbDeleteException(e.args)
+
+    # Пакетные операции для UnitOfWork.commit: выполняются в открытой
+    # транзакции переданного соединения и не фиксируют её сами
+    def insert_many(self, connection, fields, rows):
+        statement = f"INSERT INTO {self.tablename} ({','.join(fields)}) VALUES ({', '.join('?' * len(fields))})"
+        connection.executemany(statement, rows)
+
+    def update_many(self, connection, fields, rows):
+        """ rows: кортежи значений полей, последним идёт id """
+        statement = f"UPDATE {self.tablename} SET {','.join(f'{key}=?' for key in fields)} WHERE id=?"
+        connection.executemany(statement, rows)
+
+    def delete_many(self, connection, ids):
+        statement = f"DELETE FROM {self.tablename} WHERE id=?"
+        connection.executemany(statement, [(id,) for id in ids])
+
+    def get_cached(self, id):
+        """ Объект из карты присутствия текущей единицы работы или None """
+        identity_map = UnitOfWork.get_identity_map()
+        return identity_map.get(self.tablename, id) if identity_map is not None else None
 
     def get_by_id(self, id):
-        statement = f"SELECT * FROM {self.tablename} WHERE id=?"
-        self.cursor.execute(statement, (id,))
-        result = self.cursor.fetchone()
-        try:
-            id, name = result
-            return self.model(id=id, name=name)
-        except Exception as e:
+        object = self.get_cached(id)
+        if object is not None:
+            return object
+        statement = f"SELECT * FROM {self.source} WHERE id=?"
+        with self.pool.connection() as connection:
+            result = self.materialize(connection.execute(statement, (id,)))
+        if not result:
             raise RecordNotFoundException(f'Record with id={id} not found')
+        return result[0]
+
+
+class Relation:
+    """
+    Связь записи с объектом другого маппера по внешнему ключу:
+    relations = {'student': Relation('student_id', StudentMapper)}
+    """
+
+    def __init__(self, foreign_key, mapper):
+        self.foreign_key = foreign_key
+        self.mapper = mapper
+        self._instance = None
+
+    def get_mapper(self, pool):
+        # мапперы не хранят состояния, экземпляр создаётся один раз на пул
+        if self._instance is None or self._instance.pool is not pool:
+            self._instance = self.mapper(pool)
+        return self._instance
+
+
+class AsyncBaseMapper:
+    """
+    Асинхронный доступ к обычному мапперу: те же запросы выполняются
+    в потоке базы (DbExecutor), а async-контроллер тем временем отдаёт
+    цикл событий другим запросам. Получается через
+    MapperRegistry.get_async_mapper(name), отдельных классов мапперов не нужно.
+    """
+
+    def __init__(self, mapper, executor):
+        self.mapper = mapper
+        self.executor = executor
+
+    @property
+    def tablename(self):
+        return self.mapper.tablename
+
+    @property
+    def model(self):
+        return self.mapper.model
+
+    async def all(self):
+        return await self.executor.run(self.mapper.all)
+
+    async def filter(self, order_by=None, limit=None, offset=0, **criteria):
+        return await self.executor.run(self.mapper.filter, order_by, limit, offset, **criteria)
+
+    async def get_by(self, **criteria):
+        return await self.executor.run(self.mapper.get_by, **criteria)
+
+    async def get_by_id(self, *key):
+        # объект из карты присутствия отдаётся без перехода в поток базы
+        object = self.mapper.get_cached(*key)
+        if object is not None:
+            return object
+        return await self.executor.run(self.mapper.get_by_id, *key)
+
+    async def count(self, **criteria):
+        return await self.executor.run(self.mapper.count, **criteria)
+
+    async def exists(self, **criteria):
+        return await self.executor.run(self.mapper.exists, **criteria)
+
+    async def paginate(self, limit, offset=0, after_id=None, **criteria):
+        return await self.executor.run(self.mapper.paginate, limit, offset, after_id, **criteria)
+
+    async def values(self, order_by=None, **criteria):
+        return await self.executor.run(self.mapper.values, order_by, **criteria)
+
+    async def select_related(self, *names, order_by=None, **criteria):
+        return await self.executor.run(self.mapper.select_related, *names, order_by=order_by, **criteria)
+
+    async def prefetch_related(self, objects, *names):
+        return await self.executor.run(self.mapper.prefetch_related, objects, *names)
+
+    async def related(self, name, order_by=None, **criteria):
+        return await self.executor.run(self.mapper.related, name, order_by, **criteria)
+
+    async def insert(self, **schema):
+        return await self.executor.run(self.mapper.insert, **schema)
+
+    async def update(self, object, **schema):
+        return await self.executor.run(self.mapper.update, object, **schema)
+
+    async def delete(self, object):
+        return await self.executor.run(self.mapper.delete, object)
 
 
 class DbCommitException(Exception):
@@ -1,11 +1,39 @@
+import atexit
+import json
+import os
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from heapq import heappop, heappush
+from itertools import islice
+from queue import Empty, Queue
+from threading import Lock, Thread
+from time import monotonic, perf_counter, time
+from uuid import uuid4
+
 from jsonpickle import dumps, loads
 
-from fox_framework.templator import render
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from fox_framework.response import StreamingResponse
+from fox_framework.templator import render, render_stream
+from patterns.architectural_system_patterns import UnitOfWork
 
 
 # Шаблонный метод
 class TemplateView:
     template_name = 'template.html'
+    # отдавать страницу по частям, не дожидаясь рендера целиком
+    streaming = False
 
     def get_context_data(self):
         return {}
@@ -16,6 +44,8 @@ class TemplateView:
     def render_template_with_context(self):
         template_name = self.get_template()
         context = self.get_context_data()
+        if self.streaming:
+            return StreamingResponse(render_stream(template_name, **context))
         return '200 OK', render(template_name, **context)
 
     def __call__(self, request):
@@ -26,6 +56,8 @@ class ListView(TemplateView):
     queryset = []
     template_name = 'list.html'
     context_object_name = 'objects_list'
+    # размер порции при чтении из базы для get_queryset через iter_all
+    batch_size = 500
 
     def get_queryset(self):
         return self.queryset
@@ -48,12 +80,15 @@ class CreateView(TemplateView):
         return request['data']
 
     def create_obj(self, data):
+        """ Может вернуть ответ (код, текст), если данные неверны """
         pass
 
     def __call__(self, request):
         if request['method'] == 'POST':
             data = self.get_request_data(request)
-            self.create_obj(data)
+            error = self.create_obj(data)
+            if error is not None:
+                return error
             return self.render_template_with_context()
         else:
             return super().__call__(request)
@@ -67,31 +102,298 @@ class Observer:
 
 
 class Subject:
-
-    def __init__(self):
-        self.observers = []
+    # список наблюдателей создаётся при первом обращении,
+    # чтобы не заводить его у каждого загруженного из базы объекта
+    __slots__ = ('_observers',)
+
+    @property
+    def observers(self):
+        try:
+            return self._observers
+        except AttributeError:
+            self._observers = []
+            return self._observers
 
     def notify(self):
-        for item in self.observers:
+        for item in getattr(self, '_observers', ()):
             item.update(self)
 
 
-class SmsNotifier(Observer):
-
-    def update(self, subject):
-        text = f'SMS у нас новый курс {subject.name}'
-        print(text)
-        with open('sms', 'a', encoding='UTF-8') as f:
-            f.write(text + '\n')
+class Notifier(Observer):
+    """
+    Наблюдатель, который не пишет сам, а передаёт текст в шину уведомлений.
+    Шина копит тексты и вызывает write_batch() одной пачкой в фоновом потоке.
+    Без шины запись идёт сразу, как раньше.
+    """
+    name = 'notifier'
+    file_name = None
+    template = '{subject.name}'
 
+    def __init__(self, bus=None):
+        self.bus = bus
+        if bus is not None:
+            bus.register(self)
 
-class EmailNotifier(Observer):
+    def format(self, subject):
+        return self.template.format(subject=subject)
 
     def update(self, subject):
-        text = f'Email у нас новый курс {subject.name}'
-        print(text)
-        with open('email', 'a', encoding='UTF-8') as f:
-            f.write(text + '\n')
+        text = self.format(subject)
+        if self.bus is None:
+            self.write_batch([text])
+        else:
+            self.bus.publish(self.name, text)
+
+    def write_batch(self, texts):
+        with open(self.file_name, 'a', encoding='UTF-8') as f:
+            f.write(''.join(f'{text}\n' for text in texts))
+
+
+class SmsNotifier(Notifier):
+    name = 'sms'
+    file_name = 'sms'
+    template = 'SMS у нас новый курс {subject.name}'
+
+
+class EmailNotifier(Notifier):
+    name = 'email'
+    file_name = 'email'
+    template = 'Email у нас новый курс {subject.name}'
+
+
+class NotificationBus:
+    """
+    Шина уведомлений с доставкой "хотя бы один раз".
+    publish() сохраняет уведомление в таблицу notification_outbox и ставит
+    его в очередь; фоновый поток забирает из очереди всё накопившееся,
+    пишет пачкой через write_batch() каждого наблюдателя и удаляет из таблицы
+    доставленное. Если у текущей UnitOfWork есть незаписанные изменения,
+    строка outbox пишется в той же транзакции commit, а в очередь
+    уведомление попадает после фиксации.
+    Каждая строка закреплена за процессом (claimed_by). При start()
+    и затем раз в claim_timeout / 2 секунд процесс продлевает свои строки
+    (claimed_at) и атомарно забирает себе строки без владельца и строки,
+    чей владелец не продлевал их claim_timeout секунд (процесс остановлен),
+    и отправляет их заново.
+    Не доставленная пачка повторяется с задержкой retry_delay, которая
+    удваивается с каждой попыткой до max_retry_delay; ошибки пишутся
+    в logger (по умолчанию в stderr).
+    """
+    create_table_sql = (
+        'CREATE TABLE IF NOT EXISTS notification_outbox ('
+        'id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL UNIQUE, '
+        'notifier VARCHAR (32) NOT NULL, '
+        'text TEXT NOT NULL, '
+        'claimed_by VARCHAR (64), '
+        'claimed_at REAL)'
+    )
+    # колонки, которых нет в таблицах, созданных до закрепления строк за процессами
+    claim_columns = (('claimed_by', 'VARCHAR (64)'), ('claimed_at', 'REAL'))
+
+    def __init__(self, pool, batch_size=100, flush_interval=0.5, claim_timeout=60.0, retry_delay=1.0,
+                 max_retry_delay=30.0, logger=None):
+        self.pool = pool
+        self.batch_size = batch_size
+        # сколько секунд ждать, пока наберётся пачка
+        self.flush_interval = flush_interval
+        self.claim_timeout = claim_timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.logger = logger
+        self.notifiers = {}
+        self.owner = self.make_owner()
+        self._queue = Queue()
+        # повторы: куча (время попытки, id, попытка, уведомление), только для фонового потока
+        self._retry = []
+        self._thread = None
+        self._lock = Lock()
+        self._recovered = False
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # у рабочего процесса своя очередь, свой поток и свои строки outbox
+        self.owner = self.make_owner()
+        self._queue = Queue()
+        self._retry = []
+        self._thread = None
+        self._lock = Lock()
+        self._recovered = False
+
+    @staticmethod
+    def make_owner():
+        return f'{os.getpid()}-{uuid4().hex[:8]}'
+
+    def register(self, notifier):
+        self.notifiers[notifier.name] = notifier
+
+    def publish(self, notifier_name, text):
+        self.start()
+        unit_of_work = UnitOfWork.get_current()
+        if unit_of_work is not None and unit_of_work.has_changes():
+            # уведомление о данных, которые ещё не записаны: пишем вместе с ними
+            items = []
+            unit_of_work.on_commit(
+                lambda connection: items.append(self.insert(connection, notifier_name, text)),
+                lambda: self._queue.put(items[-1]),
+            )
+            return
+        with self.pool.connection() as connection:
+            item = self.insert(connection, notifier_name, text)
+            connection.commit()
+        self._queue.put(item)
+
+    def insert(self, connection, notifier_name, text):
+        cursor = connection.execute(
+            'INSERT INTO notification_outbox (notifier, text, claimed_by, claimed_at) VALUES (?, ?, ?, ?)',
+            (notifier_name, text, self.owner, time()))
+        return cursor.lastrowid, notifier_name, text
+
+    def create_table(self, connection):
+        connection.execute(self.create_table_sql)
+        columns = {row[1] for row in connection.execute('PRAGMA table_info(notification_outbox)')}
+        for column, column_type in self.claim_columns:
+            if column not in columns:
+                connection.execute(f'ALTER TABLE notification_outbox ADD COLUMN {column} {column_type}')
+
+    def log(self, text):
+        if self.logger is not None:
+            self.logger.log(text)
+        else:
+            sys.stderr.write(f'{text}\n')
+
+    def claim(self, connection):
+        """
+        Продлевает строки процесса и забирает строки без владельца
+        и с просроченным claimed_at. Возвращает забранные строки.
+        """
+        now = time()
+        # BEGIN IMMEDIATE сразу берёт блокировку записи: между SELECT
+        # и UPDATE другой процесс не заберёт те же строки
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('UPDATE notification_outbox SET claimed_at=? WHERE claimed_by=?', (now, self.owner))
+            claimed = connection.execute('SELECT id, notifier, text FROM notification_outbox '
+                                         'WHERE claimed_by IS NULL OR claimed_at < ? ORDER BY id',
+                                         (now - self.claim_timeout,)).fetchall()
+            connection.executemany('UPDATE notification_outbox SET claimed_by=?, claimed_at=? WHERE id=?',
+                                   [(self.owner, now, item_id) for item_id, _, _ in claimed])
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        return claimed
+
+    def start(self):
+        """ Запускает фоновый поток и ставит в очередь недоставленное ранее """
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            if not self._recovered:
+                with self.pool.connection() as connection:
+                    self.create_table(connection)
+                    connection.commit()
+                    pending = self.claim(connection)
+                for item in pending:
+                    self._queue.put(item)
+                self._recovered = True
+            self._thread = Thread(target=self._run, name='notification-bus', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout=5.0):
+        """ Доставляет то, что уже в очереди, и останавливает поток """
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        running = True
+        next_claim = monotonic() + self.claim_timeout / 2
+        while running:
+            # ждём новое уведомление, но не дольше очередного повтора или продления строк
+            wake_at = min(next_claim, self._retry[0][0]) if self._retry else next_claim
+            try:
+                batch = [self._queue.get(timeout=max(wake_at - monotonic(), 0))]
+            except Empty:
+                batch = []
+            deadline = monotonic() + self.flush_interval
+            while batch and len(batch) < self.batch_size:
+                timeout = deadline - monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = [item for item in batch if item is not None]
+                # перед остановкой забираем всё, что осталось в очереди
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except Empty:
+                        break
+                    if item is not None:
+                        batch.append(item)
+            now = monotonic()
+            attempts = {}
+            # при остановке отложенные повторы пробуем сразу; что не ушло,
+            # останется в outbox и будет забрано после claim_timeout
+            while self._retry and (not running or self._retry[0][0] <= now):
+                _, item_id, attempt, item = heappop(self._retry)
+                attempts[item_id] = attempt
+                batch.append(item)
+            if batch:
+                self.deliver(batch, attempts)
+            if running and monotonic() >= next_claim:
+                next_claim = monotonic() + self.claim_timeout / 2
+                try:
+                    with self.pool.connection() as connection:
+                        batch = self.claim(connection)
+                except Exception as e:
+                    self.log(f'Не удалось забрать строки outbox: {e}')
+                else:
+                    for item in batch:
+                        self._queue.put(item)
+
+    def deliver(self, batch, attempts=None):
+        """
+        Пишет пачку наблюдателям и удаляет доставленное из outbox.
+        attempts - {id: номер попытки} для повторно отправляемых уведомлений.
+        """
+        attempts = attempts or {}
+        by_notifier = {}
+        for item in batch:
+            by_notifier.setdefault(item[1], []).append(item)
+        delivered = []
+        for name, items in by_notifier.items():
+            notifier = self.notifiers.get(name)
+            if notifier is None:
+                self.log(f'Уведомления {name}: наблюдатель не зарегистрирован')
+                continue
+            try:
+                notifier.write_batch([text for _, _, text in items])
+            except Exception as e:
+                attempt = max(attempts.get(item_id, 0) for item_id, _, _ in items) + 1
+                delay = min(self.retry_delay * 2 ** (attempt - 1), self.max_retry_delay)
+                self.log(f'Уведомления {name} не доставлены (попытка {attempt}, '
+                         f'повтор через {delay:g} с): {e!r}')
+                retry_at = monotonic() + delay
+                for item in items:
+                    heappush(self._retry, (retry_at, item[0], attempt, item))
+                continue
+            delivered.extend((item_id,) for item_id, _, _ in items)
+        if delivered:
+            with self.pool.connection() as connection:
+                connection.executemany('DELETE FROM notification_outbox WHERE id=?', delivered)
+                connection.commit()
 
 
 # Хранитель
@@ -108,18 +410,276 @@ class BaseSerializer:
         return loads(data)
 
 
+def json_dumps(value) -> bytes:
+    """ JSON в байтах: через orjson, если он установлен """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class ModelSerializer:
+    """
+    Сериализатор по схеме: в fields перечисляются поля модели,
+    вычисляемое поле задаётся методом get_<поле>(obj).
+    На выходе обычный JSON без служебных данных jsonpickle.
+    """
+    fields = ()
+    content_type = 'application/json'
+
+    def __init__(self, fields=None):
+        if fields:
+            unknown = set(fields) - set(self.fields)
+            if unknown:
+                raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+            self.selected = tuple(name for name in self.fields if name in fields)
+        else:
+            self.selected = self.fields
+        self.getters = [(name, getattr(self, f'get_{name}', None)) for name in self.selected]
+
+    def to_dict(self, obj):
+        return {name: getter(obj) if getter else getattr(obj, name, None) for name, getter in self.getters}
+
+    def dumps(self, objects) -> bytes:
+        return json_dumps([self.to_dict(obj) for obj in objects])
+
+    def stream(self, objects, chunk_size=100):
+        """ JSON-массив по частям: в памяти не больше chunk_size объектов """
+        objects = iter(objects)
+        yield b'['
+        first = True
+        while True:
+            chunk = [self.to_dict(obj) for obj in islice(objects, chunk_size)]
+            if not chunk:
+                break
+            body = json_dumps(chunk)[1:-1]
+            yield body if first else b',' + body
+            first = False
+        yield b']'
+
+
+class LogContext:
+    """
+    Данные текущего запроса для записей лога: id запроса и время начала.
+    Свои у каждого потока и у каждой задачи asyncio.
+    """
+    _current = ContextVar('log_context', default=None)
+
+    @classmethod
+    def begin(cls, request_id=None):
+        request_id = request_id or uuid4().hex
+        cls._current.set((request_id, perf_counter()))
+        return request_id
+
+    @classmethod
+    def end(cls):
+        cls._current.set(None)
+
+    @classmethod
+    def current(cls):
+        """ (id запроса, миллисекунды с начала запроса) или (None, None) вне запроса """
+        context = cls._current.get()
+        if context is None:
+            return None, None
+        request_id, started = context
+        return request_id, round((perf_counter() - started) * 1000, 3)
+
+
+class LogBuffer:
+    """
+    Очередь строк лога, которую разбирает фоновый поток.
+    Строки уходят в sink(lines) пачкой, когда их набралось flush_size
+    или прошло flush_interval секунд с первой строки в пачке.
+    """
+
+    def __init__(self, sink, flush_size=100, flush_interval=1.0):
+        self.sink = sink
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._queue = Queue()
+        self._thread = None
+        self._lock = Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # поток родителя в дочерний процесс не переходит, очередь у процесса своя
+        self._queue = Queue()
+        self._thread = None
+        self._lock = Lock()
+
+    def put(self, line):
+        if self._thread is None:
+            self.start()
+        self._queue.put(line)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = Thread(target=self._run, name='log-buffer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def close(self, timeout=5.0):
+        """ Дописывает всё из очереди и останавливает поток """
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            line = self._queue.get()
+            if line is None:
+                return
+            lines = [line]
+            deadline = monotonic() + self.flush_interval
+            stop = False
+            while len(lines) < self.flush_size:
+                timeout = deadline - monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    line = self._queue.get(timeout=timeout)
+                except Empty:
+                    break
+                if line is None:
+                    stop = True
+                    break
+                lines.append(line)
+            try:
+                self.sink(lines)
+            except Exception as e:
+                print(f'Не удалось записать лог: {e}')
+            if stop:
+                return
+
+
 #  Стратегия
 class ConsoleWriter:
 
+    def __init__(self, buffered=False, flush_size=100, flush_interval=1.0):
+        self.buffer = LogBuffer(self.write_lines, flush_size, flush_interval) if buffered else None
+
     def write(self, text):
-        print(text)
+        if self.buffer is None:
+            print(text)
+        else:
+            self.buffer.put(text)
 
+    @staticmethod
+    def write_lines(lines):
+        sys.stdout.write(''.join(f'{line}\n' for line in lines))
+        sys.stdout.flush()
 
-class FileWriter:
 
-    def __init__(self, file_name='site.log'):
+class FileWriter:
+    """
+    Запись лога в файл.
+    buffered=True - файл держится открытым, строки пишутся фоновым потоком
+    пачками (LogBuffer), в контроллере остаётся только постановка в очередь.
+    json_lines=True - каждая строка это JSON с временем, id запроса
+    и временем от начала запроса (LogContext).
+    max_bytes - размер файла, после которого он переименовывается
+    в file_name.1 (старые копии сдвигаются, хранится backup_count штук).
+    Все процессы pre-fork сервера пишут в один файл: он открыт с O_APPEND,
+    поэтому пачки строк не перемешиваются. Ротацию делает тот процесс,
+    который первым заметил превышение размера, под блокировкой
+    file_name.lock; остальные видят новый файл и переоткрывают его.
+    """
+
+    def __init__(self, file_name='site.log', buffered=False, json_lines=False, max_bytes=None, backup_count=3,
+                 flush_size=100, flush_interval=1.0):
         self.file_name = file_name
+        self.lock_name = f'{file_name}.lock'
+        self.json_lines = json_lines
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.buffer = LogBuffer(self.write_lines, flush_size, flush_interval) if buffered else None
+        self._file = None
+        self._lock = Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # открытый файл и блокировка родителя в дочернем процессе не используются
+        self._file = None
+        self._lock = Lock()
+
+    def format(self, text):
+        if not self.json_lines:
+            return text
+        request_id, elapsed_ms = LogContext.current()
+        record = {'time': datetime.now().isoformat(timespec='milliseconds'), 'message': text}
+        if request_id is not None:
+            record['request_id'] = request_id
+            record['elapsed_ms'] = elapsed_ms
+        return json_dumps(record).decode('utf-8')
 
     def write(self, text):
-        with open(self.file_name, 'a', encoding='utf-8') as f:
-            f.write(f'{text}\n')
+        line = self.format(text)
+        if self.buffer is None:
+            self.write_lines([line])
+        else:
+            self.buffer.put(line)
+
+    def write_lines(self, lines):
+        data = ''.join(f'{line}\n' for line in lines)
+        with self._lock:
+            if self.buffer is None:
+                # без буфера файл открывается на каждую запись, как раньше
+                with open(self.file_name, 'a', encoding='utf-8') as f:
+                    f.write(data)
+                    size = f.tell()
+            else:
+                if self._file is not None and self.is_rotated():
+                    self._file.close()
+                    self._file = None
+                if self._file is None:
+                    self._file = open(self.file_name, 'a', encoding='utf-8')
+                self._file.write(data)
+                self._file.flush()
+                size = self._file.tell()
+            if self.max_bytes and size >= self.max_bytes:
+                self.rotate()
+
+    def is_rotated(self):
+        """Файл переименован другим процессом - открытый дескриптор пишет в копию"""
+        try:
+            return os.stat(self.file_name).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    @contextmanager
+    def rotation_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_name, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def rotate(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        with self.rotation_lock():
+            # пока ждали блокировку, файл мог уже повернуть другой процесс
+            try:
+                if os.stat(self.file_name).st_size < self.max_bytes:
+                    return
+            except FileNotFoundError:
+                return
+            for number in range(self.backup_count - 1, 0, -1):
+                source = f'{self.file_name}.{number}'
+                if os.path.exists(source):
+                    os.replace(source, f'{self.file_name}.{number + 1}')
+            if self.backup_count > 0:
+                os.replace(self.file_name, f'{self.file_name}.1')
+            else:
+                os.remove(self.file_name)
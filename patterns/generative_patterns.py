@@ -1,38 +1,46 @@
+import asyncio
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import copy_context
 from copy import deepcopy
-from quopri import decodestring
+from functools import partial
+from queue import Empty, LifoQueue
 from sqlite3 import connect
 
-from components.settings import DATABASE
-from patterns.architectural_system_patterns import BaseMapper, DomainObject
-from patterns.behavioral_patterns import Subject, FileWriter
+from components.settings import DATABASE, DB_POOL_SIZE, DB_BUSY_TIMEOUT, DB_POOL_TIMEOUT, COURSE_SINGLE_TABLE, \
+    LOG_FILE, LOG_BUFFERED, LOG_JSON, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_FLUSH_SIZE, LOG_FLUSH_INTERVAL
+from fox_framework.request_framework import decode_value
+from patterns.architectural_system_patterns import AsyncBaseMapper, BaseMapper, DomainObject, Relation, RowFactory, \
+    RecordNotFoundException, UnitOfWork
+from patterns.behavioral_patterns import Subject, FileWriter, ModelSerializer
 
 
 # Прототип
 class CoursePrototype:
     """ Прототип курсов обучения"""
+    __slots__ = ()
+
     def clone(self):
         return deepcopy(self)
 
 
 class AbstractCourse(CoursePrototype, Subject):
     """ Абстрактный курс """
+    __slots__ = ('id', 'name', 'category_id')
+
     def __init__(self, **kwargs):
-        super().__init__()
-        if 'id' in kwargs:
-            self.id = kwargs.get('id')
-        if 'name' in kwargs:
-            self.name = kwargs.get('name')
-        if 'category_id' in kwargs:
-            self.category_id = kwargs.get('category_id')
+        for key, value in kwargs.items():
+            setattr(self, key, value)
 
 
 class OnlineCourse(AbstractCourse, DomainObject):
-    pass
+    __slots__ = ()
 
 
 class OfflineCourse(AbstractCourse, DomainObject):
-    pass
+    __slots__ = ()
 
 
 # Фабричный метод
@@ -48,24 +56,32 @@ class CourseFactory:
         return cls.types[type_](**kwargs)
 
 
+class CourseSerializer(ModelSerializer):
+    """ Курсы для API: тип курса берётся из фабрики """
+    fields = ('id', 'name', 'category_id', 'type')
+    type_names = {model: name for name, model in CourseFactory.types.items()}
+
+    def get_type(self, obj):
+        return self.type_names.get(type(obj))
+
+
 class AbstractUser:
     """ Абстрактный пользователь """
-    def __init__(self, **kwargs):
-        if 'name' in kwargs:
-            self.name = kwargs.get('name')
+    __slots__ = ('id', 'name')
 
-        if 'id' in kwargs:
-            self.id = kwargs.get('id')
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
 
 
 class Teacher(AbstractUser):
     """ Преподаватель """
-    pass
+    __slots__ = ()
 
 
 class Student(AbstractUser, DomainObject):
     """ Студент """
-    pass
+    __slots__ = ()
 
 
 # Фабричный метод
@@ -83,35 +99,30 @@ class UserFactory:
 
 class Category(DomainObject):
     """ Категории курсов"""
+    __slots__ = ('id', 'name')
 
     def __init__(self, **kwargs):
-        if 'name' in kwargs:
-            self.name = kwargs.get('name')
-
-        if 'id' in kwargs:
-            self.id = kwargs.get('id')
+        for key, value in kwargs.items():
+            setattr(self, key, value)
 
 
 class StudentOnlineCourse(DomainObject):
     """ Запись студента на онлайн курс"""
+    # student и course заполняет маппер при загрузке связей
+    __slots__ = ('id', 'student_id', 'course_id', 'student', 'course')
 
     def __init__(self, **kwargs):
-        if 'student_id' in kwargs:
-            self.student_id = kwargs.get('student_id')
-
-        if 'course_id' in kwargs:
-            self.course_id = kwargs.get('course_id')
+        for key, value in kwargs.items():
+            setattr(self, key, value)
 
 
 class StudentOfflineCourse(DomainObject):
     """ Запись студента на оффлайн курс"""
+    __slots__ = ('id', 'student_id', 'course_id', 'student', 'course')
 
     def __init__(self, **kwargs):
-        if 'student_id' in kwargs:
-            self.student_id = kwargs.get('student_id')
-
-        if 'course_id' in kwargs:
-            self.course_id = kwargs.get('course_id')
+        for key, value in kwargs.items():
+            setattr(self, key, value)
 
 
 # Синглтон
@@ -135,9 +146,15 @@ class SingletonName(type):
             return cls.__instance[name]
 
 
+# общий файл лога сайта, пишется фоновым потоком
+site_log_writer = FileWriter(LOG_FILE, buffered=LOG_BUFFERED, json_lines=LOG_JSON, max_bytes=LOG_MAX_BYTES,
+                             backup_count=LOG_BACKUP_COUNT, flush_size=LOG_FLUSH_SIZE,
+                             flush_interval=LOG_FLUSH_INTERVAL)
+
+
 class Logger(metaclass=SingletonName):
     """ Логгер с одним и тем же именем пишет данные в один и тот же файл, а с другим именем в другой """
-    def __init__(self, name, writer=FileWriter()):
+    def __init__(self, name, writer=site_log_writer):
         self.name = name
         self.writer = writer
 
@@ -170,9 +187,9 @@ class Engine:
 
     @staticmethod
     def decode_value(val):
-        val_b = bytes(val.replace('%', '=').replace("+", " "), 'UTF-8')
-        val_decode_str = decodestring(val_b)
-        return val_decode_str.decode('UTF-8')
+        # данные запроса уже декодированы фреймворком,
+        # метод нужен только для значений, полученных в обход request
+        return decode_value(val)
 
 
 class StudentMapper(BaseMapper):
@@ -195,44 +212,299 @@ class OfflineCourseMapper(BaseMapper):
     model = OfflineCourse
 
 
+class CourseMapper(BaseMapper):
+    """
+    Курсы всех типов одним запросом. Колонка type - ключ CourseFactory,
+    по ней строка собирается в объект своего класса. Пока курсы лежат
+    в online_course и offline_course, источник - UNION ALL этих таблиц:
+    условия WHERE SQLite переносит в каждую часть, и работают индексы
+    по category_id. После migrate_courses.py и COURSE_SINGLE_TABLE = True
+    читается таблица course с индексом (category_id, type).
+    До миграции id повторяются в таблицах разных типов, поэтому ключ
+    курса - (тип, id): так работают get_by_id, paginate и карта присутствия.
+    Только чтение: курсы записываются мапперами своих типов.
+    """
+    tablename = 'course'
+    model = AbstractCourse
+    columns = ('id', 'category_id', 'name')
+    key_columns = ('type', 'id')
+    type_mappers = {
+        'online': OnlineCourseMapper,
+        'offline': OfflineCourseMapper,
+    }
+
+    def __init__(self, pool, single_table=COURSE_SINGLE_TABLE):
+        super().__init__(pool)
+        columns = ', '.join(self.columns)
+        if single_table:
+            self._source = f'(SELECT type, {columns} FROM course)'
+        else:
+            parts = [f"SELECT '{type_}' AS type, {columns} FROM {mapper.tablename}"
+                     for type_, mapper in self.type_mappers.items()]
+            self._source = f"({' UNION ALL '.join(parts)})"
+
+    @property
+    def source(self):
+        return self._source
+
+    def get_builder(self, column_names):
+        # первая колонка - type, остальное собирается в класс из CourseFactory
+        columns = column_names[1:]
+        builders = {type_: RowFactory.get_builder(model, columns) for type_, model in CourseFactory.types.items()}
+        return lambda row: builders[row[0]](row[1:])
+
+    def get_cached(self, type_, id):
+        identity_map = UnitOfWork.get_identity_map()
+        mapper = self.type_mappers.get(type_)
+        if identity_map is None or mapper is None:
+            return None
+        return identity_map.get(mapper.tablename, id)
+
+    def get_by_id(self, type_, id):
+        """ Курс по ключу (тип, id) """
+        object = self.get_cached(type_, id)
+        if object is not None:
+            return object
+        result = self.filter(type=type_, id=id)
+        if not result:
+            raise RecordNotFoundException(f'Course with type={type_} id={id} not found')
+        return result[0]
+
+    def paginate(self, limit, offset=0, after_id=None, **criteria):
+        """
+        Страница курсов в порядке (type, id).
+        after_id - ключ (тип, id) последнего показанного курса
+        """
+        where, params = self.where(criteria)
+        if after_id is not None:
+            condition = '(type, id) > (?, ?)'
+            where = f'{where} AND {condition}' if where else f' WHERE {condition}'
+            params.extend(after_id)
+            offset = 0
+        statement = f'SELECT * FROM {self.source}{where} ORDER BY type, id LIMIT ? OFFSET ?'
+        with self.pool.connection() as connection:
+            return self.materialize(connection.execute(statement, (*params, limit, offset)))
+
+    def build_objects(self, column_names, rows):
+        """ Как в BaseMapper, но ключ карты присутствия - (таблица типа, id), общий с мапперами типов """
+        build = self.get_builder(column_names)
+        identity_map = UnitOfWork.get_identity_map()
+        if identity_map is None:
+            return list(map(build, rows))
+
+        tablenames = {type_: mapper.tablename for type_, mapper in self.type_mappers.items()}
+        result = []
+        for values in rows:
+            tablename = tablenames[values[0]]
+            object = identity_map.get(tablename, values[1])
+            if object is None:
+                object = build(values)
+                identity_map.add(tablename, values[1], object)
+            result.append(object)
+        return result
+
+
 class StudentOnLineCourseMapper(BaseMapper):
     tablename = 'student_onlinecourse'
     model = StudentOnlineCourse
+    relations = {
+        'student': Relation('student_id', StudentMapper),
+        'course': Relation('course_id', OnlineCourseMapper),
+    }
 
 
 class StudentOffLineCourseMapper(BaseMapper):
     tablename = 'student_offlinecourse'
     model = StudentOfflineCourse
+    relations = {
+        'student': Relation('student_id', StudentMapper),
+        'course': Relation('course_id', OfflineCourseMapper),
+    }
 
 
-connection = connect(DATABASE)
+# Пул объектов
+class ConnectionPool:
+    """
+    Пул соединений с SQLite. Соединения открываются по требованию,
+    не больше size штук, в режиме WAL с synchronous=NORMAL, поэтому
+    потоки сервера читают базу параллельно.
+    Поток берёт соединение через connection() и возвращает его по выходу
+    из блока. Вложенные connection() в одном потоке получают то же
+    соединение, так что операции внутри одной транзакции не расходятся.
+    Соединения не переходят через fork: свободные закрываются перед fork,
+    а занятые другими потоками дочерний процесс не закрывает и не использует
+    (закрытие унаследованного соединения SQLite снимает блокировки родителя).
+    """
+    # унаследованные через fork соединения: ссылки держатся, чтобы их не закрыл сборщик мусора
+    _inherited = []
+
+    def __init__(self, database, size=5, busy_timeout=5.0, timeout=10.0):
+        self.database = database
+        self.size = size
+        self.busy_timeout = busy_timeout
+        self.timeout = timeout
+        self._idle = LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # все открытые соединения пула
+        self._open = []
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(before=self.close_all, after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # соединения SQLite нельзя использовать в дочернем процессе после fork
+        ConnectionPool._inherited.extend(self._open)
+        self._open = []
+        self._idle = LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _create(self):
+        connection = connect(self.database, timeout=self.busy_timeout, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(f'PRAGMA busy_timeout={int(self.busy_timeout * 1000)}')
+        with self._lock:
+            self._open.append(connection)
+        return connection
+
+    def acquire(self):
+        local = self._local
+        if getattr(local, 'depth', 0):
+            local.depth += 1
+            return local.connection
+        try:
+            connection = self._idle.get_nowait()
+        except Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    connection = self._create()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    connection = self._idle.get(timeout=self.timeout)
+                except Empty:
+                    raise PoolTimeoutException(f'no free connection in {self.timeout} s')
+        local.connection = connection
+        local.depth = 1
+        return connection
+
+    def release(self):
+        local = self._local
+        local.depth -= 1
+        if local.depth:
+            return
+        connection = local.connection
+        local.connection = None
+        if connection.in_transaction:
+            connection.rollback()
+        self._idle.put(connection)
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release()
+
+    def close_all(self):
+        """ Закрывает свободные соединения, новые откроются по требованию """
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except Empty:
+                break
+            connection.close()
+            with self._lock:
+                self._open.remove(connection)
+                self._created -= 1
+
+
+class PoolTimeoutException(Exception):
+    def __init__(self, message):
+        super().__init__(f'Connection pool timeout: {message}')
+
+
+connection_pool = ConnectionPool(DATABASE, DB_POOL_SIZE, DB_BUSY_TIMEOUT, DB_POOL_TIMEOUT)
+
+
+class DbExecutor:
+    """
+    Потоки для запросов к базе из async-кода, по одному на соединение пула:
+    запрос не ждёт ни свободного потока, ни свободного соединения дольше,
+    чем синхронный. Вызов выполняется в контексте вызывающей задачи,
+    поэтому карта присутствия текущей UnitOfWork видна и в потоке.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._executor = None
+        self._lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # потоки родителя в дочерний процесс не переходят
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.size, thread_name_prefix='db')
+        return self._executor
+
+    async def run(self, func, *args, **kwargs):
+        call = partial(copy_context().run, func, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self.get_executor(), call)
 
 
 class MapperRegistry:
+    connection_pool = connection_pool
+    db_executor = DbExecutor(connection_pool.size)
     mappers = {
         'student': StudentMapper,
         'category': CategoryMapper,
         'online': OnlineCourseMapper,
         'offline': OfflineCourseMapper,
+        'course': CourseMapper,
         'student_onlinecourse': StudentOnLineCourseMapper,
         'student_offlinecourse': StudentOffLineCourseMapper
     }
+    # мапперы не хранят состояния, поэтому создаются один раз
+    instances = {name: mapper(connection_pool) for name, mapper in mappers.items()}
+    by_model = {mapper.model: mapper for mapper in instances.values()}
 
     @staticmethod
     def get_mapper(obj):
-        if isinstance(obj, Student):
-            return StudentMapper(connection)
-        elif isinstance(obj, Category):
-            return CategoryMapper(connection)
-        elif isinstance(obj, OnlineCourse):
-            return OnlineCourseMapper(connection)
-        elif isinstance(obj, OfflineCourse):
-            return OfflineCourseMapper(connection)
-        elif isinstance(obj, StudentOnlineCourse):
-            return StudentOnLineCourseMapper(connection)
-        elif isinstance(obj, StudentOfflineCourse):
-            return StudentOffLineCourseMapper(connection)
+        mapper = MapperRegistry.by_model.get(type(obj))
+        if mapper is None:
+            for model, model_mapper in MapperRegistry.by_model.items():
+                if isinstance(obj, model):
+                    return model_mapper
+        return mapper
 
     @staticmethod
     def get_current_mapper(name):
-        return MapperRegistry.mappers[name](connection)
+        return MapperRegistry.instances[name]
+
+    @staticmethod
+    def get_async_mapper(name):
+        """ Тот же маппер для async-контроллеров """
+        return MapperRegistry.async_instances[name]
+
+
+MapperRegistry.async_instances = {
+    name: AsyncBaseMapper(mapper, MapperRegistry.db_executor) for name, mapper in MapperRegistry.instances.items()
+}
@@ -1,29 +1,51 @@
-from time import time
-
-
 routes_from_decorator = {}
 
 
 # Декоратор
 class AppRoute:
-    def __init__(self, url):
+    """
+    Регистрация контроллера по адресу.
+    cache_ttl - время жизни страницы в кэше ответов (секунды),
+    cache_tables - таблицы, запись в которые сбрасывает страницу
+    (None - любая запись)
+    middleware_exclude / middleware_include - имена middleware, которые
+    для маршрута отключаются / включаются (для optional middleware)
+    """
+    def __init__(self, url, methods=None, cache_ttl=None, cache_tables=None,
+                 middleware_exclude=None, middleware_include=None):
         self.url = url
+        self.methods = methods
+        self.cache_ttl = cache_ttl
+        self.cache_tables = cache_tables
+        self.middleware_exclude = middleware_exclude
+        self.middleware_include = middleware_include
 
     def __call__(self, cls):
-        routes_from_decorator[self.url] = cls()
+        view = cls()
+        if self.cache_ttl is not None:
+            view.cache_ttl = self.cache_ttl
+            view.cache_tables = self.cache_tables
+        if self.middleware_exclude is not None:
+            view.middleware_exclude = tuple(self.middleware_exclude)
+        if self.middleware_include is not None:
+            view.middleware_include = tuple(self.middleware_include)
+        # по адресу всегда хранится {метод: контроллер}, контроллер без
+        # methods записывается под '*' и отвечает на остальные методы,
+        # поэтому порядок регистраций по одному адресу не важен
+        handlers = routes_from_decorator.setdefault(self.url, {})
+        for method in self.methods or ('*',):
+            handlers[method.upper()] = view
 
 
 # Декоратор
 class Debug:
+    """
+    Раньше замерял время контроллера. Метрики теперь пишет фреймворк
+    для каждого маршрута и метода (fox_framework.metrics, адрес /metrics/),
+    декоратор оставлен для совместимости и возвращает метод без изменений.
+    """
+    def __init__(self, name=None):
+        self.name = name
 
     def __call__(self, cls):
-        def timeit(method):
-            def timed(*args, **kwargs):
-                time_start = time()
-                result = method(*args, **kwargs)
-                time_end = time()
-                time_result = time_end - time_start
-                print(f'{str(cls).split()[1]} выполнялся {time_result:.3f}')
-                return result
-            return timed
-        return timeit(cls)
+        return cls
@@ -1,16 +1,41 @@
-from wsgiref.simple_server import make_server
+import sys
 
+from fox_framework.asgi import AsgiServer
 from fox_framework.main import Framework
+from fox_framework.server import Server
 from patterns.generative_patterns import Logger
 from patterns.structural_patterns import routes_from_decorator
-from urls import routes_from_urls, fronts
+from urls import routes_from_urls, middlewares
+from views import notification_bus
 from components import settings
 
 logger_to_file = Logger('site')
 all_routes = {**routes_from_urls, **routes_from_decorator}
-application = Framework(all_routes, fronts, settings)
+application = Framework(all_routes, middlewares, settings)
+# то же приложение для ASGI-серверов: uvicorn run:asgi_application
+asgi_application = application.as_asgi()
 
-with make_server('', 8000, application) as httpd:
-    logger_to_file.log('Running on port 8000...')
-    print("Запуск на порту 8000...")
-    httpd.serve_forever()
+if __name__ == '__main__':
+    # поток уведомлений и его соединение с базой открываются в каждом процессе,
+    # который обслуживает запросы, а не в мастере до fork
+    if '--asgi' in sys.argv:
+        notification_bus.start()
+        # однопроцессный сервер на asyncio для локальной проверки ASGI
+        server = AsgiServer(asgi_application, host=settings.SERVER_HOST or '127.0.0.1', port=settings.SERVER_PORT,
+                            keepalive_timeout=settings.SERVER_KEEPALIVE_TIMEOUT)
+    else:
+        server = Server(
+            application,
+            host=settings.SERVER_HOST,
+            port=settings.SERVER_PORT,
+            workers=settings.SERVER_WORKERS,
+            threads=settings.SERVER_THREADS,
+            max_requests=settings.SERVER_MAX_REQUESTS,
+            keepalive_timeout=settings.SERVER_KEEPALIVE_TIMEOUT,
+            graceful_timeout=settings.SERVER_GRACEFUL_TIMEOUT,
+            reuse_port=settings.SERVER_REUSE_PORT,
+            worker_init=notification_bus.start,
+        )
+    logger_to_file.log(f'Running on port {settings.SERVER_PORT}...')
+    print(f"Запуск на порту {settings.SERVER_PORT}...")
+    server.run()
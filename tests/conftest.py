@@ -0,0 +1,90 @@
+""" Общие фикстуры: временная база, настройки приложения и вызов WSGI """
+import sqlite3
+from io import BytesIO
+from os import path
+from types import SimpleNamespace
+
+import pytest
+
+from components import settings
+from patterns.architectural_system_patterns import UnitOfWork
+from patterns.generative_patterns import MapperRegistry, connection_pool
+
+ROOT_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """
+    Пустая база по create_db.sql во временной папке. Путь к базе в
+    настройках относительный, поэтому пул открывает соединения в текущей папке.
+    """
+    monkeypatch.chdir(tmp_path)
+    connection_pool.close_all()
+    with open(path.join(ROOT_DIR, 'create_db.sql'), encoding='utf-8') as f:
+        script = f.read()
+    connection = sqlite3.connect(settings.DATABASE)
+    connection.executescript(script)
+    connection.close()
+    yield connection_pool
+    connection_pool.close_all()
+
+
+@pytest.fixture
+def unit_of_work(db):
+    """ Единица работы запроса, как её создаёт UnitOfWorkMiddleware """
+    UnitOfWork.new_current()
+    unit_of_work = UnitOfWork.get_current()
+    unit_of_work.set_mapper_registry(MapperRegistry)
+    yield unit_of_work
+    UnitOfWork.set_current(None)
+
+
+@pytest.fixture
+def app_settings(tmp_path):
+    """ Настройки Framework без общих с запущенным сайтом папок """
+    return SimpleNamespace(
+        STATIC_URL='/static/',
+        STATIC_FILES_DIR=str(tmp_path / 'static'),
+        STATIC_ROOT=None,
+        RESPONSE_CACHE_STAMP_DIR=None,
+        METRICS_ENABLED=False,
+        METRICS_DIR=None,
+        UNIT_OF_WORK=None,
+    )
+
+
+def call_wsgi(app, method='GET', url='/', body=b'', content_type='application/x-www-form-urlencoded',
+              headers=None):
+    """ (статус, заголовки, тело) ответа WSGI-приложения """
+    path_info, _, query_string = url.partition('?')
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': query_string,
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body)),
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.input': BytesIO(body),
+        'wsgi.url_scheme': 'http',
+    }
+    for name, value in (headers or {}).items():
+        environ[f'HTTP_{name.upper().replace("-", "_")}'] = value
+    result = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        result['status'] = status
+        result['headers'] = dict(response_headers)
+
+    chunks = app(environ, start_response)
+    body = b''.join(chunks)
+    if hasattr(chunks, 'close'):
+        chunks.close()
+    return result['status'], result['headers'], body
+
+
+@pytest.fixture
+def wsgi():
+    return call_wsgi
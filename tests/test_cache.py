@@ -0,0 +1,119 @@
+import pytest
+
+from fox_framework import cache as cache_module
+from fox_framework.cache import ResponseCache
+from fox_framework.main import Framework
+from fox_framework.response import Response, StreamingResponse
+from patterns.architectural_system_patterns import UnitOfWork
+from patterns.generative_patterns import Engine
+
+KEY = ('GET', '/page/', '')
+
+
+def test_get_and_set():
+    cache = ResponseCache()
+    assert cache.get(KEY) is None
+    cache.set(KEY, Response('page'), ttl=60, tables=('categories',))
+    assert cache.get(KEY).body == b'page'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module, 'monotonic', lambda: now[0])
+    cache = ResponseCache()
+    cache.set(KEY, Response('page'), ttl=10)
+    now[0] += 9
+    assert cache.get(KEY) is not None
+    now[0] += 2
+    assert cache.get(KEY) is None
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2)
+    for path in ('/a/', '/b/'):
+        cache.set(('GET', path, ''), Response(path), ttl=60)
+    # обращение делает /a/ свежим, вытесняется /b/
+    cache.get(('GET', '/a/', ''))
+    cache.set(('GET', '/c/', ''), Response('/c/'), ttl=60)
+    assert cache.get(('GET', '/b/', '')) is None
+    assert cache.get(('GET', '/a/', '')) is not None
+
+
+@pytest.mark.parametrize('response', [
+    StreamingResponse(iter([b'chunk'])),
+    Response('error', '500 Internal Server Error'),
+    Response('moved', '302 Found'),
+])
+def test_not_cacheable(response):
+    cache = ResponseCache()
+    cache.set(KEY, response, ttl=60)
+    assert cache.get(KEY) is None
+
+
+def test_response_with_cookie_not_cacheable():
+    response = Response('page')
+    response.set_cookie('session', 'secret')
+    cache = ResponseCache()
+    cache.set(KEY, response, ttl=60)
+    assert cache.get(KEY) is None
+
+
+def test_invalidate_tables():
+    cache = ResponseCache()
+    cache.set(('GET', '/categories/', ''), Response('c'), ttl=60, tables=('categories',))
+    cache.set(('GET', '/students/', ''), Response('s'), ttl=60, tables=('student',))
+    cache.set(('GET', '/all/', ''), Response('a'), ttl=60, tables=None)
+    cache.invalidate_tables({'categories'})
+    assert cache.get(('GET', '/categories/', '')) is None
+    assert cache.get(('GET', '/all/', '')) is None
+    assert cache.get(('GET', '/students/', '')) is not None
+
+
+def test_invalidation_is_seen_by_other_process(tmp_path):
+    # два кэша с общей папкой версий - как два рабочих процесса сервера
+    first = ResponseCache(stamp_dir=str(tmp_path / 'stamps'))
+    second = ResponseCache(stamp_dir=str(tmp_path / 'stamps'))
+    for cache in (first, second):
+        cache.set(KEY, Response('page'), ttl=60, tables=('categories',), stamp=cache.stamp(('categories',)))
+    second.invalidate_tables({'categories'})
+    assert first.get(KEY) is None
+    assert second.get(KEY) is None
+
+
+def test_write_during_render_is_not_cached_as_fresh(tmp_path):
+    cache = ResponseCache(stamp_dir=str(tmp_path / 'stamps'))
+    stamp = cache.stamp(('categories',))
+    # другой процесс записал в таблицу, пока страница строилась
+    ResponseCache(stamp_dir=str(tmp_path / 'stamps')).invalidate_tables({'categories'})
+    cache.set(KEY, Response('old page'), ttl=60, tables=('categories',), stamp=stamp)
+    assert cache.get(KEY) is None
+
+
+class CategoryCount:
+    cache_ttl = 60
+    cache_tables = ('categories',)
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, request):
+        self.calls += 1
+        return '200 OK', f'calls {self.calls}'
+
+
+def test_commit_invalidates_cached_page(unit_of_work, wsgi, app_settings):
+    app_settings.UNIT_OF_WORK = UnitOfWork
+    view = CategoryCount()
+    app = Framework({'/categories/': view}, [], app_settings)
+    try:
+        assert wsgi(app, url='/categories/')[2] == b'calls 1'
+        assert wsgi(app, url='/categories/')[2] == b'calls 1'
+        # POST в кэш не попадает и не берётся из него
+        assert wsgi(app, 'POST', '/categories/')[2] == b'calls 2'
+        Engine.create_category().mark_new({'name': 'New'})
+        unit_of_work.commit()
+        assert wsgi(app, url='/categories/')[2] == b'calls 3'
+    finally:
+        app.close()
+    assert app.response_cache.invalidate_tables not in UnitOfWork.commit_listeners
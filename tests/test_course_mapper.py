@@ -0,0 +1,83 @@
+from os import path
+
+import pytest
+
+from patterns.architectural_system_patterns import RecordNotFoundException
+from patterns.generative_patterns import CourseMapper, OfflineCourse, OfflineCourseMapper, OnlineCourse, \
+    OnlineCourseMapper
+
+ROOT_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+
+
+def key(course):
+    return type(course).__name__, course.id
+
+
+@pytest.fixture
+def courses(db):
+    # id 1 есть и среди онлайн, и среди оффлайн курсов
+    with db.connection() as connection:
+        connection.executemany('INSERT INTO online_course (category_id, name) VALUES (?, ?)',
+                               [(1, 'Python'), (2, 'Go')])
+        connection.execute("INSERT INTO offline_course (category_id, name) VALUES (1, 'Algorithms')")
+        connection.execute('INSERT INTO student_offlinecourse (student_id, course_id) VALUES (1, 1)')
+        connection.commit()
+    return CourseMapper(db, single_table=False)
+
+
+def migrate(db):
+    with open(path.join(ROOT_DIR, 'migrate_courses.sql'), encoding='utf-8') as f:
+        script = f.read()
+    with db.connection() as connection:
+        connection.executescript(script)
+    db.close_all()
+    return CourseMapper(db, single_table=True)
+
+
+def test_courses_of_both_types(courses):
+    assert sorted(map(key, courses.all())) == [('OfflineCourse', 1), ('OnlineCourse', 1), ('OnlineCourse', 2)]
+    assert [course.name for course in courses.filter(order_by='name', category_id=1)] == ['Algorithms', 'Python']
+
+
+def test_get_by_type_and_id(courses):
+    online, offline = courses.get_by_id('online', 1), courses.get_by_id('offline', 1)
+    assert (type(online), online.name) == (OnlineCourse, 'Python')
+    assert (type(offline), offline.name) == (OfflineCourse, 'Algorithms')
+    with pytest.raises(RecordNotFoundException):
+        courses.get_by_id('offline', 2)
+
+
+def test_identity_map_shared_with_type_mappers(unit_of_work, courses, db):
+    offline = courses.get_by_id('offline', 1)
+    assert OfflineCourseMapper(db).get_by_id(1) is offline
+    online = OnlineCourseMapper(db).get_by_id(1)
+    assert courses.get_by_id('online', 1) is online
+    assert online is not offline
+    assert {key(course): course for course in courses.all()}[('OnlineCourse', 1)] is online
+
+
+def test_paginate_after_key(courses):
+    first = courses.paginate(2)
+    assert [(course.id, type(course)) for course in first] == [(1, OfflineCourse), (1, OnlineCourse)]
+    assert [key(course) for course in courses.paginate(2, after_id=('online', 1))] == [('OnlineCourse', 2)]
+    # после последнего онлайн курса id 1 оффлайн курса не повторяется
+    assert courses.paginate(2, after_id=('online', 2)) == []
+
+
+@pytest.mark.parametrize('batch_size', [1, 2])
+def test_iter_all_by_type_and_id(courses, batch_size):
+    assert list(map(key, courses.iter_all(batch_size))) == [
+        ('OfflineCourse', 1), ('OnlineCourse', 1), ('OnlineCourse', 2)]
+
+
+def test_single_table_after_migration(courses, db):
+    courses = migrate(db)
+    # id оффлайн курсов сдвинуты за онлайн курсы, записи студентов - вместе с ними
+    assert sorted(map(key, courses.all())) == [('OfflineCourse', 3), ('OnlineCourse', 1), ('OnlineCourse', 2)]
+    assert courses.get_by_id('offline', 3).name == 'Algorithms'
+    with db.connection() as connection:
+        assert connection.execute('SELECT course_id FROM student_offlinecourse').fetchall() == [(3,)]
+        # мапперы типов пишут через представления
+        OnlineCourseMapper(db).insert_many(connection, ('category_id', 'name'), [(2, 'Rust')])
+        connection.commit()
+    assert [course.name for course in courses.filter(type='online', category_id=2)] == ['Go', 'Rust']
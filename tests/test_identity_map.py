@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from fox_framework.main import Framework
+from patterns.architectural_system_patterns import UnitOfWork
+from patterns.generative_patterns import Engine, MapperRegistry
+from urls import UnitOfWorkMiddleware
+
+
+@pytest.fixture
+def categories(unit_of_work):
+    for name in ('Python', 'Go'):
+        Engine.create_category().mark_new({'name': name})
+    unit_of_work.commit()
+    return MapperRegistry.get_current_mapper('category')
+
+
+def test_same_row_is_same_object(unit_of_work, categories):
+    first = categories.all()
+    assert categories.all()[0] is first[0]
+    assert categories.get_by(name='Go') is first[1]
+    identity_map = unit_of_work.identity_map
+    assert len(identity_map) == 2
+    assert (identity_map.hits, identity_map.misses) == (3, 2)
+
+
+def test_get_by_id_uses_map_without_query(unit_of_work, categories, monkeypatch):
+    category = categories.get_by_id(1)
+    hits = unit_of_work.identity_map.hits
+    monkeypatch.setattr(categories, 'pool', None)
+    assert categories.get_by_id(1) is category
+    assert unit_of_work.identity_map.hits == hits + 1
+
+
+def test_tables_do_not_share_ids(unit_of_work, categories):
+    Engine.create_user('student').mark_new({'name': 'Ivan'})
+    unit_of_work.commit()
+    student = MapperRegistry.get_current_mapper('student').get_by_id(1)
+    assert student is not categories.get_by_id(1)
+    assert student.name == 'Ivan'
+
+
+def test_each_unit_of_work_has_own_map(categories):
+    category = categories.get_by_id(1)
+    UnitOfWork.new_current()
+    assert categories.get_by_id(1) is not category
+    UnitOfWork.set_current(None)
+    # без единицы работы объекты каждый раз новые
+    assert categories.get_by_id(1) is not categories.get_by_id(1)
+
+
+def test_threads_do_not_share_map(unit_of_work, categories):
+    category = categories.get_by_id(1)
+
+    def load():
+        UnitOfWork.new_current()
+        return categories.get_by_id(1)
+
+    with ThreadPoolExecutor(2) as executor:
+        loaded = list(executor.map(lambda _: load(), range(2)))
+    assert loaded[0] is not category and loaded[1] is not category
+    assert UnitOfWork.get_current() is unit_of_work
+
+
+def test_map_is_released_after_request(categories, wsgi, app_settings):
+    maps = []
+
+    def view(request):
+        categories.get_by_id(1)
+        categories.get_by_id(1)
+        identity_map = UnitOfWork.get_identity_map()
+        maps.append(identity_map)
+        return '200 OK', f'{identity_map.hits}/{identity_map.misses}'
+
+    app = Framework({'/category/': view}, [UnitOfWorkMiddleware()], app_settings)
+    assert wsgi(app, url='/category/')[2] == b'1/1'
+    assert UnitOfWork.get_current() is None
+    assert wsgi(app, url='/category/')[2] == b'1/1'
+    assert maps[0] is not maps[1]
@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from components import settings
+from patterns.generative_patterns import CategoryMapper, ConnectionPool, StudentMapper
+
+NAMES = ['b', 'a', 'c', 'a', 'b', 'a', 'c']
+
+
+@pytest.fixture
+def students(db):
+    with db.connection() as connection:
+        connection.executemany('INSERT INTO students (name) VALUES (?)', [(name,) for name in NAMES])
+        connection.commit()
+    return StudentMapper(db)
+
+
+def keys(objects):
+    return [(student.name, student.id) for student in objects]
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 3, 7, 100])
+def test_all_rows_in_key_order(students, batch_size):
+    assert [student.id for student in students.iter_all(batch_size)] == list(range(1, len(NAMES) + 1))
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 4])
+def test_non_unique_order_column(students, batch_size):
+    # одинаковые имена упорядочиваются по id, на границе порции ничего не теряется
+    expected = sorted(zip(NAMES, range(1, len(NAMES) + 1)))
+    assert keys(students.iter_all(batch_size, order_by='name')) == expected
+
+
+@pytest.mark.parametrize('batch_size', [1, 3])
+def test_descending_order(students, batch_size):
+    # по убыванию имени, одинаковые имена - по возрастанию id
+    expected = sorted(zip(NAMES, range(1, len(NAMES) + 1)), key=lambda key: key[0], reverse=True)
+    assert keys(students.iter_all(batch_size, order_by='-name')) == expected
+
+
+def test_criteria(students):
+    assert [student.id for student in students.iter_all(2, name='a')] == [2, 4, 6]
+    assert [student.id for student in students.iter_all(2, name__in=['b', 'c'], order_by='-id')] == [7, 5, 3, 1]
+
+
+def test_empty_result_and_invalid_column(students):
+    assert list(students.iter_all(2, name='missing')) == []
+    with pytest.raises(ValueError):
+        list(students.iter_all(2, order_by='name; DROP TABLE students'))
+
+
+def test_objects_do_not_go_to_identity_map(unit_of_work, students):
+    list(students.iter_all(2))
+    assert len(unit_of_work.identity_map) == 0
+
+
+def test_connection_is_released_between_batches(students):
+    pool = ConnectionPool(settings.DATABASE, size=1, timeout=0.2)
+    mapper = CategoryMapper(pool)
+    iterator = StudentMapper(pool).iter_all(2)
+    next(iterator)
+    # читатель остановился посреди порций - единственное соединение пула свободно
+    with ThreadPoolExecutor(1) as executor:
+        assert executor.submit(mapper.count).result() == 0
+    assert len(list(iterator)) == len(NAMES) - 1
+    pool.close_all()
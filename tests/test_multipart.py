@@ -0,0 +1,132 @@
+from io import BytesIO
+
+import pytest
+
+from fox_framework.main import Framework
+from fox_framework.request_framework import BadRequest, PostRequests, RequestEntityTooLarge
+
+BOUNDARY = 'xYzZY'
+
+
+def part(name, value, filename=None, content_type=None):
+    disposition = f'form-data; name="{name}"'
+    if filename is not None:
+        disposition += f'; filename="{filename}"'
+    headers = f'Content-Disposition: {disposition}\r\n'
+    if content_type:
+        headers += f'Content-Type: {content_type}\r\n'
+    return f'--{BOUNDARY}\r\n{headers}\r\n'.encode() + value + b'\r\n'
+
+
+def multipart(*parts):
+    return b''.join(parts) + f'--{BOUNDARY}--\r\n'.encode()
+
+
+def parse(body, content_type=f'multipart/form-data; boundary={BOUNDARY}', content_length=None, **parser_options):
+    environ = {
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body) if content_length is None else content_length),
+        'wsgi.input': BytesIO(body),
+    }
+    return PostRequests(**parser_options).get_request_params(environ)
+
+
+def test_fields_and_files():
+    fields, files = parse(multipart(
+        part('name', 'Курс'.encode()),
+        part('upload', b'line1\r\nline2\r\n', filename='notes.txt', content_type='text/plain'),
+    ))
+    assert fields == {'name': 'Курс'}
+    upload = files['upload']
+    assert (upload.filename, upload.content_type, upload.size) == ('notes.txt', 'text/plain', 14)
+    assert upload.read() == b'line1\r\nline2\r\n'
+
+
+def test_repeated_names_are_kept():
+    fields, files = parse(multipart(
+        part('tag', b'one'), part('tag', b'two'),
+        part('doc', b'A', filename='a.txt'), part('doc', b'B', filename='b.txt'),
+    ))
+    assert fields['tag'] == 'two'
+    assert fields.getlist('tag') == ['one', 'two']
+    assert [item.read() for item in files.getlist('doc')] == [b'A', b'B']
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 64 * 1024])
+def test_delimiter_split_between_chunks(chunk_size):
+    content = bytes(range(256)) * 8 + f'\r\n--{BOUNDARY[:-1]}'.encode()
+    fields, files = parse(multipart(part('a', b'1'), part('blob', content, filename='blob.bin'), part('b', b'2')),
+                          chunk_size=chunk_size)
+    assert fields == {'a': '1', 'b': '2'}
+    assert files['blob'].read() == content
+
+
+def test_large_file_is_spooled_to_disk():
+    content = b'x' * 5000
+    _, files = parse(multipart(part('blob', content, filename='big.bin')), spool_max_size=1024)
+    assert files['blob'].file._rolled
+    assert files['blob'].read() == content
+
+
+def test_quoted_boundary_and_part_without_name():
+    body = (f'--{BOUNDARY}\r\nContent-Disposition: form-data\r\n\r\nignored\r\n'.encode()
+            + part('kept', b'yes') + f'--{BOUNDARY}--\r\n'.encode())
+    fields, _ = parse(body, content_type=f'multipart/form-data; boundary="{BOUNDARY}"')
+    assert fields == {'kept': 'yes'}
+
+
+@pytest.mark.parametrize('body, content_type', [
+    (multipart(part('a', b'1')), 'multipart/form-data'),
+    (multipart(part('a', b'1'))[:-20], f'multipart/form-data; boundary={BOUNDARY}'),
+    (f'--{BOUNDARY}\r\nX-Long: {"a" * 20000}'.encode(), f'multipart/form-data; boundary={BOUNDARY}'),
+])
+def test_malformed_multipart(body, content_type):
+    with pytest.raises(BadRequest):
+        parse(body, content_type=content_type)
+
+
+def test_body_shorter_than_content_length():
+    with pytest.raises(BadRequest):
+        parse(b'name=a', content_type='application/x-www-form-urlencoded', content_length=100)
+
+
+def test_body_over_limit():
+    with pytest.raises(RequestEntityTooLarge):
+        parse(b'a=1' * 100, content_type='application/x-www-form-urlencoded', max_body_size=10)
+
+
+def test_urlencoded_repeated_keys():
+    fields, files = parse(b'tag=a&tag=b&name=%D0%9A%D1%83%D1%80%D1%81+1',
+                          content_type='application/x-www-form-urlencoded')
+    assert fields.getlist('tag') == ['a', 'b']
+    assert fields['name'] == 'Курс 1'
+    assert files == {}
+
+
+@pytest.mark.parametrize('body', [b'[1, 2]', b'"text"', b'42', b'{broken'])
+def test_json_body_must_be_an_object(body):
+    with pytest.raises(BadRequest):
+        parse(body, content_type='application/json')
+
+
+def test_json_object():
+    assert parse(b'{"name": "Course"}', content_type='application/json') == ({'name': 'Course'}, {})
+
+
+def test_framework_status_codes(wsgi, app_settings):
+    app_settings.MAX_BODY_SIZE = 512
+
+    def echo(request):
+        return '200 OK', ','.join(request['data'].getlist('tag'))
+
+    app = Framework({'/echo/': echo, '/json/': lambda request: ('200 OK', str(dict(request['data'])))},
+                    [], app_settings)
+    body = multipart(part('tag', b'a'), part('tag', b'b'))
+    status, _, response = wsgi(app, 'POST', '/echo/', b'tag=a&tag=b')
+    assert (status, response) == ('200 OK', b'a,b')
+    status, _, response = wsgi(app, 'POST', '/echo/', body, content_type=f'multipart/form-data; boundary={BOUNDARY}')
+    assert (status, response) == ('200 OK', b'a,b')
+    assert wsgi(app, 'POST', '/echo/', b'{"tag": "a"}', content_type='application/json')[2] == b'a'
+    assert wsgi(app, 'POST', '/json/', b'[1]', content_type='application/json')[0] == '400 Bad Request'
+    assert wsgi(app, 'POST', '/echo/', body + b' ' * 512,
+                content_type=f'multipart/form-data; boundary={BOUNDARY}')[0] == '413 Payload Too Large'
@@ -0,0 +1,154 @@
+from time import monotonic, sleep, time
+
+import pytest
+
+from patterns.architectural_system_patterns import DbCommitException
+from patterns.behavioral_patterns import NotificationBus
+from patterns.generative_patterns import Engine
+
+
+class Recorder:
+    """ Наблюдатель, который первые failures пачек не доставляет """
+
+    def __init__(self, name='test', failures=0):
+        self.name = name
+        self.failures = failures
+        self.batches = []
+
+    def write_batch(self, texts):
+        if self.failures:
+            self.failures -= 1
+            raise OSError('notifier is down')
+        self.batches.append(texts)
+
+    @property
+    def texts(self):
+        return [text for batch in self.batches for text in batch]
+
+
+class ListLogger:
+    def __init__(self):
+        self.lines = []
+
+    def log(self, text):
+        self.lines.append(text)
+
+
+def outbox(db):
+    with db.connection() as connection:
+        return connection.execute('SELECT notifier, text, claimed_by FROM notification_outbox ORDER BY id').fetchall()
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = monotonic() + timeout
+    while not condition():
+        assert monotonic() < deadline, 'timeout'
+        sleep(0.01)
+
+
+@pytest.fixture
+def bus(db):
+    bus = NotificationBus(db, flush_interval=0.01, retry_delay=0.02, logger=ListLogger())
+    yield bus
+    bus.stop()
+
+
+def test_published_notifications_are_delivered_and_deleted(bus, db):
+    recorder = Recorder()
+    bus.register(recorder)
+    for text in ('one', 'two', 'three'):
+        bus.publish('test', text)
+    bus.stop()
+    assert recorder.texts == ['one', 'two', 'three']
+    assert outbox(db) == []
+
+
+def test_publish_waits_for_unit_of_work_commit(bus, db, unit_of_work):
+    recorder = Recorder()
+    bus.register(recorder)
+    Engine.create_category().mark_new({'name': 'New'})
+    bus.publish('test', 'new category')
+    assert outbox(db) == []
+    unit_of_work.commit()
+    bus.stop()
+    assert recorder.texts == ['new category']
+
+
+def test_failed_commit_drops_notification(bus, db, unit_of_work):
+    bus.register(Recorder())
+    Engine.create_category().mark_new({'missing_column': 'x'})
+    bus.publish('test', 'never')
+    with pytest.raises(DbCommitException):
+        unit_of_work.commit()
+    assert outbox(db) == []
+
+
+def test_failed_batch_is_retried_with_backoff(bus, db):
+    recorder = Recorder(failures=2)
+    bus.register(recorder)
+    bus.publish('test', 'retry me')
+    wait_for(lambda: recorder.texts)
+    assert recorder.texts == ['retry me']
+    wait_for(lambda: outbox(db) == [])
+    errors = [line for line in bus.logger.lines if 'не доставлены' in line]
+    assert len(errors) == 2
+    assert 'попытка 1, повтор через 0.02' in errors[0]
+    assert 'попытка 2, повтор через 0.04' in errors[1]
+
+
+def test_unregistered_notifier_keeps_row(bus, db):
+    bus.publish('unknown', 'kept')
+    bus.stop()
+    assert outbox(db) == [('unknown', 'kept', bus.owner)]
+    assert any('не зарегистрирован' in line for line in bus.logger.lines)
+
+
+def test_start_claims_orphaned_rows(bus, db):
+    now = time()
+    with db.connection() as connection:
+        bus.create_table(connection)
+        connection.executemany(
+            'INSERT INTO notification_outbox (notifier, text, claimed_by, claimed_at) VALUES (?, ?, ?, ?)', [
+                ('test', 'stale', 'dead-process', now - 3600),
+                ('test', 'no owner', None, None),
+                ('test', 'alive', 'other-process', now),
+            ])
+        connection.commit()
+    recorder = Recorder()
+    bus.register(recorder)
+    bus.start()
+    bus.stop()
+    assert recorder.texts == ['stale', 'no owner']
+    assert outbox(db) == [('test', 'alive', 'other-process')]
+
+
+def test_claim_renews_own_rows(bus, db):
+    with db.connection() as connection:
+        bus.create_table(connection)
+        bus.insert(connection, 'test', 'mine')
+        connection.execute('UPDATE notification_outbox SET claimed_at=0')
+        connection.commit()
+        # свою строку процесс не забирает повторно, но продлевает
+        assert bus.claim(connection) == []
+        claimed_at = connection.execute('SELECT claimed_at FROM notification_outbox').fetchone()[0]
+    assert claimed_at > time() - 60
+
+
+def test_periodic_claim_redelivers_rows_of_stopped_process(db):
+    stopped = NotificationBus(db, flush_interval=0.01)
+    stopped.start()
+    stopped.stop()
+    # строка осталась от процесса, который упал до доставки
+    with db.connection() as connection:
+        stopped.insert(connection, 'test', 'orphan')
+        connection.commit()
+    recorder = Recorder()
+    bus = NotificationBus(db, flush_interval=0.01, claim_timeout=0.1)
+    bus.register(recorder)
+    try:
+        bus.start()
+        wait_for(lambda: recorder.texts)
+    finally:
+        bus.stop()
+    assert recorder.texts == ['orphan']
+    assert outbox(db) == []
@@ -0,0 +1,101 @@
+import pytest
+
+from fox_framework.main import Framework
+from fox_framework.router import MethodNotAllowed, NotFound, Router
+from patterns import structural_patterns
+from patterns.structural_patterns import AppRoute
+
+
+def view(name):
+    def handler(request):
+        return '200 OK', name
+    handler.__name__ = name
+    return handler
+
+
+@pytest.fixture
+def router():
+    return Router.from_routes({
+        '/': view('index'),
+        '/about/': view('about'),
+        '/category/<int:id>/courses/': view('courses'),
+        '/category/new/courses/': view('new_courses'),
+        '/user/<name>/': view('user'),
+        '/files/<path:file_path>': view('files'),
+        '/api/': {'GET': view('api_get'), 'POST': view('api_post')},
+    })
+
+
+def resolve_name(router, path, method='GET'):
+    handler, params, rule = router.resolve(path, method)
+    return handler.__name__, params, rule
+
+
+def test_static_routes(router):
+    assert resolve_name(router, '/') == ('index', {}, '/')
+    assert resolve_name(router, '/about/') == ('about', {}, '/about/')
+    # завершающий слэш не обязателен
+    assert resolve_name(router, '/about')[0] == 'about'
+
+
+def test_int_parameter_is_converted(router):
+    assert resolve_name(router, '/category/42/courses/') == (
+        'courses', {'id': 42}, '/category/<int:id>/courses/')
+
+
+def test_static_segment_wins_over_parameter(router):
+    assert resolve_name(router, '/category/new/courses/')[0] == 'new_courses'
+
+
+def test_str_parameter_and_catch_all(router):
+    assert resolve_name(router, '/user/ivan/')[1] == {'name': 'ivan'}
+    assert resolve_name(router, '/files/css/site/main.css')[1] == {'file_path': 'css/site/main.css'}
+
+
+@pytest.mark.parametrize('path', ['/missing/', '/category/abc/courses/', '/category/1/', '/files/'])
+def test_not_found(router, path):
+    with pytest.raises(NotFound):
+        router.resolve(path, 'GET')
+
+
+def test_method_dispatch(router):
+    assert resolve_name(router, '/api/', 'POST')[0] == 'api_post'
+    # HEAD отвечает контроллером GET
+    assert resolve_name(router, '/api/', 'HEAD')[0] == 'api_get'
+    with pytest.raises(MethodNotAllowed) as error:
+        router.resolve('/api/', 'DELETE')
+    assert error.value.allowed == ['GET', 'POST']
+
+
+def test_any_method_view_is_fallback_for_method_views():
+    router = Router()
+    router.add('/form/', view('any'))
+    router.add('/form/', view('post'), ('POST',))
+    assert resolve_name(router, '/form/', 'POST')[0] == 'post'
+    assert resolve_name(router, '/form/', 'PUT')[0] == 'any'
+
+
+@pytest.mark.parametrize('order', [('plain', 'post'), ('post', 'plain')])
+def test_app_route_mixes_plain_and_method_views(monkeypatch, order):
+    routes = {}
+    monkeypatch.setattr(structural_patterns, 'routes_from_decorator', routes)
+    registrations = {
+        'plain': lambda: AppRoute('/mixed/')(type('Plain', (), {'__call__': view('plain')})),
+        'post': lambda: AppRoute('/mixed/', methods=['post'])(type('Post', (), {'__call__': view('post')})),
+    }
+    for name in order:
+        registrations[name]()
+    router = Router.from_routes(routes)
+    assert type(router.resolve('/mixed/', 'GET')[0]).__name__ == 'Plain'
+    assert type(router.resolve('/mixed/', 'POST')[0]).__name__ == 'Post'
+
+
+def test_framework_dispatch(wsgi, app_settings):
+    app = Framework({
+        '/category/<int:id>/': lambda request: ('200 OK', f'category {request["path_params"]["id"]}'),
+        '/only-post/': {'POST': lambda request: ('200 OK', 'posted')},
+    }, [], app_settings)
+    assert wsgi(app, url='/category/7/')[::2] == ('200 OK', b'category 7')
+    assert wsgi(app, url='/unknown/')[0].startswith('404')
+    assert wsgi(app, url='/only-post/')[0].startswith('405')
+    assert wsgi(app, 'POST', '/only-post/')[2] == b'posted'
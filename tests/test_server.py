@@ -0,0 +1,161 @@
+import socket
+import threading
+from http.client import HTTPConnection
+
+import pytest
+
+from fox_framework.server import Worker, create_listener
+
+
+FILE_CONTENT = bytes(range(256)) * 1000
+
+
+def make_app(file_path):
+    def app(environ, start_response):
+        path = environ['PATH_INFO']
+        if path == '/stream/':
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return iter([b'hello', b'', b' world'])
+        if path == '/empty/':
+            start_response('204 No Content', [])
+            return []
+        if path == '/file/':
+            start_response('200 OK', [('Content-Length', str(len(FILE_CONTENT)))])
+            return environ['wsgi.file_wrapper'](open(file_path, 'rb'))
+        if path == '/error/':
+            raise RuntimeError('boom')
+        if path == '/read/':
+            body = environ['wsgi.input'].read()
+        else:
+            # тело запроса приложение не читает
+            body = f'{environ["REQUEST_METHOD"]} {path}'.encode()
+        start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))])
+        return [body]
+    return app
+
+
+@pytest.fixture
+def worker(tmp_path):
+    file_path = tmp_path / 'data.bin'
+    file_path.write_bytes(FILE_CONTENT)
+    listener = create_listener('127.0.0.1', 0)
+    worker = Worker(make_app(file_path), listener, threads=4, keepalive_timeout=1, multiprocess=False)
+    thread = threading.Thread(target=worker.serve, daemon=True)
+    thread.start()
+    yield worker
+    worker.stop()
+    thread.join(5)
+    listener.close()
+
+
+@pytest.fixture
+def client(worker):
+    connection = HTTPConnection(*worker.server_address, timeout=5)
+    yield connection
+    connection.close()
+
+
+def raw_request(worker, data):
+    """ Все байты ответа до закрытия соединения сервером """
+    with socket.create_connection(worker.server_address, timeout=5) as sock:
+        sock.sendall(data)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+
+def test_keep_alive(client):
+    client.request('GET', '/one/')
+    response = client.getresponse()
+    assert (response.status, response.read()) == (200, b'GET /one/')
+    assert response.getheader('Connection') is None
+    sock = client.sock
+    client.request('GET', '/two/')
+    assert client.getresponse().read() == b'GET /two/'
+    assert client.sock is sock
+
+
+def test_pipelined_requests(worker):
+    response = raw_request(worker, b'GET /a/ HTTP/1.1\r\nHost: x\r\n\r\n'
+                                   b'GET /b/ HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n')
+    assert response.count(b'HTTP/1.1 200 OK') == 2
+    assert response.index(b'GET /a/') < response.index(b'GET /b/')
+
+
+def test_response_without_length_is_chunked(worker, client):
+    client.request('GET', '/stream/')
+    response = client.getresponse()
+    assert response.getheader('Transfer-Encoding') == 'chunked'
+    assert response.read() == b'hello world'
+    # пустой кусок приложения не завершает ответ раньше времени
+    raw = raw_request(worker, b'GET /stream/ HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n')
+    assert raw.endswith(b'\r\n\r\n5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n')
+
+
+def test_http_10_without_length_closes_connection(worker):
+    raw = raw_request(worker, b'GET /stream/ HTTP/1.0\r\n\r\n')
+    headers, _, body = raw.partition(b'\r\n\r\n')
+    assert b'Connection: close' in headers
+    assert b'Transfer-Encoding' not in headers
+    assert body == b'hello world'
+
+
+@pytest.mark.parametrize('method, path', [('HEAD', '/stream/'), ('GET', '/empty/')])
+def test_no_body_responses_are_not_chunked(client, method, path):
+    client.request(method, path)
+    response = client.getresponse()
+    assert response.getheader('Transfer-Encoding') is None
+    assert response.read() == b''
+    # соединение осталось в рабочем состоянии
+    client.request('GET', '/after/')
+    assert client.getresponse().read() == b'GET /after/'
+
+
+def test_unread_body_is_drained(client):
+    client.request('POST', '/ignore/', body=b'x' * 1000)
+    assert client.getresponse().read() == b'POST /ignore/'
+    client.request('POST', '/read/', body=b'payload')
+    assert client.getresponse().read() == b'payload'
+
+
+def test_large_unread_body_closes_connection(worker):
+    body = b'x' * (128 * 1024)
+    with socket.create_connection(worker.server_address, timeout=5) as sock:
+        sock.sendall(b'POST /ignore/ HTTP/1.1\r\nHost: x\r\nContent-Length: %d\r\n\r\n' % len(body))
+        response = sock.recv(65536)
+    assert response.startswith(b'HTTP/1.1 200 OK')
+    assert b'Connection: close' in response
+
+
+def test_chunked_request_body_is_rejected(worker):
+    raw = raw_request(worker, b'POST /read/ HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n\r\n'
+                              b'3\r\nabc\r\n0\r\n\r\n')
+    assert raw.startswith(b'HTTP/1.1 411')
+
+
+def test_application_error(worker):
+    raw = raw_request(worker, b'GET /error/ HTTP/1.1\r\nHost: x\r\n\r\n')
+    assert raw.startswith(b'HTTP/1.1 500 Internal Server Error')
+    assert b'Connection: close' in raw
+    assert raw.endswith(b'\r\n\r\nInternal Server Error')
+
+
+def test_file_wrapper(client):
+    client.request('GET', '/file/')
+    assert client.getresponse().read() == FILE_CONTENT
+    client.request('HEAD', '/file/')
+    assert client.getresponse().read() == b''
+
+
+def test_max_requests_closes_connection(worker, client):
+    worker.max_requests = 2
+    client.request('GET', '/one/')
+    response = client.getresponse()
+    assert (response.getheader('Connection'), response.read()) == (None, b'GET /one/')
+    client.request('GET', '/two/')
+    response = client.getresponse()
+    assert response.getheader('Connection') == 'close'
+    assert response.read() == b'GET /two/'
@@ -0,0 +1,148 @@
+import gzip
+import os
+from email.utils import formatdate
+
+import pytest
+
+from fox_framework.main import Framework
+from fox_framework.static import MANIFEST_NAME
+
+CONTENT = b'0123456789abcdef'
+STYLES = b'body { color: #333; }\n' * 40
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    directory = tmp_path / 'static'
+    directory.mkdir()
+    (directory / 'data.bin').write_bytes(CONTENT)
+    (directory / 'site.css').write_bytes(STYLES)
+    (directory / 'pre.css').write_bytes(STYLES)
+    (directory / 'pre.css.gz').write_bytes(gzip.compress(STYLES))
+    (directory / MANIFEST_NAME).write_text('{}')
+    (tmp_path / 'secret.txt').write_text('secret')
+    return directory
+
+
+@pytest.fixture
+def app(static_dir, app_settings):
+    app_settings.STATIC_STAT_TTL = 0
+    return Framework({}, [], app_settings)
+
+
+def test_full_response_headers(app, wsgi):
+    status, headers, body = wsgi(app, url='/static/data.bin')
+    assert status == '200 OK'
+    assert body == CONTENT
+    assert headers['Content-Length'] == str(len(CONTENT))
+    assert headers['Accept-Ranges'] == 'bytes'
+    assert headers['ETag'].startswith('"')
+    assert 'Last-Modified' in headers
+
+
+def test_head_has_length_but_no_body(app, wsgi):
+    status, headers, body = wsgi(app, 'HEAD', '/static/data.bin')
+    assert status == '200 OK'
+    assert headers['Content-Length'] == str(len(CONTENT))
+    assert body == b''
+
+
+def test_if_none_match_returns_304(app, wsgi):
+    etag = wsgi(app, url='/static/data.bin')[1]['ETag']
+    for value in (etag, f'W/{etag}', f'"other", {etag}', '*'):
+        status, headers, body = wsgi(app, url='/static/data.bin', headers={'If-None-Match': value})
+        assert status == '304 Not Modified'
+        assert body == b''
+        assert headers['ETag'] == etag
+    assert wsgi(app, url='/static/data.bin', headers={'If-None-Match': '"other"'})[0] == '200 OK'
+
+
+def test_if_modified_since(app, wsgi, static_dir):
+    mtime = os.stat(static_dir / 'data.bin').st_mtime
+    later = formatdate(mtime + 60, usegmt=True)
+    earlier = formatdate(mtime - 60, usegmt=True)
+    assert wsgi(app, url='/static/data.bin', headers={'If-Modified-Since': later})[0] == '304 Not Modified'
+    assert wsgi(app, url='/static/data.bin', headers={'If-Modified-Since': earlier})[0] == '200 OK'
+
+
+def test_etag_changes_with_file(app, wsgi, static_dir):
+    etag = wsgi(app, url='/static/data.bin')[1]['ETag']
+    stat = os.stat(static_dir / 'data.bin')
+    (static_dir / 'data.bin').write_bytes(CONTENT + b'!')
+    os.utime(static_dir / 'data.bin', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    status, headers, body = wsgi(app, url='/static/data.bin', headers={'If-None-Match': etag})
+    assert status == '200 OK'
+    assert headers['ETag'] != etag
+    assert body == CONTENT + b'!'
+
+
+@pytest.mark.parametrize('header, expected_range, expected_body', [
+    ('bytes=2-5', '2-5', CONTENT[2:6]),
+    ('bytes=10-', '10-15', CONTENT[10:]),
+    ('bytes=-3', '13-15', CONTENT[-3:]),
+    ('bytes=4-100', '4-15', CONTENT[4:]),
+])
+def test_range(app, wsgi, header, expected_range, expected_body):
+    status, headers, body = wsgi(app, url='/static/data.bin', headers={'Range': header})
+    assert status == '206 Partial Content'
+    assert headers['Content-Range'] == f'bytes {expected_range}/{len(CONTENT)}'
+    assert headers['Content-Length'] == str(len(expected_body))
+    assert body == expected_body
+
+
+@pytest.mark.parametrize('header', ['bytes=16-', 'bytes=5-2', 'bytes=-0'])
+def test_unsatisfiable_range(app, wsgi, header):
+    status, headers, body = wsgi(app, url='/static/data.bin', headers={'Range': header})
+    assert status == '416 Range Not Satisfiable'
+    assert headers['Content-Range'] == f'bytes */{len(CONTENT)}'
+
+
+@pytest.mark.parametrize('header', ['bytes=0-1,4-5', 'items=0-1', 'bytes=a-b'])
+def test_unsupported_range_returns_full_body(app, wsgi, header):
+    status, _, body = wsgi(app, url='/static/data.bin', headers={'Range': header})
+    assert status == '200 OK'
+    assert body == CONTENT
+
+
+def test_if_range(app, wsgi):
+    etag = wsgi(app, url='/static/data.bin')[1]['ETag']
+    assert wsgi(app, url='/static/data.bin', headers={'Range': 'bytes=0-1', 'If-Range': etag})[0] == '206 Partial Content'
+    status, _, body = wsgi(app, url='/static/data.bin', headers={'Range': 'bytes=0-1', 'If-Range': '"stale"'})
+    assert status == '200 OK'
+    assert body == CONTENT
+
+
+def test_gzip_on_the_fly(app, wsgi):
+    plain_etag = wsgi(app, url='/static/site.css')[1]['ETag']
+    status, headers, body = wsgi(app, url='/static/site.css', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert status == '200 OK'
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['Vary'] == 'Accept-Encoding'
+    assert headers['ETag'] != plain_etag
+    assert gzip.decompress(body) == STYLES
+    # сжатый ответ не режется по Range
+    status, headers, body = wsgi(app, url='/static/site.css', headers={'Accept-Encoding': 'gzip', 'Range': 'bytes=0-9'})
+    assert status == '200 OK'
+    assert gzip.decompress(body) == STYLES
+
+
+def test_gzip_refused_with_zero_quality(app, wsgi):
+    headers = wsgi(app, url='/static/site.css', headers={'Accept-Encoding': 'gzip;q=0'})[1]
+    assert 'Content-Encoding' not in headers
+
+
+def test_precompressed_variant(app, wsgi, static_dir):
+    status, headers, body = wsgi(app, url='/static/pre.css', headers={'Accept-Encoding': 'gzip'})
+    assert headers['Content-Encoding'] == 'gzip'
+    assert body == (static_dir / 'pre.css.gz').read_bytes()
+
+
+@pytest.mark.parametrize('url', ['/static/missing.txt', '/static/../secret.txt', f'/static/{MANIFEST_NAME}'])
+def test_not_served(app, wsgi, url):
+    assert wsgi(app, url=url)[0] == '404 Not Found'
+
+
+def test_only_get_and_head(app, wsgi):
+    status, headers, _ = wsgi(app, 'POST', '/static/data.bin')
+    assert status == '405 Method Not Allowed'
+    assert headers['Allow'] == 'GET, HEAD'
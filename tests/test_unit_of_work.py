@@ -0,0 +1,103 @@
+import pytest
+
+from patterns.architectural_system_patterns import DbCommitException, UnitOfWork
+from patterns.generative_patterns import Engine, MapperRegistry
+
+
+def count(db, table):
+    with db.connection() as connection:
+        return connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def test_commit_without_changes_does_nothing(unit_of_work):
+    unit_of_work.commit()
+    assert unit_of_work.last_commit_stats is None
+
+
+def test_objects_are_grouped_into_one_statement_per_mapper(unit_of_work, db):
+    for index in range(50):
+        Engine.create_user('student').mark_new({'name': f'student {index}'})
+    for name in ('Python', 'Go'):
+        Engine.create_category().mark_new({'name': name})
+    unit_of_work.commit()
+    stats = unit_of_work.last_commit_stats
+    assert (stats.rows, stats.statements) == (52, 2)
+    assert stats.elapsed > 0
+    assert (count(db, 'students'), count(db, 'categories')) == (50, 2)
+    assert not unit_of_work.has_changes()
+
+
+def test_different_field_sets_are_separate_statements(unit_of_work):
+    Engine.create_course('online').mark_new({'name': 'A', 'category_id': 1})
+    Engine.create_course('online').mark_new({'category_id': 1, 'name': 'B'})
+    Engine.create_course('online').mark_new({'name': 'C', 'category_id': 1})
+    unit_of_work.commit()
+    assert unit_of_work.last_commit_stats.statements == 2
+    names = [course.name for course in MapperRegistry.get_current_mapper('online').all()]
+    assert names == ['A', 'C', 'B']
+
+
+def test_update_and_delete(unit_of_work, db):
+    for name in ('one', 'two', 'three'):
+        Engine.create_category().mark_new({'name': name})
+    unit_of_work.commit()
+    mapper = MapperRegistry.get_current_mapper('category')
+    one, two, three = mapper.all()
+    one.mark_dirty({'name': 'first'})
+    two.mark_dirty({'name': 'second'})
+    three.mark_removed()
+    unit_of_work.commit()
+    assert (unit_of_work.last_commit_stats.rows, unit_of_work.last_commit_stats.statements) == (3, 2)
+    # изменённые строки уходят из карты присутствия и читаются заново
+    assert [category.name for category in mapper.all()] == ['first', 'second']
+    assert count(db, 'categories') == 2
+
+
+def test_failed_commit_rolls_back_and_keeps_objects(unit_of_work, db):
+    received = []
+    UnitOfWork.add_commit_listener(received.append)
+    try:
+        Engine.create_category().mark_new({'name': 'valid'})
+        Engine.create_user('student').mark_new({'missing_column': 'x'})
+        with pytest.raises(DbCommitException):
+            unit_of_work.commit()
+        assert count(db, 'categories') == 0
+        assert len(unit_of_work.new_objects) == 2
+        assert unit_of_work.changed_tables == set()
+        assert received == []
+
+        # после исправления те же объекты записываются повторным commit
+        unit_of_work.new_objects[1]['schema'] = {'name': 'fixed'}
+        unit_of_work.commit()
+        assert (count(db, 'categories'), count(db, 'students')) == (1, 1)
+        assert received == [{'categories', 'students'}]
+    finally:
+        UnitOfWork.remove_commit_listener(received.append)
+
+
+def test_hooks_run_in_transaction_and_after_commit(unit_of_work, db):
+    events = []
+
+    def in_transaction(connection):
+        connection.execute("INSERT INTO students (name) VALUES ('from hook')")
+        events.append('transaction')
+
+    unit_of_work.on_commit(in_transaction, lambda: events.append('after'))
+    unit_of_work.commit()
+    assert events == ['transaction', 'after']
+    assert count(db, 'students') == 1
+    # хуки выполняются один раз
+    Engine.create_category().mark_new({'name': 'next'})
+    unit_of_work.commit()
+    assert events == ['transaction', 'after']
+
+
+def test_failed_hook_rolls_back_objects(unit_of_work, db):
+    def fail(connection):
+        raise RuntimeError('hook failed')
+
+    Engine.create_category().mark_new({'name': 'lost'})
+    unit_of_work.on_commit(fail)
+    with pytest.raises(DbCommitException):
+        unit_of_work.commit()
+    assert count(db, 'categories') == 0
@@ -1,5 +1,42 @@
 from datetime import date
 from views import *
+from fox_framework.middleware import Middleware
+from patterns.behavioral_patterns import LogContext
+
+
+class LogContextMiddleware(Middleware):
+    """ id запроса для лога: из заголовка X-Request-Id или новый """
+    name = 'log_context'
+
+    def before(self, request):
+        request['request_id'] = LogContext.begin(request['headers'].get('X-Request-Id'))
+
+    def after(self, request, response):
+        LogContext.end()
+        return response
+
+    def on_exception(self, request, exception):
+        LogContext.end()
+
+
+class UnitOfWorkMiddleware(Middleware):
+    """ У каждого запроса своя единица работы в своём потоке """
+    name = 'unit_of_work'
+
+    def before(self, request):
+        UnitOfWork.new_current()
+        UnitOfWork.get_current().set_mapper_registry(MapperRegistry)
+
+    def after(self, request, response):
+        # карта присутствия освобождается сразу после ответа;
+        # потоковому ответу она ещё нужна, пока читаются строки из базы
+        if not response.streaming:
+            UnitOfWork.set_current(None)
+        return response
+
+    def on_exception(self, request, exception):
+        # несохранённые изменения упавшего запроса не должны достаться следующему
+        UnitOfWork.set_current(None)
 
 
 # front controller
@@ -12,7 +49,7 @@ def other_front(request):
     request['key'] = 'key'
 
 
-fronts = [secret_front, other_front]
+middlewares = [LogContextMiddleware(), UnitOfWorkMiddleware(), secret_front, other_front]
 
 routes_from_urls = {
     # '/': Index(),
@@ -20,6 +57,7 @@ routes_from_urls = {
     # '/contact/': Contact(),
     '/create_category/': CreateCategory(),
     '/course-list/': CourseList(),
+    '/category/<int:id>/courses/': CourseList(),
     '/create-course/': CreateCourse(),
     '/course-copy/': CopyCourse(),
     '/ex/': Example()
@@ -1,22 +1,26 @@
+from itertools import chain, islice
+
+from components.settings import API_CACHE_MAX_ROWS
+from fox_framework.response import Response, StreamingResponse
 from fox_framework.templator import render
-from patterns.architectural_system_patterns import UnitOfWork
-from patterns.behavioral_patterns import ListView, CreateView, EmailNotifier, SmsNotifier, BaseSerializer, \
-    ConsoleWriter
-from patterns.generative_patterns import Engine, Logger, CourseFactory, MapperRegistry
-from patterns.structural_patterns import AppRoute, Debug
+from patterns.architectural_system_patterns import RecordNotFoundException, UnitOfWork
+from patterns.behavioral_patterns import ListView, CreateView, EmailNotifier, SmsNotifier, ConsoleWriter, \
+    NotificationBus
+from patterns.generative_patterns import Engine, Logger, CourseFactory, MapperRegistry, CourseSerializer, \
+    OnlineCourse, connection_pool
+from patterns.structural_patterns import AppRoute
 
 site_engine = Engine()
 logger_to_file = Logger('file')
-logger_to_console = Logger('console', ConsoleWriter())
-email_notifier = EmailNotifier()
-sms_notifier = SmsNotifier()
-UnitOfWork.new_current()
-UnitOfWork.get_current().set_mapper_registry(MapperRegistry)
+logger_to_console = Logger('console', ConsoleWriter(buffered=True))
+# уведомления пишутся в фоновом потоке, запрос их не ждёт
+notification_bus = NotificationBus(connection_pool, logger=logger_to_file)
+email_notifier = EmailNotifier(notification_bus)
+sms_notifier = SmsNotifier(notification_bus)
 
 
-@AppRoute('/')
+@AppRoute('/', cache_ttl=60, cache_tables=('categories',))
 class Index:
-    @Debug()
     def __call__(self, request):
         logger_to_file.log('loading Index')
         logger_to_console.log('loading Index')
@@ -26,7 +30,6 @@ class Index:
 
 @AppRoute('/contact/')
 class Contact:
-    @Debug()
     def __call__(self, request):
         logger_to_file.log('loading Contacts')
         logger_to_console.log('loading Contacts')
@@ -35,7 +38,6 @@ class Contact:
 
 @AppRoute('/about/')
 class About:
-    @Debug()
     def __call__(self, request):
         logger_to_file.log('loading About')
         logger_to_console.log('loading About')
@@ -47,7 +49,6 @@ class CreateCategory(CreateView):
 
     def create_obj(self, data: dict):
         name = data.get('name')
-        name = site_engine.decode_value(name)
         new_category = site_engine.create_category()
         schema = {'name': name}
         new_category.mark_new(schema)
@@ -55,15 +56,17 @@ class CreateCategory(CreateView):
 
 
 class CourseList:
-    @Debug()
+    # кэш ответов: маршрут задан в urls.py, поэтому без AppRoute
+    cache_ttl = 60
+    cache_tables = ('categories', 'online_course', 'offline_course')
+
     def __call__(self, request):
         try:
             mapper_category = MapperRegistry.get_current_mapper('category')
-            category = mapper_category.get_by_id(int(request['request_params']['id']))
-            mapper_online = MapperRegistry.get_current_mapper('online')
-            mapper_offline = MapperRegistry.get_current_mapper('offline')
-            all_course_list = mapper_online.all() + mapper_offline.all()
-            course_list = [course for course in all_course_list if course.category_id == category.id]
+            category_id = request['path_params'].get('id') or request['request_params']['id']
+            category = mapper_category.get_by_id(int(category_id))
+            mapper_course = MapperRegistry.get_current_mapper('course')
+            course_list = mapper_course.filter(category_id=category.id)
             logger_to_file.log('loading courses list')
             return '200 OK', render('course_list.html',
                                     course_list=course_list,
@@ -74,24 +77,35 @@ class CourseList:
 
 
 class CreateCourse:
-    @Debug()
     def __call__(self, request):
         if request['method'] == 'POST':
             data = request['data']
-            name = data['name']
-            type = data['type']
-            name = site_engine.decode_value(name)
+            name = data.get('name')
+            type = data.get('type')
+            # id категории в адресе формы: между GET и POST запрос может попасть в другой процесс
+            try:
+                category_id = int(request['request_params']['id'])
+            except (KeyError, ValueError):
+                return '400 Bad Request', 'Неверно указана категория курса'
+            if not isinstance(name, str) or not name.strip():
+                return '400 Bad Request', 'Не указано название курса'
+            if type not in CourseFactory.types:
+                return '400 Bad Request', 'Неверно указан тип курса'
             mapper = MapperRegistry.get_current_mapper('category')
-            category = mapper.get_by_id(self.category_id)
+            try:
+                category = mapper.get_by_id(category_id)
+            except RecordNotFoundException:
+                return '404 Not Found', 'Категория не найдена'
             course = site_engine.create_course(type)
             schema = {'name': name, 'category_id': str(category.id)}
             course.mark_new(schema)
-            UnitOfWork.get_current().commit()
             course.name = name
             course.category_id = category.id
             course.observers.append(email_notifier)
             course.observers.append(sms_notifier)
+            # уведомления попадают в outbox той же транзакцией, что и курс
             course.notify()
+            UnitOfWork.get_current().commit()
             logger_to_file.log('new course added')
             return '200 OK', render('create_course.html',
                                     category_name=category.name,
@@ -100,43 +114,36 @@ class CreateCourse:
                                     )
         else:
             try:
-                self.category_id = int(request['request_params']['id'])
+                category_id = int(request['request_params']['id'])
                 mapper = MapperRegistry.get_current_mapper('category')
-                category = mapper.get_by_id(self.category_id)
+                category = mapper.get_by_id(category_id)
                 return '200 OK', render('create_course.html',
                                         category_name=category.name,
                                         types_course_list=CourseFactory.types.keys(),
                                         id=category.id)
             except (KeyError, ValueError):
                 return '200 OK', 'Неверно указана категория курса'
+            except RecordNotFoundException:
+                return '404 Not Found', 'Категория не найдена'
 
 
 class CopyCourse:
-    @Debug()
     def __call__(self, request):
         data = request['request_params']
         try:
-            category_id = data['category_id']
+            category_id = int(data['category_id'])
             name = data['name']
-            name = site_engine.decode_value(name)
-            mapper_online = MapperRegistry.get_current_mapper('online')
-            mapper_offline = MapperRegistry.get_current_mapper('offline')
-            all_course_list = mapper_online.all() + mapper_offline.all()
-            course_for_copy = None
-            for course in all_course_list:
-                print(course.name, )
-                if course.name == name and course.category_id == int(category_id):
-                    course_for_copy = course
-            print(course_for_copy)
+            mapper_course = MapperRegistry.get_current_mapper('course')
+            found = mapper_course.filter(name=name, category_id=category_id)
+            course_for_copy = found[-1] if found else None
             if course_for_copy:
                 new_course = course_for_copy.clone()
                 new_course.name = f'copy_{name}'
                 schema = {'name': new_course.name, 'category_id': str(new_course.category_id)}
                 new_course.mark_new(schema)
-                UnitOfWork.get_current().commit()
                 new_course.notify()
-            all_course_list = mapper_online.all() + mapper_offline.all()
-            course_list = [course for course in all_course_list if course.category_id == int(category_id)]
+                UnitOfWork.get_current().commit()
+            course_list = mapper_course.filter(category_id=category_id)
             mapper_category = MapperRegistry.get_current_mapper('category')
             category = mapper_category.get_by_id(category_id)
             return '200 OK', render('course_list.html',
@@ -157,10 +164,12 @@ class Example:
 class StudentList(ListView):
     template_name = 'students_list.html'
     context_object_name = 'student_list'
+    streaming = True
 
     def get_queryset(self):
+        # студенты читаются порциями по мере рендера страницы
         mapper = MapperRegistry.get_current_mapper('student')
-        return mapper.all()
+        return mapper.iter_all(batch_size=self.batch_size)
 
 
 @AppRoute('/create-student/')
@@ -169,7 +178,6 @@ class StudentCreate(CreateView):
 
     def create_obj(self, data: dict):
         name = data.get('name')
-        name = site_engine.decode_value(name)
         new_obj = site_engine.create_user('student')
         schema = {'name': name}
         new_obj.mark_new(schema)
@@ -182,49 +190,74 @@ class AddStudentByCourse(CreateView):
 
     def get_context_data(self):
         context = super().get_context_data()
-        mapper_online = MapperRegistry.get_current_mapper('online')
-        mapper_offline = MapperRegistry.get_current_mapper('offline')
-        all_course_list = mapper_online.all() + mapper_offline.all()
+        mapper_course = MapperRegistry.get_current_mapper('course')
+        all_course_list = mapper_course.all()
         mapper_student = MapperRegistry.get_current_mapper('student')
         all_students = mapper_student.all()
         context['course_list'] = all_course_list
         context['student_list'] = all_students
+        # записи вместе со студентами и курсами: один запрос с JOIN на таблицу записей
+        enrollment_list = []
+        for name in ('student_onlinecourse', 'student_offlinecourse'):
+            mapper = MapperRegistry.get_current_mapper(name)
+            enrollment_list.extend(mapper.select_related('student', 'course', order_by='id'))
+        context['enrollment_list'] = enrollment_list
         return context
 
     def create_obj(self, data):
-        course_name = data['course']
-        course_name = site_engine.decode_value(course_name)
-        student_name = data['student']
-        student_name = site_engine.decode_value(student_name)
-        mapper_online = MapperRegistry.get_current_mapper('online')
-        mapper_offline = MapperRegistry.get_current_mapper('offline')
+        course_name = data.get('course')
+        student_name = data.get('student')
+        if not course_name or not student_name:
+            return '400 Bad Request', 'Не указаны курс или студент'
+        mapper_course = MapperRegistry.get_current_mapper('course')
         mapper_student = MapperRegistry.get_current_mapper('student')
-        all_students = mapper_student.all()
-        for student in all_students:
-            if student.name == student_name:
-                student_id = student.id
-        for course in mapper_online.all():
-            if course.name == course_name:
-                course_id = course.id
-                new_obj = site_engine.create_student_online_course()
-                schema = {'student_id': student_id, 'course_id': course_id}
-                new_obj.mark_new(schema)
-                UnitOfWork.get_current().commit()
-                return
-        for course in mapper_offline.all():
-            if course.name == course_name:
-                course_id = course.id
-                new_obj = site_engine.create_student_offline_course()
-                schema = {'student_id': student_id, 'course_id': course_id}
-                new_obj.mark_new(schema)
-                UnitOfWork.get_current().commit()
+        try:
+            student_id = mapper_student.get_by(name=student_name).id
+        except RecordNotFoundException:
+            return '404 Not Found', 'Студент не найден'
+        # онлайн курс с таким именем выбирается раньше оффлайн
+        courses = mapper_course.filter(order_by=('-type', 'id'), limit=1, name=course_name)
+        if not courses:
+            return '404 Not Found', 'Курс не найден'
+        course = courses[0]
+        if isinstance(course, OnlineCourse):
+            new_obj = site_engine.create_student_online_course()
+        else:
+            new_obj = site_engine.create_student_offline_course()
+        schema = {'student_id': student_id, 'course_id': course.id}
+        new_obj.mark_new(schema)
+        UnitOfWork.get_current().commit()
 
 
-@AppRoute('/api/')
+@AppRoute('/api/', cache_ttl=60, cache_tables=('online_course', 'offline_course'),
+          middleware_exclude=('secret_front', 'other_front'))
 class CourseApi:
-    @Debug()
+    """
+    Курсы в JSON: /api/?fields=id,name&limit=20&offset=40
+    Без limit - весь список. Список не длиннее API_CACHE_MAX_ROWS собирается
+    целиком и попадает в кэш маршрута (cache_ttl), длинный отдаётся потоком
+    без кэша, чтобы не держать всё тело в памяти
+    """
     def __call__(self, request):
-        mapper_online = MapperRegistry.get_current_mapper('online')
-        mapper_offline = MapperRegistry.get_current_mapper('offline')
-        all_course_list = mapper_online.all() + mapper_offline.all()
-        return '200 OK', BaseSerializer(all_course_list).save()
+        params = request['request_params']
+        try:
+            fields = [name for name in params.get('fields', '').split(',') if name]
+            serializer = CourseSerializer(fields)
+            limit = int(params['limit']) if 'limit' in params else None
+            offset = int(params.get('offset', 0))
+            if offset < 0 or (limit is not None and limit < 0):
+                raise ValueError('limit and offset must not be negative')
+        except ValueError as e:
+            return Response(str(e), '400 Bad Request', content_type='text/plain')
+        mapper_course = MapperRegistry.get_current_mapper('course')
+        if limit is None:
+            courses = mapper_course.iter_all(order_by=('-type', 'id'))
+            if not getattr(self, 'cache_ttl', None):
+                return StreamingResponse(serializer.stream(courses), content_type=serializer.content_type)
+            head = list(islice(courses, API_CACHE_MAX_ROWS + 1))
+            if len(head) > API_CACHE_MAX_ROWS:
+                # потоковый ответ в кэш не попадает
+                return StreamingResponse(serializer.stream(chain(head, courses)), content_type=serializer.content_type)
+            return Response(serializer.dumps(head), content_type=serializer.content_type)
+        page = mapper_course.filter(order_by=('-type', 'id'), limit=limit, offset=offset)
+        return Response(serializer.dumps(page), content_type=serializer.content_type)